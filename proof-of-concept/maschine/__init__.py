@@ -0,0 +1,35 @@
+"""Support code for the Native Instruments (TM) Maschine MK2 controller.
+
+The maschine package builds on the pyhidapi binding (the hidapi module),
+which must be installed, and on a hidapi library which has been loaded
+with hidapi.hid_init().
+
+Modules defined by this package:
+
+    aio       asyncio interface to a HID device (Python 3.7 or later)
+    bench     benchmarks of the read, decode, encode and write paths
+    buttons   decoding of the 0x10 button and encoder reports
+    calibration
+              per-pad calibration of the pad pressures, stored per controller
+    capture   compact binary capture and replay of input reports
+    devices   several controllers read from one poll loop
+    display   framebuffers with dirty stripe tracking for the two displays
+    frames    dithering and streaming of greyscale frames, dropping stale ones
+    hidraw    access to the hidraw file descriptor of a device handle
+    hotplug   cached enumeration with connect and disconnect callbacks
+    images    XBM and raw bitmap loading with an encoded packet cache
+    leds      LED state with coalesced, rate-limited updates
+    metrics   optional latency histograms and throughput counters
+    midi      translation of pad events into MIDI bytes and MIDI sinks
+    osc       batched OSC event streaming over UDP, and remote control
+    pads      vectorized decoding of the 0x20 pad pressure reports (NumPy)
+    reader    background report reader with a fixed-size ring buffer
+    render    bitmap text and widgets drawn from pre-packed glyph rows
+    scheduler prioritized output scheduling of LED and display reports
+    virtual   simulated controller standing in for the hidapi library
+"""
+
+__all__ = ['aio', 'bench', 'buttons', 'calibration', 'capture', 'devices',
+           'display', 'frames', 'hidraw', 'hotplug', 'images', 'leds',
+           'metrics', 'midi', 'osc', 'pads', 'reader', 'render', 'scheduler',
+           'virtual']
@@ -0,0 +1,151 @@
+"""asyncio interface to a HID device.
+
+An AsyncDevice lets a coroutine wait for input reports and send output
+reports without blocking the event loop. On Linux with the hidraw
+backend, the device handle is switched to non-blocking mode and the
+event loop watches the hidraw file descriptor, so a waiting read wakes
+up as soon as a report arrives, with no extra thread and no polling
+timer. On other platforms reads fall back to hid_read_timeout_into()
+in the loop's default executor. Writes are always made in the default
+executor, as a write blocks for the whole USB transfer.
+
+This module requires Python 3.7 or later.
+
+Public classes defined by this module:
+
+    AsyncDevice
+"""
+
+import asyncio
+
+import hidapi
+
+from .hidraw import device_fd
+
+
+class AsyncDevice(object):
+    """asyncio wrapper around a HID device handle.
+
+    Reports can be read one at a time with read_report(), or by
+    iterating:
+
+        async for report in dev:
+            ...
+
+    Only one coroutine should read from a device at a time."""
+
+    def __init__(self, device, report_size=256, timeout_ms=100, hid=hidapi):
+        """Constructor for class AsyncDevice.
+
+        Arguments:
+            device:      A device handle returned by hid_open().
+
+            report_size: Size of the read buffer in bytes.
+
+            timeout_ms:  Timeout of each executor read in milliseconds,
+                         when the device has no file descriptor to watch.
+
+            hid:         Module the device was opened with. Defaults to
+                         the hidapi module."""
+
+        self._device      = device
+        self._hid         = hid
+        self._report_size = report_size
+        self._timeout_ms  = timeout_ms
+        self._fd          = device_fd(device, hid)
+        self._loop        = None
+        if self._fd is not None:
+            hid.hid_set_nonblocking(device, True)
+
+    def fileno(self):
+        """Return the file descriptor watched for input, or None."""
+
+        return self._fd
+
+    async def read_into(self, buffer):
+        """Wait for an input report and read it into buffer.
+
+        Arguments:
+            buffer: A writable buffer, as for hid_read_into().
+
+        Returns:
+            Actual number of bytes read into buffer.
+            Raises RuntimeError exception if an error occurs."""
+
+        loop = asyncio.get_running_loop()
+        if self._fd is None:
+            while True:
+                num = await loop.run_in_executor(
+                    None, self._hid.hid_read_timeout_into,
+                    self._device, buffer, self._timeout_ms)
+                if num:
+                    return num
+
+        while True:
+            num = self._hid.hid_read_into(self._device, buffer)
+            if num:
+                return num
+            waiter = loop.create_future()
+            self._loop = loop
+            loop.add_reader(self._fd, self._wake, waiter)
+            try:
+                await waiter
+            finally:
+                loop.remove_reader(self._fd)
+
+    async def read_report(self):
+        """Wait for an input report.
+
+        Returns:
+            bytearray containing the report.
+            Raises RuntimeError exception if an error occurs."""
+
+        buf = bytearray(self._report_size)
+        num = await self.read_into(buf)
+        del buf[num:]
+        return buf
+
+    async def write(self, report):
+        """Write an Output report to the device.
+
+        The write is made in the loop's default executor, so the loop
+        keeps running during the USB transfer.
+
+        Arguments:
+            report: A bytearray (or any other buffer) containing the
+                    report, starting with the report ID.
+
+        Returns:
+            Actual number of bytes written.
+            Raises RuntimeError exception if an error occurs."""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._hid.hid_write,
+                                          self._device, report)
+
+    def close(self):
+        """Stop watching the device and restore blocking reads.
+
+        The device handle itself is left open.
+
+        Returns:
+            None"""
+
+        if self._fd is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(self._fd)
+            self._hid.hid_set_nonblocking(self._device, False)
+            self._fd = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.read_report()
+
+    @staticmethod
+    def _wake(waiter):
+        """Reader callback: resolve the pending read. For internal use only."""
+
+        if not waiter.done():
+            waiter.set_result(None)
@@ -0,0 +1,358 @@
+"""Benchmarks of the read, decode, encode and write paths.
+
+Every benchmark runs against a simulated controller (see the virtual
+module), so no hardware is needed and the numbers only measure this
+code and the interpreter. Run the whole suite with
+
+    python -m maschine.bench [-o results.json] [name ...]
+
+from a directory where the maschine package and the hidapi module can
+be imported. The results are printed (or written) as JSON, so they can
+be kept and compared between releases:
+
+    {"version": 1,
+     "environment": {"python": ..., "implementation": ..., ...},
+     "benchmarks": {name: {"unit": ..., "items_per_call": ...,
+                           "calls": ..., "usec_per_item": ...,
+                           "items_per_sec": ...}, ...}}
+
+usec_per_item is the best of the repeated measurements, which is the
+least disturbed by whatever else the machine was doing.
+
+Note that running the benchmarks installs a virtual library in the
+hidapi module with hidapi.hid_use_library().
+
+Public functions defined by this module:
+
+    main(argv=None)
+    run(names=None, repeat=5, min_time=0.2)
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import ctypes
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy
+
+import hidapi
+
+from .buttons import ButtonDecoder
+from .display import HEIGHT, ROW_BYTES, WIDTH, FrameBuffer
+from .frames import pack_frame
+from .images import _parse_xbm, encode_packets
+from .leds import BUTTON_LEDS, PAD_COUNT, LedManager
+from .pads import OnsetDetector, PadChangeDetector, decode_pads
+from .render import bar, knob, text
+from .virtual import VirtualLibrary, VirtualMaschine
+
+# Bumped whenever the meaning of the results changes.
+BENCH_VERSION = 1
+
+# Clock used for the measurements.
+_clock = getattr(time, 'perf_counter', time.time)
+
+_BATCH = 64                             # reports per decode batch
+
+
+class _FixedLibrary(VirtualLibrary):
+    """Virtual library which reads the same report over and over and
+    accepts every write unchecked, so that timing the hidapi wrappers
+    measures the wrappers and not the simulation. For internal use only."""
+
+    def __init__(self, report):
+        VirtualLibrary.__init__(self)
+        self._report = bytes(report)
+
+    def hid_read(self, device, data, length):
+        num = min(len(self._report), length)
+        ctypes.memmove(data, self._report, num)
+        return num
+
+    def hid_write(self, device, data, length):
+        return length
+
+
+def _open(library):
+    """Install library in the hidapi module and open its first device.
+    For internal use only."""
+
+    hidapi.hid_use_library(library, '<virtual>')
+    hidapi.hid_init()
+    return hidapi.hid_open(0x17cc, 0x1140)
+
+
+def _reports(count, **options):
+    """Return count input reports of a simulated controller. For internal use only."""
+
+    virtual = VirtualMaschine(realtime=False, seed=1, **options)
+    return [bytearray(virtual.next_report(None)) for _ in range(count)]
+
+
+def _xbm_text(data):
+    """Return the XBM source of a 256x64 display image. For internal use only."""
+
+    lsb = bytearray(int('{0:08b}'.format(n)[::-1], 2) for n in bytearray(data))
+    body = ',\n'.join(', '.join('0x%02x' % b for b in lsb[n:n + 12])
+                      for n in range(0, len(lsb), 12))
+    return ('#define bench_width %d\n#define bench_height %d\n'
+            'static unsigned char bench_bits[] = {\n%s };\n'
+            % (WIDTH, HEIGHT, body)).encode('ascii')
+
+
+def _image(seed):
+    """Return a random display image. For internal use only."""
+
+    rng = random.Random(seed)
+    return bytearray(rng.randint(0, 255) for _ in range(ROW_BYTES * HEIGHT))
+
+
+# Each benchmark function returns (function to time, items per call, unit).
+
+def _bench_hid_read():
+    device = _open(_FixedLibrary(_reports(1, pad_pattern='random')[0]))
+    return lambda: hidapi.hid_read(device, 256), 1, 'call'
+
+
+def _bench_hid_read_into():
+    device = _open(_FixedLibrary(_reports(1, pad_pattern='random')[0]))
+    buf    = bytearray(256)
+    return lambda: hidapi.hid_read_into(device, buf), 1, 'call'
+
+
+def _bench_hid_read_wrapped():
+    device = _open(_FixedLibrary(_reports(1, pad_pattern='random')[0]))
+    buf    = hidapi.hid_wrap_buffer(bytearray(256))
+    return lambda: hidapi.hid_read_into(device, buf), 1, 'call'
+
+
+def _bench_hid_write():
+    device = _open(_FixedLibrary(b''))
+    report = bytearray(49)
+    report[0] = 0x80
+    return lambda: hidapi.hid_write(device, report), 1, 'call'
+
+
+def _bench_hid_write_many():
+    device  = _open(_FixedLibrary(b''))
+    fb      = FrameBuffer(0)
+    reports = [fb.stripe_report(stripe) for stripe in range(8)]
+    return lambda: hidapi.hid_write_many(device, reports), len(reports), 'report'
+
+
+def _bench_decode_pads():
+    reports = _reports(_BATCH, pad_pattern='random')
+    out     = numpy.empty((_BATCH, PAD_COUNT), numpy.uint16)
+    return lambda: decode_pads(reports, out), _BATCH, 'report'
+
+
+def _bench_pad_events():
+    reports  = _reports(_BATCH, pad_pattern='random')
+    detector = PadChangeDetector()
+    return lambda: detector.process(reports), _BATCH, 'report'
+
+
+def _bench_pad_onsets():
+    pressures = decode_pads(_reports(_BATCH, pad_pattern='random'))
+    detector  = OnsetDetector()
+    def detect():
+        for row in pressures:
+            detector.update(row)
+    return detect, _BATCH, 'report'
+
+
+def _bench_decode_buttons():
+    reports = _reports(_BATCH, pad_rate=0, button_rate=1, button_pattern='cycle')
+    decoder = ButtonDecoder()
+    def decode():
+        for report in reports:
+            decoder.decode(report)
+    return decode, _BATCH, 'report'
+
+
+def _bench_image_encode():
+    text = _xbm_text(_image(1))
+    def encode():
+        width, height, data = _parse_xbm(text)
+        return encode_packets(0, data)
+    return encode, 1, 'image'
+
+
+def _bench_render_page():
+    framebuffer = FrameBuffer(0)
+    state       = [0]
+    def render():
+        state[0] = value = (state[0] + 1) & 0x7f
+        for n in range(8):
+            text(framebuffer, n * 4, 0, 'knob%d' % n, invert=n == value & 7)
+            knob(framebuffer, n * 4 + 1, 12, value, 127)
+            text(framebuffer, n * 4, 32, '%4d' % value)
+            bar(framebuffer, n * 4, 44, 4, value, 127)
+    return render, 1, 'page'
+
+
+def _bench_frame_pack():
+    rows  = numpy.arange(HEIGHT, dtype=numpy.uint8)[:, None]
+    frame = (rows * 4 + numpy.arange(WIDTH, dtype=numpy.uint8)).astype(numpy.uint8)
+    bits  = numpy.empty((HEIGHT, WIDTH), dtype=bool)
+    def pack():
+        return pack_frame(frame, 'dither', out=bits)
+    return pack, 1, 'frame'
+
+
+def _bench_led_reports():
+    leds  = LedManager()
+    state = [0]
+    def build():
+        state[0] = value = (state[0] + 1) & 0xff
+        for pad in range(PAD_COUNT):
+            leds.set_pad_rgb(pad, value, 0, 255 - value)
+        leds.set_led(BUTTON_LEDS[value % len(BUTTON_LEDS)], value)
+        return leds.dirty_reports()
+    return build, 1, 'update'
+
+
+def _bench_display_refresh():
+    device  = _open(VirtualLibrary([VirtualMaschine(pad_rate=0)]))
+    images  = [_image(1), _image(2)]
+    buffers = [FrameBuffer(0), FrameBuffer(1)]
+    state   = [0]
+    def refresh():
+        state[0] ^= 1
+        for n, fb in enumerate(buffers):
+            fb.load(images[n ^ state[0]])
+            fb.flush(device)
+    return refresh, 1, 'frame'
+
+
+BENCHMARKS = (
+    ('hid_read',          _bench_hid_read),
+    ('hid_read_into',     _bench_hid_read_into),
+    ('hid_read_wrapped',  _bench_hid_read_wrapped),
+    ('hid_write',         _bench_hid_write),
+    ('hid_write_many',    _bench_hid_write_many),
+    ('decode_pads',       _bench_decode_pads),
+    ('pad_events',        _bench_pad_events),
+    ('pad_onsets',        _bench_pad_onsets),
+    ('decode_buttons',    _bench_decode_buttons),
+    ('image_encode',      _bench_image_encode),
+    ('led_reports',       _bench_led_reports),
+    ('display_refresh',   _bench_display_refresh),
+    ('render_page',       _bench_render_page),
+    ('frame_pack',        _bench_frame_pack),
+)
+
+
+def _measure(function, repeat, min_time):
+    """Time function, calling it often enough for each measurement to
+    take at least min_time seconds. Returns (calls per measurement, best
+    time per call). For internal use only."""
+
+    calls = 1
+    while True:
+        start = _clock()
+        for _ in range(calls):
+            function()
+        elapsed = _clock() - start
+        if elapsed >= min_time:
+            break
+        calls *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = _clock()
+        for _ in range(calls):
+            function()
+        best = min(best, _clock() - start)
+    return calls, best / calls
+
+
+def _environment():
+    """Describe the interpreter and machine. For internal use only."""
+
+    return {'python':         platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform':       platform.platform(),
+            'machine':        platform.machine(),
+            'numpy':          numpy.__version__}
+
+
+def run(names=None, repeat=5, min_time=0.2):
+    """Run benchmarks.
+
+    Arguments:
+        names:    Names of the benchmarks to run, from BENCHMARKS, or
+                  None to run all of them.
+
+        repeat:   Number of measurements taken of each benchmark.
+
+        min_time: Minimum duration of a measurement in seconds.
+
+    Returns:
+        Dict of results, as described in the module documentation.
+        Raises KeyError exception if a name is not a known benchmark."""
+
+    known = dict(BENCHMARKS)
+    if names:
+        for name in names:
+            if name not in known:
+                raise KeyError('No benchmark named %r.' % (name,))
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and name not in names:
+            continue
+        function, items, unit = setup()
+        calls, per_call = _measure(function, repeat, min_time)
+        per_item = per_call / items
+        results[name] = {'unit':           unit,
+                         'items_per_call': items,
+                         'calls':          calls,
+                         'usec_per_item':  per_item * 1e6,
+                         'items_per_sec':  1.0 / per_item if per_item else None}
+    return {'version':     BENCH_VERSION,
+            'environment': _environment(),
+            'benchmarks':  results}
+
+
+def main(argv=None):
+    """Run the benchmarks named on the command line and print the results.
+
+    Arguments:
+        argv: Command line arguments, without the program name. Defaults
+              to sys.argv[1:].
+
+    Returns:
+        Exit status."""
+
+    parser = argparse.ArgumentParser(prog='python -m maschine.bench',
+                                     description='Benchmark the maschine hot paths.')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='benchmarks to run (default: all of %s)'
+                        % ', '.join(name for name, setup in BENCHMARKS))
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='measurements per benchmark (default: 5)')
+    parser.add_argument('-t', '--min-time', type=float, default=0.2,
+                        help='minimum seconds per measurement (default: 0.2)')
+    parser.add_argument('-o', '--output', help='write the JSON results to this file')
+    args = parser.parse_args(argv)
+
+    try:
+        results = run(args.names, args.repeat, args.min_time)
+    except KeyError as e:
+        parser.error(e.args[0])
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
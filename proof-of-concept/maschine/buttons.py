@@ -0,0 +1,373 @@
+"""Decoding of the button and encoder reports.
+
+The Maschine MK2 sends the state of its buttons and encoders in input
+reports with report ID 0x10, every time something changes. The buttons
+are a bitfield of one bit per button, and each encoder is an absolute
+position counter which wraps around.
+
+A ButtonDecoder compares each report with the previous one and turns
+the difference into events: a button going down or up, or an encoder
+moving by some number of steps. The names of the changed bits of each
+byte are looked up in tables built once by the constructor, so decoding
+a report takes a few integer operations per changed byte rather than a
+scan over all the buttons.
+
+The layout of the report is described by BUTTON_NAMES and ENCODERS;
+a decoder for a different layout can be made by passing other tables
+to the ButtonDecoder constructor.
+
+Turning an encoder fast makes a report, and an event, for every step.
+An EncoderAggregator sums the steps of each encoder over a window of
+time or a number of events into one event, scaled by an acceleration
+curve of the speed of turning, such as linear_acceleration().
+
+Public classes defined by this module:
+
+    ButtonDecoder
+    ButtonEvent
+    EncoderAggregator
+
+Public functions defined by this module:
+
+    linear_acceleration(threshold=30.0, maximum=8.0)
+"""
+
+from __future__ import division
+
+import collections
+import time
+
+BUTTON_REPORT_ID = 0x10
+
+# Button names in bit order: bit 0 of byte 1 first, None for unused bits.
+BUTTON_NAMES = (
+    'display1', 'display2', 'display3', 'display4',
+    'display5', 'display6', 'display7', 'display8',
+    'control', 'step', 'browse', 'sampling',
+    'browse_left', 'browse_right', 'all', 'auto_write',
+    'volume', 'swing', 'tempo', 'nav_left',
+    'nav_right', 'enter', 'note_repeat', 'main_encoder',
+    'group_a', 'group_b', 'group_c', 'group_d',
+    'group_e', 'group_f', 'group_g', 'group_h',
+    'restart', 'transport_left', 'transport_right', 'grid',
+    'play', 'rec', 'erase', 'shift',
+    'scene', 'pattern', 'pad_mode', 'navigate',
+    'duplicate', 'select', 'solo', 'mute',
+)
+BUTTON_OFFSET = 1                       # first byte of the bitfield
+
+# Encoders as (name, offset, size in bytes (1 or 2), modulus). The
+# position is read little-endian and taken modulo the modulus, where it
+# wraps.
+ENCODERS = (
+    ('main',  7, 1, 16),
+    ('knob1', 8, 2, 1000),
+    ('knob2', 10, 2, 1000),
+    ('knob3', 12, 2, 1000),
+    ('knob4', 14, 2, 1000),
+    ('knob5', 16, 2, 1000),
+    ('knob6', 18, 2, 1000),
+    ('knob7', 20, 2, 1000),
+    ('knob8', 22, 2, 1000),
+)
+
+# Monotonic clock, the same one as the reader's report timestamps.
+_now = getattr(time, 'monotonic', time.time)
+
+BUTTON_DOWN = 'down'
+BUTTON_UP   = 'up'
+ENCODER     = 'encoder'
+
+
+class ButtonEvent(collections.namedtuple('ButtonEvent', 'kind name value timestamp')):
+    """An event reported by ButtonDecoder.
+
+    Fields:
+        kind:      BUTTON_DOWN, BUTTON_UP or ENCODER.
+        name:      Name of the button or encoder.
+        value:     1 for BUTTON_DOWN, 0 for BUTTON_UP, and the signed
+                   number of steps moved for ENCODER.
+        timestamp: Timestamp of the report the event came from."""
+
+    __slots__ = ()
+
+
+class ButtonDecoder(object):
+    """Turns successive 0x10 reports into button and encoder events."""
+
+    def __init__(self, names=BUTTON_NAMES, encoders=ENCODERS,
+                 offset=BUTTON_OFFSET):
+        """Constructor for class ButtonDecoder.
+
+        Arguments:
+            names:    Button names in bit order, None for unused bits.
+
+            encoders: Sequence of (name, offset, size, modulus) tuples
+                      describing the encoders.
+
+            offset:   Offset of the first byte of the button bitfield.
+
+        The first report decoded reports every button already held down,
+        and sets the starting position of the encoders."""
+
+        self._offset   = offset
+        self._size     = (len(names) + 7) // 8
+        self._encoders = tuple(encoders)
+        self._last     = None
+
+        # For each byte of the bitfield and each possible XOR of two
+        # values of it, the (mask, name) pairs of the bits that changed.
+        self._tables = []
+        for byte in range(self._size):
+            bits  = [(1 << bit, names[byte * 8 + bit])
+                     for bit in range(8)
+                     if byte * 8 + bit < len(names)
+                     and names[byte * 8 + bit] is not None]
+            table = tuple(tuple((mask, name) for mask, name in bits
+                                if changed & mask)
+                          for changed in range(256))
+            self._tables.append(table)
+
+        end = offset + self._size
+        for name, enc_offset, size, modulus in self._encoders:
+            end = max(end, enc_offset + size)
+        self._length = end
+
+    def reset(self):
+        """Forget the previous report.
+
+        Returns:
+            None"""
+
+        self._last = None
+
+    def decode(self, report, timestamp=None):
+        """Compare a 0x10 report with the previous one.
+
+        Arguments:
+            report:    bytearray (or other buffer of ints) holding the
+                       report, starting with the report ID.
+
+            timestamp: Timestamp to put in the events.
+
+        Returns:
+            List of ButtonEvent: button transitions in bit order, then
+            encoder movements. Empty if nothing changed.
+            Raises ValueError exception if report is not a button report."""
+
+        if len(report) < self._length or report[0] != BUTTON_REPORT_ID:
+            raise ValueError('Not a button report.')
+
+        last   = self._last
+        events = []
+        if last is None:
+            last = self._last = bytearray(len(report))
+            first = True
+        else:
+            if last == report:
+                return events
+            first = False
+
+        offset = self._offset
+        for byte, table in enumerate(self._tables):
+            new     = report[offset + byte]
+            changed = new ^ last[offset + byte]
+            if changed:
+                for mask, name in table[changed]:
+                    if new & mask:
+                        events.append(ButtonEvent(BUTTON_DOWN, name, 1, timestamp))
+                    else:
+                        events.append(ButtonEvent(BUTTON_UP, name, 0, timestamp))
+
+        if not first:
+            for name, enc_offset, size, modulus in self._encoders:
+                if size == 1:
+                    new = report[enc_offset]
+                    old = last[enc_offset]
+                else:
+                    new = report[enc_offset] | (report[enc_offset + 1] << 8)
+                    old = last[enc_offset] | (last[enc_offset + 1] << 8)
+                new %= modulus
+                old %= modulus
+                if new != old:
+                    delta = (new - old) % modulus
+                    if delta > modulus // 2:
+                        delta -= modulus
+                    if delta:
+                        events.append(ButtonEvent(ENCODER, name, delta, timestamp))
+
+        if len(last) != len(report):
+            self._last = bytearray(report)
+        else:
+            last[:] = report
+        return events
+
+
+def linear_acceleration(threshold=30.0, maximum=8.0):
+    """Return an acceleration curve for EncoderAggregator.
+
+    Below threshold steps per second, steps count once; above it, they
+    count speed / threshold times, up to maximum times.
+
+    Arguments:
+        threshold: Speed in steps per second where acceleration starts.
+
+        maximum:   Largest multiplier.
+
+    Returns:
+        Function mapping a speed in steps per second to a multiplier."""
+
+    return lambda speed: min(max(speed / threshold, 1.0), maximum)
+
+
+class EncoderAggregator(object):
+    """Sums the encoder events of each encoder over a window.
+
+    The steps of an encoder are summed from its first event on, until
+    window seconds have passed or count events were summed, and then
+    reported as one ENCODER event, with the timestamp of its last event.
+    The sum is multiplied by the acceleration curve of the speed of
+    turning over the window; the fraction left over after rounding is
+    carried into the next window of the encoder, so no step is lost to
+    rounding, and every event belongs to exactly one window: one which
+    arrives after its encoder's window expired starts the next one.
+    A window also ends once the encoder was idle for idle seconds, so
+    steps short of count are not held back when the turning stops.
+
+    Button events are passed through as they come."""
+
+    def __init__(self, window=0.02, count=None, acceleration=None, idle=0.1):
+        """Constructor for class EncoderAggregator.
+
+        Arguments:
+            window:       Longest time in seconds the steps of an encoder
+                          are summed, or None to only use count.
+
+            count:        Largest number of events summed into one, or
+                          None to only use window.
+
+            acceleration: Function mapping the speed of turning in steps
+                          per second to a multiplier of the steps, such
+                          as one returned by linear_acceleration(), or
+                          None for no acceleration.
+
+            idle:         Time in seconds after the last event of an
+                          encoder at which its window ends, or None."""
+
+        if window is None and count is None:
+            raise ValueError('A window or a count is needed.')
+        self.window       = window
+        self.count        = count
+        self.acceleration = acceleration
+        self.idle         = idle
+        self._pending     = {}              # name: [start, last, steps, events]
+        self._carry       = {}              # name: fraction carried over
+        self._order       = []              # names with pending steps
+
+    def _deadline(self, pending):
+        """Return the time the window of an encoder ends, or None. For
+        internal use only."""
+
+        ends = []
+        if self.window is not None:
+            ends.append(pending[0] + self.window)
+        if self.idle is not None:
+            ends.append(pending[1] + self.idle)
+        return min(ends) if ends else None
+
+    def _emit(self, name, events):
+        """Report the pending steps of an encoder. For internal use only."""
+
+        start, last, steps, count = self._pending.pop(name)
+        self._order.remove(name)
+        if self.acceleration is not None:
+            elapsed = max(last - start, self.window or 0.001)
+            value   = steps * self.acceleration(abs(steps) / elapsed)
+        else:
+            value   = steps
+        value += self._carry.get(name, 0.0)
+        delta  = int(round(value))
+        self._carry[name] = value - delta
+        if delta:
+            events.append(ButtonEvent(ENCODER, name, delta, last))
+
+    def process(self, events, now=None):
+        """Sum the encoder events, and report the windows which ended.
+
+        Arguments:
+            events: Iterable of ButtonEvent, such as returned by
+                    ButtonDecoder.decode().
+
+            now:    Current time, from the same clock as the reader's
+                    report timestamps, if the caller already has it;
+                    also used for events without a timestamp.
+
+        Returns:
+            List of ButtonEvent: the button events, and an ENCODER event
+            for each window which ended."""
+
+        if now is None:
+            now = _now()
+        out = []
+        for event in events:
+            if event.kind != ENCODER:
+                out.append(event)
+                continue
+            name      = event.name
+            timestamp = event.timestamp if event.timestamp is not None else now
+            pending   = self._pending.get(name)
+            if pending is not None:
+                end = self._deadline(pending)
+                if end is not None and timestamp >= end:
+                    self._emit(name, out)
+                    pending = None
+            if pending is None:
+                pending = self._pending[name] = [timestamp, timestamp, 0, 0]
+                self._order.append(name)
+            pending[1]  = timestamp
+            pending[2] += event.value
+            pending[3] += 1
+            if self.count is not None and pending[3] >= self.count:
+                self._emit(name, out)
+        out.extend(self.poll(now))
+        return out
+
+    def timeout(self, now=None):
+        """Return the time in seconds until a window ends, for use as a
+        timeout of the caller's wait, or None if no steps are pending or
+        there is neither a window nor an idle time."""
+
+        if not self._order or (self.window is None and self.idle is None):
+            return None
+        end = min(self._deadline(self._pending[name]) for name in self._order)
+        return max(end - (_now() if now is None else now), 0.0)
+
+    def poll(self, now=None):
+        """Report the windows which ended.
+
+        Call this from the program's main loop, at least as often as
+        timeout() says.
+
+        Returns:
+            List of ENCODER ButtonEvent."""
+
+        out = []
+        if not self._order or (self.window is None and self.idle is None):
+            return out
+        if now is None:
+            now = _now()
+        for name in list(self._order):
+            if now >= self._deadline(self._pending[name]):
+                self._emit(name, out)
+        return out
+
+    def flush(self):
+        """Report the pending steps of every encoder now.
+
+        Returns:
+            List of ENCODER ButtonEvent."""
+
+        out = []
+        for name in list(self._order):
+            self._emit(name, out)
+        return out
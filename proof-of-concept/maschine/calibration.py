@@ -0,0 +1,389 @@
+"""Per-pad calibration of the pad pressures.
+
+The pads of different controllers differ: some do not read exactly 0
+when idle, and some never reach 4095 however hard they are hit. A
+PadCalibration maps the raw 12-bit pressure of each pad to a calibrated
+one: the pad's idle floor is subtracted, the rest is scaled so the
+pad's maximum becomes scale, and a response curve (as in
+midi.velocity_curve()) is applied. All of that is computed once into a
+table of 16 x 4096 values, so calibrating a report, or a whole batch of
+them, is one NumPy take() from the table for all the pads at once.
+
+A PadCalibrator learns the floors and maxima from decoded pressures:
+samples taken with the pads untouched give the floors, samples of each
+pad hit as hard as it will be played give the maxima. learn_capture()
+does that from a capture file (see capture.Recorder) which starts with
+the pads untouched for a moment.
+
+Calibrations are stored as profiles, one JSON file per controller named
+after its serial number (as returned by hid_get_serial_number_string()),
+in the directory named by the MASCHINE_CALIBRATION_DIR environment
+variable, or by default in open-maschine/calibration under
+$XDG_CONFIG_HOME (~/.config). To learn and store a profile:
+
+    python -m maschine.calibration session.cap 00001234
+
+This module requires NumPy.
+
+Public classes defined by this module:
+
+    PadCalibration
+    PadCalibrator
+
+Public functions defined by this module:
+
+    learn_capture(path, idle=1.0, device=None, margin=16)
+    load_profile(serial_number, directory=None)
+    save_profile(serial_number, calibration, directory=None)
+"""
+
+from __future__ import absolute_import, division
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import numpy
+
+from .capture import Replayer
+from .midi import CURVES
+from .pads import PAD_COUNT, PAD_REPORT_ID, decode_pads
+
+# Bumped whenever the format of the stored profiles changes.
+PROFILE_VERSION = 1
+
+_PRESSURES = 4096                       # 12-bit pad pressures
+
+
+class PadCalibration(object):
+    """Maps raw pad pressures to calibrated ones with a lookup table.
+
+    Attributes:
+        floor:   int32 array of the 16 idle floors; pressures up to the
+                 floor of a pad calibrate to 0.
+        maximum: int32 array of the 16 pressures which calibrate to scale.
+        curve:   Name from midi.CURVES, an exponent, or a function.
+        scale:   Largest calibrated pressure.
+        table:   uint16 array of shape (16, 4096), the calibrated pressure
+                 of every raw pressure of every pad."""
+
+    def __init__(self, floor=0, maximum=_PRESSURES - 1, curve='linear',
+                 scale=_PRESSURES - 1):
+        """Constructor for class PadCalibration.
+
+        Arguments:
+            floor:   Idle floor, a single value or a sequence of 16, one
+                     per pad.
+
+            maximum: Pressure reached by a full hit, a single value or a
+                     sequence of 16.
+
+            curve:   Name from midi.CURVES, an exponent (below 1 makes
+                     soft hits louder, above 1 quieter), or a function
+                     mapping an array of 0.0-1.0 to 0.0-1.0.
+
+            scale:   Largest calibrated pressure, at most 65535. The
+                     default keeps the 12-bit range, so the calibrated
+                     pressures can go wherever raw ones do."""
+
+        self.floor   = numpy.zeros(PAD_COUNT, dtype=numpy.int32) + floor
+        self.maximum = numpy.zeros(PAD_COUNT, dtype=numpy.int32) + maximum
+        self.curve   = curve
+        self.scale   = scale
+
+        shape = CURVES.get(curve, curve)
+        if not callable(shape):
+            exponent = float(shape)
+            shape    = lambda x: x ** exponent
+        span  = numpy.maximum(self.maximum - self.floor, 1)[:, None]
+        x     = (numpy.arange(_PRESSURES)[None, :] - self.floor[:, None]) / span
+        x     = numpy.clip(x, 0.0, 1.0)
+        self.table = numpy.rint(numpy.clip(shape(x), 0.0, 1.0) * scale).astype(numpy.uint16)
+
+        self._flat    = self.table.ravel()
+        self._offsets = numpy.arange(PAD_COUNT, dtype=numpy.intp) * _PRESSURES
+
+    def apply(self, pressures, out=None):
+        """Calibrate pad pressures.
+
+        Arguments:
+            pressures: uint16 array of shape (16,) or (N, 16) of raw
+                       pressures, as returned by decode_pads().
+
+            out:       Optional uint16 array of the same shape to store
+                       the result in.
+
+        Returns:
+            uint16 NumPy array of the calibrated pressures."""
+
+        return self._flat.take(self._offsets + pressures, out=out)
+
+    def profile(self):
+        """Return the calibration as a dict which can be stored as JSON.
+
+        Returns:
+            Dict with the keys 'version', 'floor', 'maximum', 'curve' and
+            'scale'.
+            Raises ValueError exception if the curve is a function."""
+
+        if callable(self.curve):
+            raise ValueError('A calibration with a curve function cannot be stored.')
+        return {'version': PROFILE_VERSION,
+                'floor':   [int(value) for value in self.floor],
+                'maximum': [int(value) for value in self.maximum],
+                'curve':   self.curve,
+                'scale':   self.scale}
+
+    @classmethod
+    def from_profile(cls, profile):
+        """Return the calibration of a dict returned by profile().
+
+        Raises ValueError exception if the profile is of another version."""
+
+        if profile.get('version') != PROFILE_VERSION:
+            raise ValueError('Unsupported calibration profile version.')
+        return cls(profile['floor'], profile['maximum'], profile['curve'],
+                   profile['scale'])
+
+
+class PadCalibrator(object):
+    """Learns the idle floor and maximum of each pad.
+
+    Attributes:
+        margin:       Added to the highest idle pressure of each pad to
+                      give its floor, so ADC noise stays below it.
+        idle_samples: Number of idle samples added.
+        hit_samples:  Number of other samples added."""
+
+    def __init__(self, margin=16):
+        """Constructor for class PadCalibrator.
+
+        Arguments:
+            margin: Added to the highest idle pressure of each pad to
+                    give its floor."""
+
+        self.margin       = margin
+        self.idle_samples = 0
+        self.hit_samples  = 0
+        self._idle = numpy.zeros(PAD_COUNT, dtype=numpy.int32)
+        self._peak = numpy.zeros(PAD_COUNT, dtype=numpy.int32)
+
+    def add(self, pressures, idle=False):
+        """Add samples.
+
+        Arguments:
+            pressures: Array of shape (16,) or (N, 16) of raw pressures.
+
+            idle:      True if the pads were untouched.
+
+        Returns:
+            None"""
+
+        pressures = numpy.asarray(pressures).reshape(-1, PAD_COUNT)
+        if not len(pressures):
+            return
+        if idle:
+            numpy.maximum(self._idle, pressures.max(axis=0), out=self._idle)
+            self.idle_samples += len(pressures)
+        else:
+            numpy.maximum(self._peak, pressures.max(axis=0), out=self._peak)
+            self.hit_samples += len(pressures)
+
+    def calibration(self, curve='linear', scale=_PRESSURES - 1):
+        """Return the calibration learned so far.
+
+        Pads which were never hit harder than their floor keep the full
+        range, up to 4095.
+
+        Arguments:
+            curve: Response curve, as for PadCalibration.
+
+            scale: Largest calibrated pressure.
+
+        Returns:
+            A PadCalibration."""
+
+        floor   = numpy.minimum(self._idle + self.margin, _PRESSURES - 2)
+        maximum = numpy.where(self._peak > floor, self._peak, _PRESSURES - 1)
+        return PadCalibration(floor, maximum, curve, scale)
+
+
+def learn_capture(path, idle=1.0, device=None, margin=16):
+    """Learn a calibration from a capture file.
+
+    The pads must be untouched for the first idle seconds of the capture,
+    and each pad hit as hard as it will be played afterwards.
+
+    Arguments:
+        path:   Path name of the capture file.
+
+        idle:   Seconds from the start of the capture during which the
+                pads were untouched.
+
+        device: Only use the reports of the device with this tag, or
+                None for all of them.
+
+        margin: Added to the highest idle pressure of each pad to give
+                its floor.
+
+    Returns:
+        A PadCalibrator holding the samples of the capture; call its
+        calibration() method for the PadCalibration.
+        Raises ValueError exception if the capture holds no pad reports."""
+
+    calibrator = PadCalibrator(margin)
+    replayer   = Replayer(path)
+    records    = replayer.records()
+    report     = None
+    try:
+        idle_reports = []
+        hit_reports  = []
+        start = None
+        for timestamp, tag, report in records:
+            if device is not None and tag != device:
+                continue
+            if len(report) == 0 or bytearray(report[:1])[0] != PAD_REPORT_ID:
+                continue
+            if start is None:
+                start = timestamp
+            if timestamp - start < idle * 1e9:
+                idle_reports.append(bytes(report))
+            else:
+                hit_reports.append(bytes(report))
+    finally:
+        # The reports are views of the mapped file, which cannot be
+        # closed while they exist.
+        records.close()
+        del report
+        replayer.close()
+    if not idle_reports and not hit_reports:
+        raise ValueError('No pad reports in the capture.')
+    if idle_reports:
+        calibrator.add(decode_pads(idle_reports), idle=True)
+    if hit_reports:
+        calibrator.add(decode_pads(hit_reports))
+    return calibrator
+
+
+def _profile_dir():
+    """Return the default profile directory. For internal use only."""
+
+    path = os.environ.get('MASCHINE_CALIBRATION_DIR')
+    if not path:
+        base = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+        path = os.path.join(base, 'open-maschine', 'calibration')
+    return path
+
+
+def _profile_path(serial_number, directory):
+    """Return the path name of the profile of a controller. For internal
+    use only."""
+
+    if directory is None:
+        directory = _profile_dir()
+    name = re.sub(r'[^0-9A-Za-z_.-]', '_', serial_number) or '_'
+    return os.path.join(directory, name + '.json')
+
+
+def load_profile(serial_number, directory=None):
+    """Load the stored calibration of a controller.
+
+    Arguments:
+        serial_number: Serial number string of the controller.
+
+        directory:     Directory holding the profiles. Defaults to
+                       MASCHINE_CALIBRATION_DIR, or open-maschine/calibration
+                       under the user configuration directory.
+
+    Returns:
+        A PadCalibration, or None if no profile is stored for the
+        controller.
+        Raises ValueError exception if the profile is not valid."""
+
+    try:
+        with open(_profile_path(serial_number, directory)) as f:
+            profile = json.load(f)
+    except (IOError, OSError):
+        return None
+    try:
+        return PadCalibration.from_profile(profile)
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError('Invalid calibration profile: %s' % e)
+
+
+def save_profile(serial_number, calibration, directory=None):
+    """Store the calibration of a controller, replacing any earlier one.
+
+    Arguments:
+        serial_number: Serial number string of the controller.
+
+        calibration:   A PadCalibration.
+
+        directory:     Directory holding the profiles, as for
+                       load_profile().
+
+    Returns:
+        Path name of the profile file."""
+
+    path    = _profile_path(serial_number, directory)
+    profile = calibration.profile()
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(profile, f, sort_keys=True)
+        f.write('\n')
+    os.rename(tmp_path, path)
+    return path
+
+
+def main(argv=None):
+    """Learn a calibration from a capture file and store it.
+
+    Arguments:
+        argv: Command line arguments, without the program name. Defaults
+              to sys.argv[1:].
+
+    Returns:
+        Exit status."""
+
+    parser = argparse.ArgumentParser(prog='python -m maschine.calibration',
+                                     description='Learn the pad calibration of a '
+                                     'controller from a capture file.')
+    parser.add_argument('capture', help='capture file, starting with the pads untouched')
+    parser.add_argument('serial_number', help='serial number of the controller')
+    parser.add_argument('-i', '--idle', type=float, default=1.0,
+                        help='seconds the pads are untouched at the start (default: 1)')
+    parser.add_argument('-d', '--device', type=int,
+                        help='tag of the device in the capture (default: all)')
+    parser.add_argument('-m', '--margin', type=int, default=16,
+                        help='added to the idle pressures (default: 16)')
+    parser.add_argument('-c', '--curve', default='linear',
+                        help='response curve: %s or an exponent (default: linear)'
+                        % ', '.join(sorted(CURVES)))
+    parser.add_argument('-o', '--directory', help='profile directory')
+    args = parser.parse_args(argv)
+
+    curve = args.curve
+    if curve not in CURVES:
+        try:
+            curve = float(curve)
+        except ValueError:
+            parser.error('unknown curve %r' % curve)
+    try:
+        calibrator = learn_capture(args.capture, args.idle, args.device, args.margin)
+    except ValueError as e:
+        parser.error(str(e))
+    calibration = calibrator.calibration(curve)
+    path = save_profile(args.serial_number, calibration, args.directory)
+    print('%d idle and %d other samples' % (calibrator.idle_samples, calibrator.hit_samples))
+    print('floor:   %s' % ' '.join('%4d' % value for value in calibration.floor))
+    print('maximum: %s' % ' '.join('%4d' % value for value in calibration.maximum))
+    print('saved to %s' % path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""Compact binary capture and replay of input reports.
+
+A capture file starts with a 16 byte file header:
+
+    magic    8 bytes  b'MASCHCAP'
+    version  uint16   CAPTURE_VERSION
+    rechdr   uint16   size of a record header (12)
+    reserved uint32
+
+followed by one record per report, each a fixed-size record header and
+the report data:
+
+    timestamp uint64  monotonic time the report arrived, in nanoseconds
+    length    uint16  number of report bytes which follow
+    device    uint16  tag of the device the report came from
+
+All fields are little-endian. A Recorder appends records to a file. A
+Replayer memory-maps a file and hands the reports back through the same
+read functions as the hidapi module (hid_read(), hid_read_timeout(),
+hid_read_into() and hid_read_timeout_into()), at the original speed, at
+a multiple of it, or as fast as possible, so a captured session can be
+fed to the rest of the code with no controller attached.
+
+A program which dies while recording leaves the records still in the
+write buffer unwritten, and possibly the last one cut short. A Replayer
+ends at the last complete record, and treats an empty file as an empty
+capture.
+
+Public classes defined by this module:
+
+    Recorder
+    Replayer
+
+Public functions defined by this module:
+
+    monotonic_ns()
+"""
+
+from __future__ import absolute_import, division
+
+import io
+import mmap
+import os
+import struct
+import threading
+import time
+
+CAPTURE_MAGIC   = b'MASCHCAP'
+CAPTURE_VERSION = 1
+
+_FILE_HEADER   = struct.Struct('<8sHHI')
+_RECORD_HEADER = struct.Struct('<QHH')
+
+# Monotonic clock used to pace playback, where available.
+_now = getattr(time, 'monotonic', time.time)
+
+if hasattr(time, 'monotonic_ns'):
+    monotonic_ns = time.monotonic_ns
+else:
+    def monotonic_ns():
+        """Return the current monotonic time in nanoseconds."""
+
+        return int(_now() * 1000000000)
+
+
+class Recorder(object):
+    """Appends timestamped reports to a capture file.
+
+    Attributes:
+        records: Number of reports recorded."""
+
+    def __init__(self, path, buffering=65536):
+        """Constructor for class Recorder.
+
+        A new file is created with a file header; an existing capture
+        file is appended to.
+
+        Arguments:
+            path:      Path name of the capture file.
+
+            buffering: Size of the write buffer in bytes."""
+
+        self.records = 0
+        self._file   = io.open(path, 'ab', buffering)
+        self._lock   = threading.Lock()
+        if self._file.tell() == 0:
+            self._file.write(_FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION,
+                                               _RECORD_HEADER.size, 0))
+            self._file.flush()
+
+    def record(self, report, length=None, timestamp_ns=None, device=0):
+        """Append a report to the capture.
+
+        Arguments:
+            report:       A bytearray (or any other buffer) holding the
+                          report.
+
+            length:       Number of bytes of report to record. Defaults to
+                          the whole of report.
+
+            timestamp_ns: Monotonic arrival time in nanoseconds. Defaults
+                          to now.
+
+            device:       Tag of the device the report came from.
+
+        Returns:
+            None"""
+
+        if length is None:
+            length = len(report)
+        if timestamp_ns is None:
+            timestamp_ns = monotonic_ns()
+        with self._lock:
+            self._file.write(_RECORD_HEADER.pack(timestamp_ns, length, device))
+            self._file.write(memoryview(report)[:length])
+            self.records += 1
+
+    def flush(self):
+        """Write buffered records to the file.
+
+        Returns:
+            None"""
+
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        """Flush and close the capture file.
+
+        Returns:
+            None"""
+
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Replayer(object):
+    """Plays back a capture file through the hidapi read functions.
+
+    An instance can be passed wherever a module providing the hidapi
+    read functions is expected, eg: as the hid argument of
+    reader.ReportReader. The device arguments of the read functions are
+    ignored.
+
+    Once every report has been read, the read functions raise EOFError.
+
+    Attributes:
+        speed:    Playback speed as a multiple of the original, or None
+                  to play back as fast as possible.
+        position: Number of reports read so far."""
+
+    def __init__(self, path, speed=1.0, device=None):
+        """Constructor for class Replayer.
+
+        Arguments:
+            path:   Path name of the capture file.
+
+            speed:  Playback speed as a multiple of the original, or None
+                    to play back as fast as possible.
+
+            device: Only play back the reports of the device with this
+                    tag, or None to play back all of them."""
+
+        self.speed    = speed
+        self.position = 0
+        self._device  = device
+        self._nonblocking = False
+
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # mmap cannot map an empty file
+                self._map = b''
+            else:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map:
+            if len(self._map) < _FILE_HEADER.size:
+                magic, version, rechdr = None, None, None
+            else:
+                magic, version, rechdr, _ = _FILE_HEADER.unpack_from(self._map, 0)
+            if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+                self._map.close()
+                raise ValueError('Not a capture file, or unsupported version.')
+        else:
+            rechdr = _RECORD_HEADER.size
+        self._rechdr = rechdr
+        self._offset = _FILE_HEADER.size
+        self._start  = None                 # (capture time, wall time)
+
+    def records(self):
+        """Iterate over the records of the whole capture.
+
+        The reports are memoryviews of the mapped file, valid for as long
+        as the replayer is open; release them before calling close().
+        Iterating does not affect playback.
+
+        Returns:
+            Iterator of (timestamp_ns, device, report) tuples."""
+
+        try:
+            view = memoryview(self._map)
+        except TypeError:
+            view = self._map                # Python 2: slices are copies
+        offset = _FILE_HEADER.size
+        size   = len(self._map)
+        while offset + self._rechdr <= size:
+            timestamp, length, device = _RECORD_HEADER.unpack_from(self._map, offset)
+            start = offset + self._rechdr
+            if start + length > size:
+                return                      # record cut short
+            yield timestamp, device, view[start:start + length]
+            offset = start + length
+
+    def _peek(self):
+        """Return the next record to play as (timestamp, start, length,
+        next offset), or None at the end. For internal use only."""
+
+        size = len(self._map)
+        while self._offset + self._rechdr <= size:
+            timestamp, length, device = _RECORD_HEADER.unpack_from(self._map, self._offset)
+            start = self._offset + self._rechdr
+            if start + length > size:
+                break                       # record cut short
+            if self._device is None or device == self._device:
+                return timestamp, start, length, start + length
+            self._offset = start + length
+        return None
+
+    def _read(self, buffer, milliseconds):
+        """Copy the next report into buffer once it is due.
+
+        milliseconds is the longest time to wait, or -1 to wait until the
+        report is due. Returns the number of bytes copied, 0 if the report
+        was not due in time. For internal use only."""
+
+        record = self._peek()
+        if record is None:
+            raise EOFError('End of capture.')
+        timestamp, start, length, end = record
+
+        if self.speed:
+            now = _now()
+            if self._start is None:
+                self._start = (timestamp, now)
+            due  = self._start[1] + (timestamp - self._start[0]) / 1e9 / self.speed
+            wait = due - now
+            if wait > 0:
+                if milliseconds >= 0 and wait > milliseconds / 1000:
+                    time.sleep(milliseconds / 1000)
+                    return 0
+                time.sleep(wait)
+
+        length = min(length, len(buffer))
+        buffer[:length] = self._map[start:start + length]
+        self._offset   = end
+        self.position += 1
+        return length
+
+    def hid_set_nonblocking(self, device, nonblock):
+        """Set non-blocking mode, as hidapi.hid_set_nonblocking()."""
+
+        self._nonblocking = bool(nonblock)
+
+    def hid_read_into(self, device, buffer):
+        """Read the next report into buffer, as hidapi.hid_read_into()."""
+
+        return self._read(buffer, 0 if self._nonblocking else -1)
+
+    def hid_read_timeout_into(self, device, buffer, milliseconds):
+        """Read the next report into buffer, as hidapi.hid_read_timeout_into()."""
+
+        return self._read(buffer, milliseconds)
+
+    def hid_read(self, device, length):
+        """Read the next report, as hidapi.hid_read()."""
+
+        buf = bytearray(length)
+        del buf[self.hid_read_into(device, buf):]
+        return buf
+
+    def hid_read_timeout(self, device, length, milliseconds):
+        """Read the next report, as hidapi.hid_read_timeout()."""
+
+        buf = bytearray(length)
+        del buf[self._read(buf, milliseconds):]
+        return buf
+
+    def rewind(self):
+        """Start playing back from the first report again.
+
+        Returns:
+            None"""
+
+        self._offset  = _FILE_HEADER.size
+        self._start   = None
+        self.position = 0
+
+    def close(self):
+        """Unmap the capture file.
+
+        Returns:
+            None"""
+
+        if self._map:
+            self._map.close()
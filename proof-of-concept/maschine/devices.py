@@ -0,0 +1,298 @@
+"""Serving several controllers from one poll loop.
+
+A DeviceManager opens every controller returned by hid_enumerate(), by
+path, and reads from all of them on the caller's thread: it waits for
+any of their hidraw file descriptors to become readable with epoll (or
+poll() where epoll is not available), then fetches the waiting reports
+of the ready devices with non-blocking reads. Each report is returned
+with the Device it came from, so a rig of N controllers costs one
+thread and one wake-up per batch of reports, not N threads.
+
+Handles whose backend has no file descriptor (see hidraw.device_fd())
+cannot be waited on; they are read without blocking each time the loop
+wakes up, and the wait is cut to at most fallback_interval so they are
+still served regularly.
+
+Public classes defined by this module:
+
+    Device
+    DeviceManager
+"""
+
+from __future__ import absolute_import, division
+
+import errno
+import select
+import time
+
+import hidapi
+
+from .hidraw import device_fd
+
+# Monotonic clock, the same one as the reader's report timestamps.
+_now = getattr(time, 'monotonic', time.time)
+
+
+class Device(object):
+    """An open controller.
+
+    Attributes:
+        tag:           Small integer identifying the device; the order in
+                       which the devices were opened.
+        path:          Path name the device was opened with.
+        serial_number: Serial number string from hid_enumerate().
+        handle:        Device handle, as returned by hid_open_path().
+        fd:            File descriptor waited on, or None.
+        error:         The exception which made the manager close the
+                       device, or None."""
+
+    __slots__ = ('tag', 'path', 'serial_number', 'handle', 'fd', 'error')
+
+    def __init__(self, tag, path, serial_number, handle, fd):
+        self.tag           = tag
+        self.path          = path
+        self.serial_number = serial_number
+        self.handle        = handle
+        self.fd            = fd
+        self.error         = None
+
+    def __repr__(self):
+        return 'Device(%d, %r)' % (self.tag, self.path)
+
+
+class _Poller(object):
+    """epoll, or poll() where it is not available. For internal use only."""
+
+    def __init__(self):
+        if hasattr(select, 'epoll'):
+            self._poll    = select.epoll()
+            self._scale   = 1.0
+            self._forever = -1
+            self._events  = select.EPOLLIN
+        else:
+            self._poll    = select.poll()
+            self._scale   = 1000.0
+            self._forever = None
+            self._events  = select.POLLIN
+
+    def register(self, fd):
+        self._poll.register(fd, self._events)
+
+    def unregister(self, fd):
+        self._poll.unregister(fd)
+
+    def poll(self, timeout):
+        if timeout is None:
+            timeout = self._forever
+        else:
+            timeout = timeout * self._scale
+        try:
+            return [fd for fd, event in self._poll.poll(timeout)]
+        except (IOError, OSError, select.error) as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+
+    def close(self):
+        if hasattr(self._poll, 'close'):
+            self._poll.close()
+
+
+class DeviceManager(object):
+    """Opens all matching controllers and reads them from one loop.
+
+    Attributes:
+        devices:           List of the open Device instances.
+        fallback_interval: Longest wait in seconds while a device without
+                           a file descriptor is open."""
+
+    def __init__(self, vendor_id=0x17cc, product_id=0x1140, report_size=256,
+                 fallback_interval=0.002, hid=hidapi):
+        """Constructor for class DeviceManager.
+
+        Arguments:
+            vendor_id:         Vendor ID of the devices to open.
+
+            product_id:        Product ID of the devices to open.
+
+            report_size:       Size of the read buffer in bytes.
+
+            fallback_interval: Longest wait in seconds while a device
+                               without a file descriptor is open.
+
+            hid:               Module used to open and read the devices.
+                               Defaults to the hidapi module."""
+
+        self.devices           = []
+        self.fallback_interval = fallback_interval
+        self._vendor_id   = vendor_id
+        self._product_id  = product_id
+        self._hid         = hid
+        self._buffer      = bytearray(report_size)
+        self._c_buffer    = hidapi.hid_wrap_buffer(self._buffer)
+        self._poller      = _Poller()
+        self._by_fd       = {}
+        self._callbacks   = {}
+        self._unpollable  = []
+        self._next_tag    = 0
+
+    def open_all(self):
+        """Open every matching device which is not open yet.
+
+        Devices which fail to open are skipped.
+
+        Returns:
+            List of the Devices opened."""
+
+        opened = []
+        paths  = set(device.path for device in self.devices)
+        for info in self._hid.hid_enumerate(self._vendor_id, self._product_id):
+            if info.path in paths:
+                continue
+            try:
+                opened.append(self.open(info.path, info.serial_number))
+            except RuntimeError:
+                pass
+        return opened
+
+    def open(self, path, serial_number=None):
+        """Open a device by path and start serving it.
+
+        Arguments:
+            path:          Path name of the device, as from hid_enumerate().
+
+            serial_number: Serial number string, for information.
+
+        Returns:
+            The Device.
+            Raises RuntimeError exception if the device cannot be opened."""
+
+        handle = self._hid.hid_open_path(path)
+        try:
+            fd = device_fd(handle, self._hid)
+            self._hid.hid_set_nonblocking(handle, True)
+        except Exception:
+            self._hid.hid_close(handle)
+            raise
+        device = Device(self._next_tag, path, serial_number, handle, fd)
+        self._next_tag += 1
+        if fd is not None:
+            self._poller.register(fd)
+            self._by_fd[fd] = device
+        else:
+            self._unpollable.append(device)
+        self.devices.append(device)
+        return device
+
+    def device(self, path):
+        """Return the open Device with a path, or None."""
+
+        for device in self.devices:
+            if device.path == path:
+                return device
+        return None
+
+    def add_fd(self, fd, callback):
+        """Wait on another file descriptor in poll().
+
+        This lets one loop also serve eg: a DeviceWatcher or a socket.
+
+        Arguments:
+            fd:       File descriptor.
+
+            callback: Function called without arguments by poll() when fd
+                      is readable.
+
+        Returns:
+            None"""
+
+        self._poller.register(fd)
+        self._callbacks[fd] = callback
+
+    def remove_fd(self, fd):
+        """Stop waiting on a file descriptor added with add_fd().
+
+        Returns:
+            None"""
+
+        del self._callbacks[fd]
+        self._poller.unregister(fd)
+
+    def close(self, device):
+        """Stop serving a device and close its handle.
+
+        Arguments:
+            device: The Device.
+
+        Returns:
+            None"""
+
+        if device not in self.devices:
+            return
+        self.devices.remove(device)
+        if device.fd is not None:
+            del self._by_fd[device.fd]
+            self._poller.unregister(device.fd)
+        else:
+            self._unpollable.remove(device)
+        self._hid.hid_close(device.handle)
+
+    def close_all(self):
+        """Close every device. The manager cannot be used afterwards.
+
+        Returns:
+            None"""
+
+        for device in list(self.devices):
+            self.close(device)
+        self._poller.close()
+
+    def _read(self, device, reports, max_reports):
+        """Read the waiting reports of a device. For internal use only."""
+
+        read  = self._hid.hid_read_into
+        buf   = self._buffer
+        c_buf = self._c_buffer
+        try:
+            while len(reports) < max_reports:
+                num = read(device.handle, c_buf)
+                if num <= 0:
+                    break
+                reports.append((device, _now(), buf[:num]))
+        except RuntimeError as e:
+            device.error = e
+            self.close(device)
+
+    def poll(self, timeout=None, max_reports=256):
+        """Wait for reports from any device and return them.
+
+        Devices whose reads fail (eg: because they were unplugged) are
+        closed, with the exception in their error attribute.
+
+        Arguments:
+            timeout:     Longest time to wait in seconds, or None to wait
+                         until a report arrives.
+
+            max_reports: Maximum number of reports to return.
+
+        Returns:
+            List of (device, timestamp, report) tuples, where report is a
+            bytearray. Empty if the timeout expired, or if only file
+            descriptors added with add_fd() were ready."""
+
+        if self._unpollable:
+            if timeout is None or timeout > self.fallback_interval:
+                timeout = self.fallback_interval
+        reports = []
+        waiting = self._by_fd or self._callbacks or timeout is None
+        for fd in self._poller.poll(timeout if waiting else 0):
+            device = self._by_fd.get(fd)
+            if device is not None:
+                self._read(device, reports, max_reports)
+            elif fd in self._callbacks:
+                self._callbacks[fd]()
+        for device in list(self._unpollable):
+            self._read(device, reports, max_reports)
+        if not reports and not waiting and timeout:
+            time.sleep(timeout)
+        return reports
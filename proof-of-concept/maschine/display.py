@@ -0,0 +1,258 @@
+"""Framebuffers for the two 256x64 displays.
+
+Each display of the Maschine MK2 is written in 8 stripes of 8 pixel
+rows. A stripe is sent as one output report: report ID 0xe0 (display 0)
+or 0xe1 (display 1), an 8 byte header giving the position of the
+stripe, and 256 bytes of pixel data:
+
+    e0 00 00 YY 00 20 00 08 00 <256 bytes>
+
+where YY is the first row of the stripe. The pixel data holds the 8
+rows one after the other, 32 bytes per row, one bit per pixel with the
+leftmost pixel of each byte in the most significant bit.
+
+A FrameBuffer keeps the 8 stripe reports of a display ready to send,
+and remembers which stripes were changed since the last flush(), so
+that a small update costs one report instead of eight.
+
+Public classes defined by this module:
+
+    FrameBuffer
+"""
+
+from __future__ import absolute_import
+
+import hidapi
+
+WIDTH          = 256
+HEIGHT         = 64
+STRIPE_ROWS    = 8
+STRIPES        = HEIGHT // STRIPE_ROWS
+ROW_BYTES      = WIDTH // 8
+STRIPE_HEADER  = 9
+STRIPE_BYTES   = STRIPE_ROWS * ROW_BYTES
+STRIPE_REPORT  = STRIPE_HEADER + STRIPE_BYTES
+ALL_STRIPES    = (1 << STRIPES) - 1
+
+
+def stripe_header(display_no, stripe):
+    """Return the 9 byte report header of a stripe.
+
+    Arguments:
+        display_no: Display number, 0 or 1.
+
+        stripe:     Stripe number, 0 to 7.
+
+    Returns:
+        bytearray holding the header."""
+
+    return bytearray([0xe0 | display_no, 0x00, 0x00, stripe * STRIPE_ROWS,
+                      0x00, WIDTH >> 3, 0x00, STRIPE_ROWS, 0x00])
+
+
+class FrameBuffer(object):
+    """1 bit per pixel image of one display, with dirty stripe tracking.
+
+    Attributes:
+        display_no: Display number, 0 or 1.
+        dirty:      Bitmask of the stripes changed since the last flush,
+                    bit n standing for stripe n."""
+
+    def __init__(self, display_no, hid=hidapi):
+        """Constructor for class FrameBuffer.
+
+        The framebuffer starts out blank, with every stripe dirty so that
+        the first flush() clears the display.
+
+        Arguments:
+            display_no: Display number, 0 or 1.
+
+            hid:        Module used to write the reports. Defaults to the
+                        hidapi module."""
+
+        if display_no not in (0, 1):
+            raise ValueError('display_no must be 0 or 1.')
+
+        self.display_no = display_no
+        self.dirty      = ALL_STRIPES
+        self._hid       = hid
+        self._reports   = bytearray(STRIPES * STRIPE_REPORT)
+        self._view      = memoryview(self._reports)
+        for stripe in range(STRIPES):
+            offset = stripe * STRIPE_REPORT
+            self._reports[offset:offset + STRIPE_HEADER] = stripe_header(display_no, stripe)
+
+    def _row_offset(self, y):
+        """Return the offset of the first byte of row y. For internal use only."""
+
+        stripe, row = divmod(y, STRIPE_ROWS)
+        return stripe * STRIPE_REPORT + STRIPE_HEADER + row * ROW_BYTES
+
+    def stripe_data(self, stripe):
+        """Return a writable memoryview of the pixel data of a stripe.
+
+        Writing through the view does not mark the stripe dirty; call
+        mark_dirty() afterwards.
+
+        Arguments:
+            stripe: Stripe number, 0 to 7.
+
+        Returns:
+            memoryview of 256 bytes."""
+
+        offset = stripe * STRIPE_REPORT + STRIPE_HEADER
+        return self._view[offset:offset + STRIPE_BYTES]
+
+    def stripe_report(self, stripe):
+        """Return the complete output report of a stripe.
+
+        Arguments:
+            stripe: Stripe number, 0 to 7.
+
+        Returns:
+            memoryview of the 265 byte report."""
+
+        offset = stripe * STRIPE_REPORT
+        return self._view[offset:offset + STRIPE_REPORT]
+
+    def mark_dirty(self, first_row=0, last_row=HEIGHT - 1):
+        """Mark the stripes covering a range of rows as changed.
+
+        Arguments:
+            first_row: First row changed.
+
+            last_row:  Last row changed.
+
+        Returns:
+            None"""
+
+        first = first_row // STRIPE_ROWS
+        last  = last_row // STRIPE_ROWS
+        self.dirty |= ((1 << (last + 1)) - 1) & ~((1 << first) - 1)
+
+    def get_pixel(self, x, y):
+        """Return True if the pixel at (x, y) is set."""
+
+        byte = self._reports[self._row_offset(y) + (x >> 3)]
+        return bool(byte & (0x80 >> (x & 7)))
+
+    def set_pixel(self, x, y, on=True):
+        """Set or clear the pixel at (x, y).
+
+        Returns:
+            None"""
+
+        offset = self._row_offset(y) + (x >> 3)
+        mask   = 0x80 >> (x & 7)
+        old    = self._reports[offset]
+        new    = old | mask if on else old & ~mask
+        if new != old:
+            self._reports[offset] = new
+            self.dirty |= 1 << (y // STRIPE_ROWS)
+
+    def get_row(self, y, x_byte=0, length=ROW_BYTES):
+        """Return a copy of packed pixel data of a row.
+
+        Arguments:
+            y:      Row number.
+
+            x_byte: Byte column to start at, 0 to 31 (8 pixels each).
+
+            length: Number of bytes.
+
+        Returns:
+            bytearray of the pixel bytes, in device bit order."""
+
+        offset = self._row_offset(y) + x_byte
+        return bytearray(self._view[offset:offset + min(length, ROW_BYTES - x_byte)])
+
+    def set_row(self, y, data, x_byte=0):
+        """Copy packed pixel data into a row.
+
+        Arguments:
+            y:      Row number.
+
+            data:   Buffer of packed pixel bytes, in device bit order.
+
+            x_byte: Byte column to start at, 0 to 31 (8 pixels each).
+
+        Returns:
+            None"""
+
+        offset = self._row_offset(y) + x_byte
+        length = min(len(data), ROW_BYTES - x_byte)
+        if self._view[offset:offset + length] != memoryview(data)[:length]:
+            self._view[offset:offset + length] = memoryview(data)[:length]
+            self.dirty |= 1 << (y // STRIPE_ROWS)
+
+    def load(self, data):
+        """Replace the whole image.
+
+        Stripes whose content does not change are not marked dirty.
+
+        Arguments:
+            data: Buffer of 2048 packed pixel bytes, row by row, in
+                  device bit order.
+
+        Returns:
+            None"""
+
+        if len(data) != HEIGHT * ROW_BYTES:
+            raise ValueError('Image data must be %d bytes.' % (HEIGHT * ROW_BYTES))
+        src = memoryview(data)
+        for stripe in range(STRIPES):
+            dst   = self.stripe_data(stripe)
+            chunk = src[stripe * STRIPE_BYTES:(stripe + 1) * STRIPE_BYTES]
+            if dst != chunk:
+                dst[:] = chunk
+                self.dirty |= 1 << stripe
+
+    def fill(self, on=False):
+        """Set or clear every pixel.
+
+        Returns:
+            None"""
+
+        self.load(bytearray(b'\xff' if on else b'\x00') * (HEIGHT * ROW_BYTES))
+
+    def dirty_reports(self):
+        """Return the reports of the dirty stripes.
+
+        Returns:
+            List of memoryviews of stripe reports, top stripe first."""
+
+        dirty = self.dirty
+        return [self.stripe_report(stripe)
+                for stripe in range(STRIPES) if dirty & (1 << stripe)]
+
+    def flush(self, device, force=False):
+        """Send the dirty stripes to the display.
+
+        Arguments:
+            device: A device handle returned by hid_open().
+
+            force:  Send every stripe, dirty or not.
+
+        Returns:
+            Number of stripe reports sent.
+            Raises RuntimeError exception if a write fails; stripes which
+            failed stay dirty."""
+
+        if force:
+            self.dirty = ALL_STRIPES
+        if not self.dirty:
+            return 0
+
+        stripes = [stripe for stripe in range(STRIPES)
+                   if self.dirty & (1 << stripe)]
+        results = self._hid.hid_write_many(
+            device, [self.stripe_report(stripe) for stripe in stripes])
+
+        failed = 0
+        for stripe, num in zip(stripes, results):
+            if num < 0:
+                failed |= 1 << stripe
+        self.dirty = failed
+        if failed:
+            raise RuntimeError('Writing display %d failed.' % self.display_no)
+        return len(stripes)
@@ -0,0 +1,278 @@
+"""Streaming of greyscale frames to the displays.
+
+Animations and live views (waveforms, spectra) are easiest to draw as
+greyscale images: uint8 NumPy arrays of 64 rows of 256 pixels, 0 being
+dark and 255 lit. pack_frame() turns such a frame into the 2048 bytes
+of a display image, with array operations only: each pixel is compared
+with a fixed threshold, or with an 8x8 ordered (Bayer) dither matrix
+tiled over the display so that grey levels come out as patterns, and
+numpy.packbits() packs the resulting bits 8 to a byte with the leftmost
+pixel in the most significant bit, which is the displays' bit order
+(the reverse of XBM's, see images.reverse_bits()).
+
+A FrameStreamer converts frames on a background thread and queues the
+stripes which changed from the previous frame with an OutputScheduler,
+so LED reports still go ahead of them. It takes the next frame only
+once the scheduler has written the stripes of the previous one. The
+producer and the streamer only share a FrameSlot, which holds the
+latest frame submitted for each display: a frame submitted before the
+streamer took the previous one replaces it, and the replaced frame is
+counted as dropped without having been converted. A device slower than
+the producer therefore shows the newest frame it can, instead of
+falling further and further behind.
+
+The streamed displays belong to the streamer; the program should not
+queue stripes of its own for them with the same scheduler.
+
+This module requires NumPy.
+
+Public classes defined by this module:
+
+    FrameSlot
+    FrameStreamer
+
+Public functions defined by this module:
+
+    pack_frame(frame, method='dither', level=128, out=None)
+"""
+
+from __future__ import absolute_import, division
+
+import threading
+
+import numpy
+
+from .display import HEIGHT, WIDTH, FrameBuffer
+from .scheduler import PRIORITY_DISPLAY
+
+# 8x8 Bayer matrix: the order in which the pixels of a cell light up as
+# the grey level rises.
+_BAYER = numpy.array([[ 0, 32,  8, 40,  2, 34, 10, 42],
+                      [48, 16, 56, 24, 50, 18, 58, 26],
+                      [12, 44,  4, 36, 14, 46,  6, 38],
+                      [60, 28, 52, 20, 62, 30, 54, 22],
+                      [ 3, 35, 11, 43,  1, 33,  9, 41],
+                      [51, 19, 59, 27, 49, 17, 57, 25],
+                      [15, 47,  7, 39, 13, 45,  5, 37],
+                      [63, 31, 55, 23, 61, 29, 53, 21]])
+
+# The matrix scaled to grey levels and tiled over a display; a pixel is
+# lit where the frame is above it.
+_DITHER = numpy.tile(_BAYER * 4 + 2, (HEIGHT // 8, WIDTH // 8)).astype(numpy.uint8)
+
+METHODS = ('dither', 'threshold')
+
+
+def pack_frame(frame, method='dither', level=128, out=None):
+    """Convert a greyscale frame to a display image.
+
+    Arguments:
+        frame:  uint8 array of shape (64, 256), 0 dark to 255 lit.
+
+        method: 'dither' for ordered dithering, or 'threshold' to light
+                the pixels from level up.
+
+        level:  Grey level from which pixels are lit by 'threshold'.
+
+        out:    Optional bool array of shape (64, 256) to hold the pixels
+                before packing.
+
+    Returns:
+        uint8 NumPy array of 2048 packed bytes, row by row in display bit
+        order, as accepted by FrameBuffer.load().
+        Raises ValueError exception if the frame has the wrong shape or
+        the method is unknown."""
+
+    frame = numpy.asarray(frame)
+    if frame.shape != (HEIGHT, WIDTH):
+        raise ValueError('Frames must be %d x %d pixels.' % (HEIGHT, WIDTH))
+    if method == 'dither':
+        bits = numpy.greater(frame, _DITHER, out=out)
+    elif method == 'threshold':
+        bits = numpy.greater_equal(frame, level, out=out)
+    else:
+        raise ValueError('Unknown method %r.' % (method,))
+    return numpy.packbits(bits, axis=1).ravel()
+
+
+class FrameSlot(object):
+    """Holds the latest frame of each display, between a producer and a
+    consumer thread.
+
+    Attributes:
+        submitted: Number of frames put.
+        dropped:   Number of frames replaced by a newer one before they
+                   were taken.
+        closed:    True once close() was called."""
+
+    def __init__(self, displays=2):
+        """Constructor for class FrameSlot.
+
+        Arguments:
+            displays: Number of displays."""
+
+        self.submitted = 0
+        self.dropped   = 0
+        self._frames   = [None] * displays
+        self.closed    = False
+        self._cond     = threading.Condition(threading.Lock())
+
+    def put(self, frame, display_no=0):
+        """Make a frame the latest one of a display.
+
+        Returns:
+            True if it replaced a frame which was not taken yet."""
+
+        with self._cond:
+            replaced = self._frames[display_no] is not None
+            self._frames[display_no] = frame
+            self.submitted += 1
+            if replaced:
+                self.dropped += 1
+            self._cond.notify()
+            return replaced
+
+    def take(self, timeout=None):
+        """Wait for frames and take them out of the slot.
+
+        Arguments:
+            timeout: Longest time to wait in seconds, or None to wait
+                     until a frame is put or the slot is closed.
+
+        Returns:
+            List with the latest frame of each display, or None for the
+            displays without a new frame; None if the slot was closed or
+            the timeout expired."""
+
+        with self._cond:
+            if not self.closed and not any(frame is not None for frame in self._frames):
+                self._cond.wait(timeout)
+            if self.closed or not any(frame is not None for frame in self._frames):
+                return None
+            frames = self._frames
+            self._frames = [None] * len(frames)
+            return frames
+
+    def close(self):
+        """Wake up and turn away the consumer.
+
+        Returns:
+            None"""
+
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class FrameStreamer(object):
+    """Converts the latest greyscale frames on a background thread and
+    queues them with an output scheduler, dropping those the device is
+    too slow for.
+
+    Attributes:
+        method:   Conversion method, see pack_frame().
+        level:    Threshold level, see pack_frame().
+        priority: Priority class of the stripes.
+        written:  Number of frames converted and queued.
+        error:    The exception raised by the scheduler when queueing a
+                  frame, or None. Write errors are in the scheduler's."""
+
+    def __init__(self, scheduler, method='dither', level=128,
+                 priority=PRIORITY_DISPLAY):
+        """Constructor for class FrameStreamer.
+
+        Arguments:
+            scheduler: scheduler.OutputScheduler writing to the device,
+                       running on its own thread.
+
+            method:    'dither' or 'threshold', see pack_frame().
+
+            level:     Threshold level, see pack_frame().
+
+            priority:  Priority class of the stripes."""
+
+        if method not in METHODS:
+            raise ValueError('Unknown method %r.' % (method,))
+        self.method   = method
+        self.level    = level
+        self.priority = priority
+        self.written  = 0
+        self.error    = None
+        self._scheduler = scheduler
+        self._buffers = [FrameBuffer(0), FrameBuffer(1)]
+        self._bits    = numpy.zeros((HEIGHT, WIDTH), dtype=bool)
+        self._slot    = FrameSlot(len(self._buffers))
+        self._thread  = None
+
+    @property
+    def dropped(self):
+        """Number of frames dropped because a newer one came first."""
+
+        return self._slot.dropped
+
+    def submit(self, frame, display_no=0):
+        """Hand a frame to the streamer thread.
+
+        The frame is copied, so the caller may draw the next one into the
+        same array.
+
+        Arguments:
+            frame:      uint8 array of shape (64, 256), see pack_frame().
+
+            display_no: Display number, 0 or 1.
+
+        Returns:
+            True if a frame not taken yet was dropped for this one.
+            Raises ValueError exception if the frame has the wrong shape."""
+
+        frame = numpy.array(frame, dtype=numpy.uint8)
+        if frame.shape != (HEIGHT, WIDTH):
+            raise ValueError('Frames must be %d x %d pixels.' % (HEIGHT, WIDTH))
+        return self._slot.put(frame, display_no)
+
+    def start(self):
+        """Start the streamer thread.
+
+        Returns:
+            None"""
+
+        if self._thread is not None:
+            raise RuntimeError('Streamer already started.')
+        self._thread = threading.Thread(target=self._run, name='maschine-frames')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the streamer thread and wait for it to finish. Frames not
+        taken yet are dropped.
+
+        Returns:
+            None"""
+
+        self._slot.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """Body of the streamer thread. For internal use only."""
+
+        scheduler = self._scheduler
+        while True:
+            frames = self._slot.take()
+            if frames is None:
+                return
+            for buffer, frame in zip(self._buffers, frames):
+                if frame is None:
+                    continue
+                buffer.load(pack_frame(frame, self.method, self.level, self._bits))
+                try:
+                    scheduler.submit_display(buffer, self.priority)
+                except RuntimeError as e:
+                    self.error = e
+                else:
+                    self.written += 1
+            # Newer frames replace each other in the slot meanwhile.
+            while not scheduler.wait(self.priority, 0.1):
+                if self._slot.closed:
+                    return
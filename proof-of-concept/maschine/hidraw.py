@@ -0,0 +1,46 @@
+"""Access to the hidraw file descriptor behind a hidapi device handle.
+
+On Linux, the hidraw backend of hidapi (libhidapi-hidraw) reads and
+writes a /dev/hidraw* device node, and the first member of its
+hid_device structure is the file descriptor of that node. Exposing it
+lets a program wait for input reports with select(), poll() or an event
+loop, and then fetch them with a non-blocking hid_read() without
+sleeping or spinning.
+
+The libusb and non-Linux backends have no such descriptor.
+
+Public functions defined by this module:
+
+    device_fd(device, hid=hidapi)
+"""
+
+from __future__ import absolute_import
+
+import sys
+from ctypes import POINTER, c_int, cast
+
+import hidapi
+
+
+def device_fd(device, hid=hidapi):
+    """Return the file descriptor a HID device handle reads from.
+
+    Arguments:
+        device: A device handle returned by hid_open().
+
+        hid:    Module the device was opened with. Defaults to the
+                hidapi module. Modules which are not backed by a hidapi
+                library may provide their own hid_fileno(device).
+
+    Returns:
+        File descriptor which becomes readable when an input report is
+        available, or None if the backend does not use one."""
+
+    if hasattr(hid, 'hid_fileno'):
+        return hid.hid_fileno(device)
+    if not sys.platform.startswith('linux'):
+        return None
+    if 'hidraw' not in hid.hid_lib_path():
+        return None
+    # struct hid_device_ { int device_handle; ... } in linux/hid.c
+    return cast(device, POINTER(c_int))[0]
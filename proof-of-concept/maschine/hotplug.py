@@ -0,0 +1,281 @@
+"""Cached enumeration with connect and disconnect notification.
+
+Calling hid_enumerate() over and over to notice a controller being
+unplugged or plugged in again walks every HID device on the system each
+time. A DeviceWatcher enumerates once, keeps the result, and only
+enumerates again when the set of devices may actually have changed:
+
+    inotify  (Linux, hidraw backend) the /dev directory is watched with
+             inotify, through ctypes, for hidraw nodes being created,
+             removed or changing permissions, as udev does when a
+             device comes and goes. fileno() can be waited on.
+    stat     the names and change times of the /dev/hidraw* nodes are
+             compared, at most every interval seconds.
+    enumerate
+             (other backends and platforms) hid_enumerate() is called at
+             most every interval seconds.
+
+When the cached set changes, on_connect is called with the
+hid_device_info of each new device and on_disconnect with that of each
+device which went away, so the program can (re)open the handle without
+polling.
+
+udev may only make a new node accessible a moment after creating it. A
+program whose open fails in on_connect can call forget() with the path;
+the device is then reported again after the next change, eg: when udev
+sets its permissions.
+
+Public classes defined by this module:
+
+    DeviceWatcher
+"""
+
+from __future__ import absolute_import, division
+
+import ctypes
+import errno
+import os
+import struct
+import sys
+import time
+
+import hidapi
+
+# Monotonic clock used to pace the checks, where available.
+_now = getattr(time, 'monotonic', time.time)
+
+_DEV = '/dev'
+
+IN_ATTRIB     = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO   = 0x00000080
+IN_CREATE     = 0x00000100
+IN_DELETE     = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+
+_EVENT = struct.Struct('iIII')          # struct inotify_event, without name
+
+
+class _Inotify(object):
+    """inotify watch of /dev for hidraw nodes. For internal use only."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        flags = os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0)
+        self.fd = libc.inotify_init1(flags)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1() failed.')
+        mask = IN_CREATE | IN_DELETE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, _DEV.encode('ascii'), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, 'inotify_add_watch() failed.')
+
+    def changed(self):
+        """Read the pending events and return True if a hidraw node was
+        among them."""
+
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return changed
+                raise
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length]
+                offset += length
+                if mask & IN_Q_OVERFLOW or name.startswith(b'hidraw'):
+                    changed = True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _hidraw_signature():
+    """Return the names and change times of the hidraw nodes. For
+    internal use only."""
+
+    signature = []
+    for name in os.listdir(_DEV):
+        if name.startswith('hidraw'):
+            try:
+                signature.append((name, os.stat(os.path.join(_DEV, name)).st_ctime))
+            except OSError:
+                pass
+    signature.sort()
+    return signature
+
+
+class DeviceWatcher(object):
+    """Cache of hid_enumerate() results, refreshed on device changes.
+
+    Attributes:
+        method:        Change detection in use: 'inotify', 'stat' or
+                       'enumerate'.
+        interval:      Least time in seconds between two checks of the
+                       'stat' and 'enumerate' methods.
+        on_connect:    Function called with the hid_device_info of each
+                       device which appeared, or None.
+        on_disconnect: Function called with the hid_device_info of each
+                       device which went away, or None.
+        enumerations:  Number of times hid_enumerate() was called."""
+
+    def __init__(self, vendor_id=0x17cc, product_id=0x1140, on_connect=None,
+                 on_disconnect=None, method=None, interval=0.5, hid=hidapi):
+        """Constructor for class DeviceWatcher.
+
+        The devices present at construction are enumerated, but no
+        callbacks are made for them; see devices().
+
+        Arguments:
+            vendor_id:     Vendor ID of the devices to watch, or 0 for any.
+
+            product_id:    Product ID of the devices to watch, or 0 for any.
+
+            on_connect:    Function called with each new hid_device_info.
+
+            on_disconnect: Function called with each hid_device_info of a
+                           device which went away.
+
+            method:        'inotify', 'stat', 'enumerate', or None to pick
+                           the best method available.
+
+            interval:      Least time in seconds between two checks of the
+                           'stat' and 'enumerate' methods.
+
+            hid:           Module used to enumerate the devices. Defaults
+                           to the hidapi module."""
+
+        self.on_connect    = on_connect
+        self.on_disconnect = on_disconnect
+        self.interval      = interval
+        self.enumerations  = 0
+        self._vendor_id  = vendor_id
+        self._product_id = product_id
+        self._hid        = hid
+        self._inotify    = None
+        self._signature  = None
+        self._checked    = _now()
+
+        hidraw = (sys.platform.startswith('linux') and os.path.isdir(_DEV)
+                  and 'hidraw' in hid.hid_lib_path())
+        if method is None:
+            method = 'inotify' if hidraw else 'enumerate'
+        if method == 'inotify':
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                method = 'stat'
+        if method == 'stat':
+            self._signature = _hidraw_signature()
+        elif method not in ('inotify', 'enumerate'):
+            raise ValueError('Unknown change detection method %r.' % (method,))
+        self.method   = method
+        self._devices = self._enumerate()
+
+    def _enumerate(self):
+        """Enumerate the devices. For internal use only."""
+
+        self.enumerations += 1
+        return self._hid.hid_enumerate(self._vendor_id, self._product_id)
+
+    def fileno(self):
+        """Return a file descriptor which becomes readable when the
+        devices may have changed, for waiting with select() or poll(),
+        or None if the method has none."""
+
+        return self._inotify.fd if self._inotify is not None else None
+
+    def devices(self):
+        """Return the cached list of hid_device_info.
+
+        The list is replaced, not modified, when the devices change."""
+
+        return self._devices
+
+    def find(self, path):
+        """Return the cached hid_device_info with a path, or None."""
+
+        for info in self._devices:
+            if info.path == path:
+                return info
+        return None
+
+    def forget(self, path):
+        """Drop a device from the cache, so that it is reported as
+        connected again by the next refresh which finds it.
+
+        Returns:
+            None"""
+
+        self._devices = [info for info in self._devices if info.path != path]
+
+    def _changed(self, now):
+        """Return True if the devices may have changed. For internal use only."""
+
+        if self._inotify is not None:
+            return self._inotify.changed()
+        if now - self._checked < self.interval:
+            return False
+        self._checked = now
+        if self.method == 'stat':
+            signature = _hidraw_signature()
+            if signature == self._signature:
+                return False
+            self._signature = signature
+        return True
+
+    def poll(self, now=None):
+        """Check for changes, and refresh the cache and make the
+        callbacks if there were any.
+
+        Call this from the program's main loop, eg: when fileno() is
+        readable, or on every pass for the other methods; checks which
+        are not due yet cost next to nothing.
+
+        Arguments:
+            now: Current time, if the caller already has it.
+
+        Returns:
+            Tuple (connected, disconnected) of lists of hid_device_info."""
+
+        if not self._changed(_now() if now is None else now):
+            return [], []
+        return self.refresh()
+
+    def refresh(self):
+        """Enumerate the devices now, and make the callbacks for any
+        changes.
+
+        Returns:
+            Tuple (connected, disconnected) of lists of hid_device_info."""
+
+        old = self._devices
+        new = self._enumerate()
+        self._devices = new
+        old_paths    = set(info.path for info in old)
+        new_paths    = set(info.path for info in new)
+        connected    = [info for info in new if info.path not in old_paths]
+        disconnected = [info for info in old if info.path not in new_paths]
+        for info in disconnected:
+            if self.on_disconnect is not None:
+                self.on_disconnect(info)
+        for info in connected:
+            if self.on_connect is not None:
+                self.on_connect(info)
+        return connected, disconnected
+
+    def close(self):
+        """Stop watching.
+
+        Returns:
+            None"""
+
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
@@ -0,0 +1,225 @@
+"""Loading of images for the displays.
+
+Images can be loaded straight from XBM files, as saved by GIMP, from
+raw 1 bit per pixel bitmaps, and from the .hex files made by
+xbmtostring.pl. XBM stores the leftmost pixel of each byte in the least
+significant bit, while the displays want it in the most significant
+bit, so the bits of every byte are reversed with a 256 entry
+translation table applied to the whole image at once.
+
+load_packets() returns the 8 stripe reports of an image, ready to be
+written to a display. The encoded reports are cached on disk, keyed by
+a hash of the source file, so loading the same image again only costs
+reading the file and the cache entry. The cache lives in the directory
+named by the MASCHINE_CACHE_DIR environment variable, or by default in
+open-maschine/images under $XDG_CACHE_HOME (~/.cache).
+
+Public functions defined by this module:
+
+    encode_packets(display_no, data)
+    load_hex(path)
+    load_packets(display_no, path, cache_dir=None)
+    load_raw(path, width=256, height=64, msb_first=True)
+    load_xbm(path)
+    reverse_bits(data)
+"""
+
+from __future__ import absolute_import
+
+import binascii
+import hashlib
+import os
+import re
+
+from .display import (WIDTH, HEIGHT, STRIPES, STRIPE_BYTES, STRIPE_REPORT,
+                      stripe_header)
+
+# Bumped whenever the encoding of cached packets changes.
+CACHE_VERSION = 1
+
+_REVERSE = bytes(bytearray(int('{0:08b}'.format(n)[::-1], 2) for n in range(256)))
+
+_XBM_DEFINE = re.compile(br'#define\s+\w*_(width|height)\s+(\d+)')
+_XBM_BYTE   = re.compile(br'0[xX]([0-9a-fA-F]{2})\b')
+
+
+def reverse_bits(data):
+    """Return a copy of data with the bits of every byte reversed.
+
+    Arguments:
+        data: A bytearray or other buffer.
+
+    Returns:
+        bytearray of the same length as data."""
+
+    return bytearray(data).translate(_REVERSE)
+
+
+def load_xbm(path):
+    """Load an XBM file.
+
+    Arguments:
+        path: Path name of the XBM file.
+
+    Returns:
+        Tuple (width, height, data), where data is a bytearray of
+        packed pixel rows in display bit order (leftmost pixel in the
+        most significant bit), each row padded to a whole byte.
+        Raises ValueError exception if the file is not a valid XBM image."""
+
+    with open(path, 'rb') as f:
+        text = f.read()
+    return _parse_xbm(text)
+
+
+def _parse_xbm(text):
+    """Parse the contents of an XBM file. For internal use only."""
+
+    size = dict(_XBM_DEFINE.findall(text))
+    if b'width' not in size or b'height' not in size:
+        raise ValueError('Missing width or height in XBM image.')
+    width  = int(size[b'width'])
+    height = int(size[b'height'])
+
+    body = text[text.index(b'{'):] if b'{' in text else text
+    data = bytearray(binascii.unhexlify(b''.join(_XBM_BYTE.findall(body))))
+    if len(data) != ((width + 7) // 8) * height:
+        raise ValueError('XBM image data does not match its size.')
+    return width, height, data.translate(_REVERSE)
+
+
+def load_raw(path, width=WIDTH, height=HEIGHT, msb_first=True):
+    """Load a raw 1 bit per pixel bitmap.
+
+    Arguments:
+        path:      Path name of the bitmap file, holding packed pixel
+                   rows, each padded to a whole byte.
+
+        width:     Width of the bitmap in pixels.
+
+        height:    Height of the bitmap in pixels.
+
+        msb_first: True if the leftmost pixel of each byte is in its
+                   most significant bit, False if it is in the least.
+
+    Returns:
+        bytearray of packed pixel rows in display bit order.
+        Raises ValueError exception if the file has the wrong size."""
+
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    if len(data) != ((width + 7) // 8) * height:
+        raise ValueError('Raw bitmap does not match its size.')
+    return data if msb_first else data.translate(_REVERSE)
+
+
+def load_hex(path):
+    """Load a .hex file made by xbmtostring.pl.
+
+    Arguments:
+        path: Path name of the .hex file, holding the XBM bytes of a
+              256x64 image as a hex string.
+
+    Returns:
+        bytearray of packed pixel rows in display bit order."""
+
+    with open(path, 'rb') as f:
+        text = f.read()
+    return _parse_hex(text)
+
+
+def _parse_hex(text):
+    """Parse the contents of a .hex file. For internal use only."""
+
+    return bytearray(binascii.unhexlify(text.strip())).translate(_REVERSE)
+
+
+def encode_packets(display_no, data):
+    """Split a display image into its 8 stripe reports.
+
+    Arguments:
+        display_no: Display number, 0 or 1.
+
+        data:       Buffer of 2048 packed pixel bytes, row by row, in
+                    display bit order.
+
+    Returns:
+        List of 8 bytearrays, each holding one stripe report."""
+
+    if len(data) != STRIPES * STRIPE_BYTES:
+        raise ValueError('Display images must be %dx%d pixels.' % (WIDTH, HEIGHT))
+    view = memoryview(data)
+    return [stripe_header(display_no, stripe)
+            + view[stripe * STRIPE_BYTES:(stripe + 1) * STRIPE_BYTES].tobytes()
+            for stripe in range(STRIPES)]
+
+
+def _cache_dir():
+    """Return the default cache directory. For internal use only."""
+
+    path = os.environ.get('MASCHINE_CACHE_DIR')
+    if not path:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        path = os.path.join(base, 'open-maschine', 'images')
+    return path
+
+
+def load_packets(display_no, path, cache_dir=None):
+    """Load an image file and return its stripe reports.
+
+    The format is chosen by the file name extension: .xbm for XBM,
+    .hex for xbmtostring.pl output, and anything else for a raw 256x64
+    bitmap in display bit order.
+
+    Arguments:
+        display_no: Display number, 0 or 1.
+
+        path:       Path name of the image file.
+
+        cache_dir:  Directory holding the packet cache, or False to
+                    disable caching. Defaults to MASCHINE_CACHE_DIR, or
+                    open-maschine/images under the user cache directory.
+
+    Returns:
+        List of 8 bytearrays, each holding one stripe report."""
+
+    with open(path, 'rb') as f:
+        source = f.read()
+
+    extension = os.path.splitext(path)[1].lower()
+    if cache_dir is None:
+        cache_dir = _cache_dir()
+    if cache_dir is not False:
+        key = hashlib.sha1(extension.encode('ascii') + b'\0' + source).hexdigest()
+        cache_path = os.path.join(cache_dir, '%s-%d-v%d.bin'
+                                  % (key, display_no, CACHE_VERSION))
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = bytearray(f.read())
+            if len(cached) == STRIPES * STRIPE_REPORT:
+                return [cached[n * STRIPE_REPORT:(n + 1) * STRIPE_REPORT]
+                        for n in range(STRIPES)]
+        except (IOError, OSError):
+            pass
+
+    if extension == '.xbm':
+        width, height, data = _parse_xbm(source)
+        if (width, height) != (WIDTH, HEIGHT):
+            raise ValueError('Display images must be %dx%d pixels.' % (WIDTH, HEIGHT))
+    elif extension == '.hex':
+        data = _parse_hex(source)
+    else:
+        data = bytearray(source)
+    packets = encode_packets(display_no, data)
+
+    if cache_dir is not False:
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(bytearray().join(packets))
+            os.rename(tmp_path, cache_path)
+        except (IOError, OSError):
+            pass
+    return packets
@@ -0,0 +1,311 @@
+"""LED state with coalesced, rate-limited updates.
+
+The LEDs of the Maschine MK2 are set with three output reports, each of
+which carries the state of a whole group of LEDs:
+
+    0x80: the 16 pads, one RGB triple each
+    0x81: the 8 group buttons, two RGB triples each, then the 8
+          transport buttons
+    0x82: the 31 other button LEDs
+
+An LedManager keeps an image of each report in a preallocated bytearray.
+Setting an LED only changes the image and marks the report dirty, so any
+number of changes between two flushes cost at most three writes, and
+reports which did not change are not sent at all. poll() flushes at a
+fixed rate from a program's main loop; start() does the same on a
+background thread.
+
+Public classes defined by this module:
+
+    LedManager
+"""
+
+from __future__ import absolute_import, division
+
+import threading
+import time
+
+import hidapi
+
+# Monotonic clock used to pace the flushes, where available.
+_now = getattr(time, 'monotonic', time.time)
+
+PAD_REPORT_ID    = 0x80
+GROUP_REPORT_ID  = 0x81
+BUTTON_REPORT_ID = 0x82
+
+PAD_COUNT   = 16
+GROUP_COUNT = 8
+
+# LED names of the 0x82 report, in order.
+BUTTON_LEDS = (
+    'display1', 'display2', 'display3', 'display4',
+    'display5', 'display6', 'display7', 'display8',
+    'control', 'step', 'browse', 'sampling',
+    'browse_left', 'browse_right', 'all', 'auto_write',
+    'volume', 'swing', 'tempo', 'nav_left',
+    'nav_right', 'enter', 'note_repeat',
+    'scene', 'pattern', 'pad_mode', 'navigate',
+    'duplicate', 'select', 'solo', 'mute',
+)
+
+# LED names of the transport part of the 0x81 report, in order.
+TRANSPORT_LEDS = (
+    'restart', 'transport_left', 'transport_right', 'grid',
+    'play', 'rec', 'erase', 'shift',
+)
+
+_PAD     = 0
+_GROUP   = 1
+_BUTTON  = 2
+_REPORTS = ((PAD_REPORT_ID, PAD_COUNT * 3),
+            (GROUP_REPORT_ID, GROUP_COUNT * 2 * 3 + len(TRANSPORT_LEDS)),
+            (BUTTON_REPORT_ID, len(BUTTON_LEDS)))
+
+# Name -> (report, byte offset) of every single-colour LED.
+_LED_OFFSETS = dict((name, (_BUTTON, 1 + n)) for n, name in enumerate(BUTTON_LEDS))
+_LED_OFFSETS.update((name, (_GROUP, 1 + GROUP_COUNT * 2 * 3 + n))
+                    for n, name in enumerate(TRANSPORT_LEDS))
+
+
+class LedManager(object):
+    """Coalescing image of the LED output reports.
+
+    Attributes:
+        rate:    Maximum number of flushes per second done by poll() and
+                 the background thread.
+        flushes: Number of reports written so far.
+        error:   The exception which stopped the background thread, or
+                 None."""
+
+    def __init__(self, rate=30.0, hid=hidapi):
+        """Constructor for class LedManager.
+
+        All LEDs start out off, with every report dirty so that the first
+        flush brings the controller in line with the manager.
+
+        Arguments:
+            rate: Maximum number of flushes per second.
+
+            hid:  Module used to write the reports. Defaults to the
+                  hidapi module."""
+
+        self.rate       = rate
+        self.flushes    = 0
+        self.error      = None
+        self._hid       = hid
+        self._reports   = []
+        for report_id, size in _REPORTS:
+            report    = bytearray(1 + size)
+            report[0] = report_id
+            self._reports.append(report)
+        self._dirty     = (1 << len(_REPORTS)) - 1
+        self._lock      = threading.Lock()
+        self._last      = None
+        self._thread    = None
+        self._running   = False
+
+    def _set(self, report, offset, value):
+        """Set one byte of a report image. For internal use only."""
+
+        data = self._reports[report]
+        if data[offset] != value:
+            with self._lock:
+                data[offset] = value
+                self._dirty |= 1 << report
+
+    def set_led(self, name, value):
+        """Set the brightness of a single-colour LED.
+
+        Arguments:
+            name:  LED name from BUTTON_LEDS or TRANSPORT_LEDS, or an
+                   index into BUTTON_LEDS.
+
+            value: Brightness, 0 to 255.
+
+        Returns:
+            None"""
+
+        if isinstance(name, int):
+            if not 0 <= name < len(BUTTON_LEDS):
+                raise IndexError('No button LED %d.' % name)
+            report, offset = _BUTTON, 1 + name
+        else:
+            try:
+                report, offset = _LED_OFFSETS[name]
+            except KeyError:
+                raise KeyError('No LED named %r.' % (name,))
+        self._set(report, offset, value)
+
+    def set_pad_rgb(self, pad, r, g, b):
+        """Set the colour of a pad.
+
+        Arguments:
+            pad:     Pad number, 0 to 15.
+
+            r, g, b: Colour components, 0 to 255.
+
+        Returns:
+            None"""
+
+        if not 0 <= pad < PAD_COUNT:
+            raise IndexError('No pad %d.' % pad)
+        offset = 1 + pad * 3
+        self._set(_PAD, offset, r)
+        self._set(_PAD, offset + 1, g)
+        self._set(_PAD, offset + 2, b)
+
+    def set_group_rgb(self, group, r, g, b, half=None):
+        """Set the colour of a group button.
+
+        Arguments:
+            group:   Group number, 0 (A) to 7 (H).
+
+            r, g, b: Colour components, 0 to 255.
+
+            half:    0 or 1 to set only one of the button's two LEDs,
+                     None to set both.
+
+        Returns:
+            None"""
+
+        if not 0 <= group < GROUP_COUNT:
+            raise IndexError('No group %d.' % group)
+        if half is not None and half not in (0, 1):
+            raise IndexError('No LED %r of a group button.' % (half,))
+        for n in ((0, 1) if half is None else (half,)):
+            offset = 1 + (n * GROUP_COUNT + group) * 3
+            self._set(_GROUP, offset, r)
+            self._set(_GROUP, offset + 1, g)
+            self._set(_GROUP, offset + 2, b)
+
+    def mark_dirty(self, report_id=None):
+        """Mark a report as changed, so that the next flush sends it
+        whether it changed or not.
+
+        Arguments:
+            report_id: ID of the report (eg: PAD_REPORT_ID), or None to
+                       mark every report.
+
+        Returns:
+            None"""
+
+        if report_id is None:
+            dirty = (1 << len(_REPORTS)) - 1
+        else:
+            dirty = 1 << self._index(report_id)
+        with self._lock:
+            self._dirty |= dirty
+
+    def dirty_reports(self):
+        """Return copies of the reports changed since the last flush,
+        and mark them clean.
+
+        Returns:
+            List of bytearrays, each holding one report."""
+
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = 0
+            return [bytearray(report) for n, report in enumerate(self._reports)
+                    if dirty & (1 << n)]
+
+    def flush(self, device, force=False):
+        """Send the reports changed since the last flush.
+
+        Arguments:
+            device: A device handle returned by hid_open().
+
+            force:  Send every report, changed or not.
+
+        Returns:
+            Number of reports sent.
+            Raises RuntimeError exception if a write fails; reports which
+            failed stay dirty."""
+
+        if force:
+            self.mark_dirty()
+        self._last = _now()
+        reports = self.dirty_reports()
+        if not reports:
+            return 0
+
+        results = self._hid.hid_write_many(device, reports)
+        failed  = 0
+        for report, num in zip(reports, results):
+            if num < 0:
+                failed |= 1 << self._index(report[0])
+        self.flushes += len(reports)
+        if failed:
+            with self._lock:
+                self._dirty |= failed
+            raise RuntimeError('Writing LED reports failed.')
+        return len(reports)
+
+    def poll(self, device, now=None):
+        """Flush if at least 1/rate seconds passed since the last flush.
+
+        Call this from the program's main loop.
+
+        Arguments:
+            device: A device handle returned by hid_open().
+
+            now:    Current time, from the same clock as the reader's
+                    report timestamps, if the caller already has it.
+
+        Returns:
+            Number of reports sent."""
+
+        if now is None:
+            now = _now()
+        if self._last is not None and now - self._last < 1.0 / self.rate:
+            return 0
+        return self.flush(device)
+
+    def start(self, device):
+        """Start flushing at the configured rate on a background thread.
+
+        Arguments:
+            device: A device handle returned by hid_open().
+
+        Returns:
+            None"""
+
+        if self._thread is not None:
+            raise RuntimeError('LED flusher already started.')
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, args=(device,),
+                                         name='maschine-leds')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and wait for it to finish.
+
+        Returns:
+            None"""
+
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, device):
+        """Body of the flusher thread. For internal use only."""
+
+        try:
+            while self._running:
+                self.flush(device)
+                time.sleep(1.0 / self.rate)
+        except Exception as e:
+            self.error    = e
+            self._running = False
+
+    @staticmethod
+    def _index(report_id):
+        """Return the index of the report with report_id. For internal use only."""
+
+        for n, (rid, size) in enumerate(_REPORTS):
+            if rid == report_id:
+                return n
+        raise ValueError('Not an LED report.')
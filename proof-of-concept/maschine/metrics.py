@@ -0,0 +1,389 @@
+"""Optional latency and throughput instrumentation.
+
+A Metrics instance collects, for one device:
+
+    interval  time between the returns of two successive reads
+    decode    time from the return of a read to the end of decoding
+              the report, including the time it waited in a ring
+    write     time each write call took, up to its completion
+
+in histograms with logarithmic buckets (one per power of two
+microseconds), plus the monotonic times of the last read return, decode
+and write completion, and counters of the reports and bytes read and
+written and of the failed writes. Any other latency can be added with
+latency().
+
+The reads and writes are measured by instrument(), which returns an
+object that stands in for the hidapi module and can be passed as the
+hid argument of ReportReader, OutputScheduler, LedManager or
+FrameBuffer. Decoding is measured by calling decoded() with the
+timestamp of the report. Without instrumentation, the hidapi module
+itself is passed and nothing is measured at all, so instrumentation
+costs nothing unless it is used.
+
+The read and decode figures should each be updated from a single
+thread (eg: the reader thread and the thread decoding), which is how
+the maschine classes use them, and take no lock. Writes are often made
+from several threads at once, eg: an OutputScheduler's and the main
+thread's, so the write figures are updated under a lock, which costs
+little next to a USB transfer. snapshot() may be called from any
+thread, or the snapshot dumped as JSON on a signal with
+dump_on_signal(). The lock is reentrant, as the signal handler runs on
+the main thread, which may be holding it in the middle of a write.
+
+Public classes defined by this module:
+
+    Histogram
+    Metrics
+"""
+
+from __future__ import absolute_import, division
+
+import json
+import signal
+import sys
+import threading
+import time
+
+import hidapi
+
+# Monotonic clock, the same one as the reader's report timestamps.
+_now = getattr(time, 'monotonic', time.time)
+
+_BUCKETS = 32                           # up to 2**31 us, about 36 minutes
+
+
+class Histogram(object):
+    """Latency histogram with logarithmic buckets.
+
+    Bucket 0 counts latencies below 1 us, and bucket n > 0 those from
+    2**(n-1) up to 2**n us.
+
+    Attributes:
+        counts:  List of counts per bucket.
+        count:   Number of latencies added.
+        total:   Sum of the latencies added, in seconds.
+        minimum: Smallest latency added, in seconds, or None.
+        maximum: Largest latency added, in seconds, or None."""
+
+    __slots__ = ('counts', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        """Constructor for class Histogram."""
+
+        self.reset()
+
+    def reset(self):
+        """Forget all latencies added.
+
+        Returns:
+            None"""
+
+        self.counts  = [0] * _BUCKETS
+        self.count   = 0
+        self.total   = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, seconds):
+        """Add a latency.
+
+        Arguments:
+            seconds: Latency in seconds.
+
+        Returns:
+            None"""
+
+        bucket = int(seconds * 1e6).bit_length() if seconds > 0 else 0
+        self.counts[bucket if bucket < _BUCKETS else _BUCKETS - 1] += 1
+        self.count += 1
+        self.total += seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if self.maximum is None or seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, fraction):
+        """Return an upper bound of a percentile.
+
+        Arguments:
+            fraction: The percentile as a fraction, eg: 0.99.
+
+        Returns:
+            The upper limit in seconds of the bucket holding the
+            percentile, capped at the maximum, or None if empty."""
+
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min((1 << bucket) / 1e6, self.maximum)
+        return self.maximum
+
+    def snapshot(self):
+        """Return the state of the histogram.
+
+        Returns:
+            Dict with the keys 'count', 'avg', 'min', 'max', 'p50',
+            'p90', 'p99' (in seconds) and 'buckets', a list of
+            [upper limit in us, count] pairs of the non-empty buckets."""
+
+        return {'count':   self.count,
+                'avg':     self.total / self.count if self.count else None,
+                'min':     self.minimum,
+                'max':     self.maximum,
+                'p50':     self.percentile(0.50),
+                'p90':     self.percentile(0.90),
+                'p99':     self.percentile(0.99),
+                'buckets': [[1 << bucket, count]
+                            for bucket, count in enumerate(self.counts) if count]}
+
+
+class _InstrumentedHid(object):
+    """Stand-in for the hidapi module which measures the reads and
+    writes. For internal use only."""
+
+    def __init__(self, metrics, hid):
+        self._metrics = metrics
+        self._hid     = hid
+
+    def __getattr__(self, name):
+        return getattr(self._hid, name)
+
+    def hid_read(self, device, length):
+        data = self._hid.hid_read(device, length)
+        self._metrics.read(len(data))
+        return data
+
+    def hid_read_timeout(self, device, length, milliseconds):
+        data = self._hid.hid_read_timeout(device, length, milliseconds)
+        self._metrics.read(len(data))
+        return data
+
+    def hid_read_into(self, device, buffer):
+        num = self._hid.hid_read_into(device, buffer)
+        self._metrics.read(num)
+        return num
+
+    def hid_read_timeout_into(self, device, buffer, milliseconds):
+        num = self._hid.hid_read_timeout_into(device, buffer, milliseconds)
+        self._metrics.read(num)
+        return num
+
+    def hid_write(self, device, data):
+        start = _now()
+        try:
+            num = self._hid.hid_write(device, data)
+        except RuntimeError:
+            self._metrics.written(-1, start)
+            raise
+        self._metrics.written(num, start)
+        return num
+
+    def hid_write_many(self, device, reports):
+        start   = _now()
+        results = self._hid.hid_write_many(device, reports)
+        now     = _now()
+        for num in results:
+            self._metrics.written(num, start, now, len(results))
+        return results
+
+
+class Metrics(object):
+    """Latency histograms and counters of the reads, decoding and writes.
+
+    Attributes:
+        histograms: Dict of Histogram by name, holding at least
+                    'interval', 'decode' and 'write'."""
+
+    def __init__(self):
+        """Constructor for class Metrics."""
+
+        self.histograms = {}
+        self._lock      = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything measured so far.
+
+        Returns:
+            None"""
+
+        with self._lock:
+            for histogram in self.histograms.values():
+                histogram.reset()
+            for name in ('interval', 'decode', 'write'):
+                self.histograms.setdefault(name, Histogram())
+            self._interval = self.histograms['interval']
+            self._decode   = self.histograms['decode']
+            self._write    = self.histograms['write']
+            self._start    = _now()
+            self._reports        = 0
+            self._bytes          = 0
+            self._writes         = 0
+            self._written        = 0
+            self._write_failures = 0
+            self._last_read      = None
+            self._last_decode    = None
+            self._last_write     = None
+
+    def instrument(self, hid=hidapi):
+        """Return a stand-in for the hidapi module which measures reads
+        and writes.
+
+        Arguments:
+            hid: Module to instrument. Defaults to the hidapi module.
+
+        Returns:
+            An object providing the same functions as hid."""
+
+        return _InstrumentedHid(self, hid)
+
+    def read(self, num, now=None):
+        """Account for the return of a read.
+
+        Arguments:
+            num: Number of bytes read; reads which timed out (0) are not
+                 counted.
+
+            now: Time the read returned. Defaults to now.
+
+        Returns:
+            None"""
+
+        if num <= 0:
+            return
+        if now is None:
+            now = _now()
+        if self._last_read is not None:
+            self._interval.add(now - self._last_read)
+        self._last_read = now
+        self._reports  += 1
+        self._bytes    += num
+
+    def decoded(self, timestamp, now=None):
+        """Account for the end of decoding a report.
+
+        Arguments:
+            timestamp: Time the report was read, as stored by the reader.
+
+            now:       Time decoding ended. Defaults to now.
+
+        Returns:
+            None"""
+
+        if now is None:
+            now = _now()
+        self._decode.add(now - timestamp)
+        self._last_decode = now
+
+    def written(self, num, start, now=None, count=1):
+        """Account for the completion of a write. May be called from
+        several threads.
+
+        Arguments:
+            num:   Number of bytes written, or -1 if the write failed.
+
+            start: Time the write was started.
+
+            now:   Time the write completed. Defaults to now.
+
+            count: Number of reports written by the call, whose time is
+                   shared between them.
+
+        Returns:
+            None"""
+
+        if now is None:
+            now = _now()
+        with self._lock:
+            if num < 0:
+                self._write_failures += 1
+            else:
+                self._writes  += 1
+                self._written += num
+            self._write.add((now - start) / count)
+            self._last_write = now
+
+    def latency(self, name, seconds):
+        """Add a latency to a histogram, which is created on first use.
+
+        Arguments:
+            name:    Name of the histogram.
+
+            seconds: Latency in seconds.
+
+        Returns:
+            None"""
+
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        histogram.add(seconds)
+
+    def snapshot(self):
+        """Return everything measured so far.
+
+        Returns:
+            Dict with the keys 'elapsed' (seconds since the last reset),
+            'reports', 'bytes', 'reports_per_sec', 'bytes_per_sec',
+            'writes', 'bytes_written', 'write_failures', 'last_read',
+            'last_decode', 'last_write' (monotonic times, or None) and
+            'histograms' (a dict of Histogram snapshots by name)."""
+
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        """Return everything measured so far. For internal use only; the
+        caller holds the lock."""
+
+        elapsed = _now() - self._start
+        return {'elapsed':         elapsed,
+                'reports':         self._reports,
+                'bytes':           self._bytes,
+                'reports_per_sec': self._reports / elapsed if elapsed > 0 else 0.0,
+                'bytes_per_sec':   self._bytes / elapsed if elapsed > 0 else 0.0,
+                'writes':          self._writes,
+                'bytes_written':   self._written,
+                'write_failures':  self._write_failures,
+                'last_read':       self._last_read,
+                'last_decode':     self._last_decode,
+                'last_write':      self._last_write,
+                'histograms':      dict((name, histogram.snapshot())
+                                        for name, histogram in self.histograms.items())}
+
+    def dump(self, stream=None):
+        """Write a snapshot to a stream as one line of JSON.
+
+        Arguments:
+            stream: File object to write to. Defaults to sys.stderr.
+
+        Returns:
+            None"""
+
+        if stream is None:
+            stream = sys.stderr
+        stream.write(json.dumps(self.snapshot(), sort_keys=True) + '\n')
+        stream.flush()
+
+    def dump_on_signal(self, signum=None, stream=None):
+        """Dump a snapshot whenever the process receives a signal.
+
+        This must be called from the main thread.
+
+        Arguments:
+            signum: Signal number. Defaults to SIGUSR1.
+
+            stream: File object to write to. Defaults to sys.stderr.
+
+        Returns:
+            The previous handler of the signal."""
+
+        if signum is None:
+            signum = signal.SIGUSR1
+        return signal.signal(signum, lambda signum, frame: self.dump(stream))
@@ -0,0 +1,318 @@
+"""Translation of pad events into MIDI bytes.
+
+A PadMidi turns the PadEvents of a PadChangeDetector into raw MIDI
+messages: a press becomes a note-on, a pressure change a polyphonic
+aftertouch message and a release a note-off. A strike of an
+OnsetDetector becomes a note-on too, with the strike's velocity. The
+velocity and the aftertouch pressure of every possible 12-bit pad
+pressure, and the note of every pad, are computed once into lookup
+tables, so translating an event only indexes tables.
+
+The messages are written to a sink as soon as they are translated:
+
+    MidiSink        a file, a named pipe or a raw MIDI device node,
+                    eg: /dev/snd/midiC1D0
+    AlsaRawMidiSink an ALSA rawmidi port through libasound, eg: the
+                    'virtual' port, which other programs can connect to
+
+Public classes defined by this module:
+
+    AlsaRawMidiSink
+    MidiSink
+    PadMidi
+
+Public functions defined by this module:
+
+    open_sink(target)
+    velocity_curve(curve='linear', minimum=1, maximum=127, floor=0, ceiling=4095)
+"""
+
+from __future__ import absolute_import, division
+
+import os
+from ctypes import CDLL, POINTER, byref, c_char_p, c_int, c_size_t, c_ssize_t, c_void_p
+
+from .pads import PAD_COUNT, PAD_PRESS, PAD_PRESSURE, PAD_RELEASE, PAD_STRIKE
+
+NOTE_OFF   = 0x80
+NOTE_ON    = 0x90
+AFTERTOUCH = 0xa0
+
+# Notes of pads 0 to 15: the General MIDI drum map from C1 (bass drum).
+DEFAULT_NOTES = tuple(range(36, 36 + PAD_COUNT))
+
+# Named velocity curves and their exponents.
+CURVES = {'linear': 1.0, 'soft': 0.5, 'hard': 2.0}
+
+_PRESSURES = 4096                       # 12-bit pad pressures
+
+
+def velocity_curve(curve='linear', minimum=1, maximum=127, floor=0, ceiling=_PRESSURES - 1):
+    """Compute the MIDI value of every pad pressure.
+
+    Pressures up to floor map to minimum, pressures from ceiling up map
+    to maximum, and those in between follow the curve.
+
+    Arguments:
+        curve:   Name from CURVES, an exponent (below 1 makes soft hits
+                 louder, above 1 quieter), or a function mapping 0.0-1.0
+                 to 0.0-1.0.
+
+        minimum: Smallest value, 0 to 127. Note-on velocities should not
+                 be 0, which means note-off.
+
+        maximum: Largest value, 0 to 127.
+
+        floor:   Highest pressure which maps to minimum.
+
+        ceiling: Lowest pressure which maps to maximum.
+
+    Returns:
+        bytearray of 4096 values, indexed by pressure."""
+
+    shape = CURVES.get(curve, curve)
+    if not callable(shape):
+        exponent = float(shape)
+        shape    = lambda x: x ** exponent
+    span  = max(ceiling - floor, 1)
+    table = bytearray(_PRESSURES)
+    for pressure in range(_PRESSURES):
+        x = min(max((pressure - floor) / span, 0.0), 1.0)
+        table[pressure] = int(round(minimum + (maximum - minimum) * shape(x)))
+    return table
+
+
+class PadMidi(object):
+    """Translates pad events into MIDI messages.
+
+    Attributes:
+        sounding: List of the notes which have been switched on and not
+                  yet off."""
+
+    def __init__(self, notes=DEFAULT_NOTES, channel=0, velocity=None,
+                 aftertouch=None):
+        """Constructor for class PadMidi.
+
+        Arguments:
+            notes:      Sequence of the 16 notes played by the pads.
+
+            channel:    MIDI channel, 0 to 15.
+
+            velocity:   Table of 4096 note-on velocities as returned by
+                        velocity_curve(). Defaults to the linear curve.
+
+            aftertouch: Table of 4096 aftertouch pressures, or False to
+                        send no aftertouch. Defaults to the linear curve
+                        from 0."""
+
+        if len(notes) != PAD_COUNT:
+            raise ValueError('A note is needed for each of the %d pads.' % PAD_COUNT)
+        if velocity is None:
+            velocity = velocity_curve()
+        if aftertouch is None:
+            aftertouch = velocity_curve(minimum=0)
+
+        self.sounding    = []
+        self._notes      = bytearray(notes)
+        self._velocity   = bytearray(velocity)
+        self._aftertouch = bytearray(aftertouch) if aftertouch is not False else None
+        self._note_on    = NOTE_ON | channel
+        self._note_off   = NOTE_OFF | channel
+        self._poly       = AFTERTOUCH | channel
+        self._playing    = [None] * PAD_COUNT     # note sounding per pad
+        self._last       = bytearray(PAD_COUNT)   # last aftertouch sent per pad
+
+    def translate(self, events, out=None):
+        """Translate pad events into MIDI messages.
+
+        Arguments:
+            events: Iterable of PadEvent.
+
+            out:    bytearray to append the messages to. Defaults to a
+                    new one.
+
+        Returns:
+            The bytearray holding the messages."""
+
+        if out is None:
+            out = bytearray()
+        playing = self._playing
+        for event in events:
+            pad  = event.pad
+            kind = event.kind
+            if kind == PAD_PRESSURE:
+                note = playing[pad]
+                if note is None or self._aftertouch is None:
+                    continue
+                value = self._aftertouch[event.value]
+                if value != self._last[pad]:
+                    self._last[pad] = value
+                    out.extend((self._poly, note, value))
+            elif kind == PAD_PRESS or kind == PAD_STRIKE:
+                note = self._notes[pad]
+                if playing[pad] is not None:
+                    out.extend((self._note_off, playing[pad], 0))
+                    self.sounding.remove(playing[pad])
+                playing[pad] = note
+                self.sounding.append(note)
+                self._last[pad] = 0
+                out.extend((self._note_on, note, self._velocity[event.value]))
+            elif kind == PAD_RELEASE:
+                note = playing[pad]
+                if note is not None:
+                    playing[pad] = None
+                    self.sounding.remove(note)
+                    out.extend((self._note_off, note, 0))
+        return out
+
+    def all_notes_off(self, out=None):
+        """Switch off every sounding note.
+
+        Arguments:
+            out: bytearray to append the messages to. Defaults to a new one.
+
+        Returns:
+            The bytearray holding the note-off messages."""
+
+        if out is None:
+            out = bytearray()
+        for pad, note in enumerate(self._playing):
+            if note is not None:
+                out.extend((self._note_off, note, 0))
+                self._playing[pad] = None
+        del self.sounding[:]
+        return out
+
+
+class MidiSink(object):
+    """Writes raw MIDI bytes to a file descriptor, without buffering."""
+
+    def __init__(self, target):
+        """Constructor for class MidiSink.
+
+        Arguments:
+            target: Path name of a file, named pipe or raw MIDI device to
+                    open for writing (regular files are appended to), or
+                    an open file descriptor, which is not closed by
+                    close(). Opening a named pipe waits for a reader."""
+
+        if isinstance(target, int):
+            self._fd    = target
+            self._owned = False
+        else:
+            self._fd    = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self._owned = True
+
+    def fileno(self):
+        """Return the file descriptor written to."""
+
+        return self._fd
+
+    def write(self, data):
+        """Write MIDI bytes.
+
+        Arguments:
+            data: bytes or bytearray holding whole MIDI messages.
+
+        Returns:
+            None"""
+
+        view = memoryview(data)
+        while len(view):
+            view = view[os.write(self._fd, view):]
+
+    def close(self):
+        """Close the file descriptor, if it was opened by the sink.
+
+        Returns:
+            None"""
+
+        if self._owned and self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AlsaRawMidiSink(object):
+    """Writes raw MIDI bytes to an ALSA rawmidi port.
+
+    This needs the ALSA library (libasound)."""
+
+    def __init__(self, name='virtual'):
+        """Constructor for class AlsaRawMidiSink.
+
+        Arguments:
+            name: ALSA rawmidi device name, eg: 'hw:1,0,0', or 'virtual'
+                  for a port other programs can connect to.
+
+        Raises RuntimeError exception if libasound cannot be found or the
+        port cannot be opened."""
+
+        # Only imported when needed: importing ctypes.util is slow.
+        from ctypes.util import find_library
+        path = find_library('asound')
+        if path is None:
+            raise RuntimeError('Could not find the ALSA shared library.')
+        self._alsa = CDLL(path)
+        self._alsa.snd_rawmidi_open.argtypes  = [c_void_p, POINTER(c_void_p), c_char_p, c_int]
+        self._alsa.snd_rawmidi_write.argtypes = [c_void_p, c_char_p, c_size_t]
+        self._alsa.snd_rawmidi_write.restype  = c_ssize_t
+        self._alsa.snd_rawmidi_close.argtypes = [c_void_p]
+
+        self._handle = c_void_p()
+        if self._alsa.snd_rawmidi_open(None, byref(self._handle), name.encode('ascii'), 0) < 0:
+            raise RuntimeError('Could not open ALSA rawmidi port %r.' % (name,))
+
+    def write(self, data):
+        """Write MIDI bytes.
+
+        Arguments:
+            data: bytes or bytearray holding whole MIDI messages.
+
+        Returns:
+            None
+            Raises RuntimeError exception if the write fails."""
+
+        data = bytes(data)
+        if self._alsa.snd_rawmidi_write(self._handle, data, len(data)) != len(data):
+            raise RuntimeError('Writing to the ALSA rawmidi port failed.')
+
+    def close(self):
+        """Close the port.
+
+        Returns:
+            None"""
+
+        if self._handle:
+            self._alsa.snd_rawmidi_close(self._handle)
+            self._handle = c_void_p()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_sink(target):
+    """Open a MIDI sink.
+
+    Arguments:
+        target: 'alsa:' followed by an ALSA rawmidi device name (eg:
+                'alsa:virtual') for an AlsaRawMidiSink, '-' for standard
+                output, or the path name of a file, named pipe or raw
+                MIDI device for a MidiSink.
+
+    Returns:
+        The sink."""
+
+    if target.startswith('alsa:'):
+        return AlsaRawMidiSink(target[len('alsa:'):])
+    if target == '-':
+        return MidiSink(1)
+    return MidiSink(target)
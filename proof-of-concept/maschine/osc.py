@@ -0,0 +1,434 @@
+"""Streaming of events over UDP as OSC, and remote control of the outputs.
+
+An OscSender sends pad, button and encoder events to another process,
+possibly on another host, as Open Sound Control messages:
+
+    <prefix>/pad      ,isi   pad, kind ('press', 'release', 'pressure'), value
+    <prefix>/button   ,si    name, 1 (down) or 0 (up)
+    <prefix>/encoder  ,si    name, signed number of steps
+
+Events passed to the sender within a window of time of each other are
+coalesced into one datagram holding an OSC bundle, so 16 pads changing
+in the same report cost one packet, not 16.
+
+An OscReceiver takes commands the other way and applies them to an
+LedManager and to display FrameBuffers:
+
+    <prefix>/led        ,si    LED name (or ,ii index into BUTTON_LEDS), value
+    <prefix>/pad_rgb    ,iiii  pad, r, g, b
+    <prefix>/group_rgb  ,iiii  group, r, g, b (and optionally i half,
+                               0 or 1)
+    <prefix>/display    ,ib    display number, 2048 byte image
+    <prefix>/row        ,iib   display number, row, packed pixels
+                               (and optionally i byte column)
+    <prefix>/fill       ,ii    display number, 0 (clear) or 1 (set)
+
+A command with arguments out of range (eg: group 9, or half 2) is
+dropped and counted as an error, and the rest of its datagram is still
+applied.
+
+Both work over localhost as well as across the network. Blob arguments
+are passed as bytearrays; strings are decoded on Python 3.
+
+Public classes defined by this module:
+
+    OscReceiver
+    OscSender
+
+Public functions defined by this module:
+
+    decode_packet(data)
+    encode_bundle(messages, timetag=1)
+    encode_message(address, args)
+"""
+
+from __future__ import absolute_import, division
+
+import errno
+import socket
+import struct
+import time
+
+from .buttons import ENCODER
+from .display import HEIGHT, ROW_BYTES
+from .pads import PadEvent
+
+# Monotonic clock used for the coalescing window, where available.
+_now = getattr(time, 'monotonic', time.time)
+
+try:
+    _TEXT = (str, unicode)
+except NameError:
+    _TEXT = (str,)
+
+_BUNDLE    = b'#bundle\0'
+_INT       = struct.Struct('>i')
+_FLOAT     = struct.Struct('>f')
+_TIMETAG   = struct.Struct('>Q')
+_MAX_DATAGRAM = 1472                    # fits an Ethernet frame
+
+
+def _pad(data):
+    """Return data NUL terminated and padded to a multiple of 4 bytes.
+    For internal use only."""
+
+    return data + b'\0' * (4 - len(data) % 4)
+
+
+def encode_message(address, args):
+    """Encode an OSC message.
+
+    Arguments:
+        address: OSC address pattern, eg: '/maschine/pad'.
+
+        args:    Sequence of arguments: ints, floats, strings, and
+                 bytearrays for blobs.
+
+    Returns:
+        bytearray holding the message."""
+
+    tags = [b',']
+    data = bytearray()
+    for arg in args:
+        if isinstance(arg, bool) or arg is None:
+            tags.append({True: b'T', False: b'F', None: b'N'}[arg])
+        elif isinstance(arg, float):
+            tags.append(b'f')
+            data += _FLOAT.pack(arg)
+        elif isinstance(arg, _TEXT):
+            tags.append(b's')
+            data += _pad(arg.encode('utf-8') if not isinstance(arg, bytes) else arg)
+        elif isinstance(arg, (bytes, bytearray)):
+            tags.append(b'b')
+            data += _INT.pack(len(arg)) + bytes(arg) + b'\0' * (-len(arg) % 4)
+        else:
+            tags.append(b'i')
+            data += _INT.pack(arg)
+    message = bytearray(_pad(address.encode('ascii')))
+    message += _pad(b''.join(tags))
+    message += data
+    return message
+
+
+def encode_bundle(messages, timetag=1):
+    """Encode an OSC bundle.
+
+    Arguments:
+        messages: Sequence of encoded messages (or bundles).
+
+        timetag:  OSC time tag; the default of 1 means immediately.
+
+    Returns:
+        bytearray holding the bundle."""
+
+    bundle = bytearray(_BUNDLE)
+    bundle += _TIMETAG.pack(timetag)
+    for message in messages:
+        bundle += _INT.pack(len(message))
+        bundle += message
+    return bundle
+
+
+def _string(data, offset):
+    """Decode an OSC string at offset. For internal use only."""
+
+    end = data.index(b'\0', offset)
+    return bytes(data[offset:end]), (end + 4) & ~3
+
+
+def decode_packet(data):
+    """Decode an OSC packet.
+
+    Arguments:
+        data: bytes or bytearray holding a message or a bundle.
+
+    Returns:
+        List of (address, args) tuples, with the messages of bundles
+        (and nested bundles) in order.
+        Raises ValueError exception if the packet is malformed."""
+
+    data = bytearray(data)
+    try:
+        if data[:8] == _BUNDLE:
+            messages = []
+            offset   = 16
+            while offset < len(data):
+                size, = _INT.unpack_from(data, offset)
+                offset += 4
+                if size < 0 or offset + size > len(data):
+                    raise ValueError('Truncated OSC bundle element.')
+                messages.extend(decode_packet(data[offset:offset + size]))
+                offset += size
+            return messages
+
+        address, offset = _string(data, 0)
+        if not address.startswith(b'/'):
+            raise ValueError('Not an OSC message.')
+        tags, offset = _string(data, offset)
+        if not tags.startswith(b','):
+            raise ValueError('Missing OSC type tags.')
+        args = []
+        for tag in bytearray(tags[1:]):
+            tag = chr(tag)
+            if tag == 'i':
+                args.append(_INT.unpack_from(data, offset)[0])
+                offset += 4
+            elif tag == 'f':
+                args.append(_FLOAT.unpack_from(data, offset)[0])
+                offset += 4
+            elif tag == 's':
+                value, offset = _string(data, offset)
+                args.append(value if bytes is str else value.decode('utf-8'))
+            elif tag == 'b':
+                size, = _INT.unpack_from(data, offset)
+                offset += 4
+                if offset + size > len(data):
+                    raise ValueError('Truncated OSC blob.')
+                args.append(data[offset:offset + size])
+                offset += (size + 3) & ~3
+            elif tag in 'TFN':
+                args.append({'T': True, 'F': False, 'N': None}[tag])
+            else:
+                raise ValueError('Unsupported OSC type tag %r.' % tag)
+    except (struct.error, IndexError) as e:
+        raise ValueError('Malformed OSC packet: %s' % e)
+    return [(address if bytes is str else address.decode('ascii'), args)]
+
+
+class OscSender(object):
+    """Sends events as OSC messages in coalesced UDP datagrams.
+
+    Attributes:
+        window:    Longest time in seconds an event waits for others to
+                   share its datagram. 0 sends each batch of events
+                   passed to send() at once.
+        datagrams: Number of datagrams sent.
+        messages:  Number of messages sent."""
+
+    def __init__(self, address, window=0.002, prefix='/maschine', sock=None):
+        """Constructor for class OscSender.
+
+        Arguments:
+            address: (host, port) to send to.
+
+            window:  Coalescing window in seconds.
+
+            prefix:  Prefix of the OSC addresses.
+
+            sock:    UDP socket to send from. By default a new one is
+                     created."""
+
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.window    = window
+        self.datagrams = 0
+        self.messages  = 0
+        self._address  = address
+        self._socket   = sock
+        self._pad      = prefix + '/pad'
+        self._button   = prefix + '/button'
+        self._encoder  = prefix + '/encoder'
+        self._pending  = []
+        self._size     = 16                 # bundle header
+        self._deadline = None
+
+    def encode(self, event):
+        """Encode a PadEvent or ButtonEvent as an OSC message.
+
+        Returns:
+            bytearray holding the message."""
+
+        if isinstance(event, PadEvent):
+            return encode_message(self._pad, (event.pad, event.kind, event.value))
+        if event.kind == ENCODER:
+            return encode_message(self._encoder, (event.name, event.value))
+        return encode_message(self._button, (event.name, event.value))
+
+    def send(self, events, now=None):
+        """Queue events, and send them when the window has passed.
+
+        Arguments:
+            events: Iterable of PadEvent and ButtonEvent.
+
+            now:    Current time, from the same clock as the reader's
+                    report timestamps, if the caller already has it.
+
+        Returns:
+            Number of datagrams sent."""
+
+        sent = 0
+        for event in events:
+            message = self.encode(event)
+            if self._size + 4 + len(message) > _MAX_DATAGRAM and self._pending:
+                sent += self.flush()
+            self._pending.append(message)
+            self._size += 4 + len(message)
+        if self._pending and self._deadline is None:
+            self._deadline = (_now() if now is None else now) + self.window
+        return sent + self.poll(now)
+
+    def timeout(self, now=None):
+        """Return the time in seconds until queued events are due to be
+        sent, for use as a timeout of the caller's wait, or None if no
+        events are queued."""
+
+        if self._deadline is None:
+            return None
+        return max(self._deadline - (_now() if now is None else now), 0.0)
+
+    def poll(self, now=None):
+        """Send the queued events if their window has passed.
+
+        Call this from the program's main loop, at least as often as
+        timeout() says.
+
+        Returns:
+            Number of datagrams sent."""
+
+        if self._deadline is None:
+            return 0
+        if (_now() if now is None else now) < self._deadline:
+            return 0
+        return self.flush()
+
+    def flush(self):
+        """Send the queued events now.
+
+        Returns:
+            Number of datagrams sent."""
+
+        if not self._pending:
+            return 0
+        if len(self._pending) == 1:
+            packet = self._pending[0]
+        else:
+            packet = encode_bundle(self._pending)
+        self._socket.sendto(packet, self._address)
+        self.messages += len(self._pending)
+        self.datagrams += 1
+        self._pending  = []
+        self._size     = 16
+        self._deadline = None
+        return 1
+
+    def close(self):
+        """Send the queued events and close the socket.
+
+        Returns:
+            None"""
+
+        self.flush()
+        self._socket.close()
+
+
+class OscReceiver(object):
+    """Applies OSC commands received over UDP to LEDs and displays.
+
+    Attributes:
+        received: Number of commands applied.
+        errors:   Number of datagrams or commands which were malformed or
+                  not understood, and ignored."""
+
+    def __init__(self, address, leds=None, displays=(), prefix='/maschine'):
+        """Constructor for class OscReceiver.
+
+        Arguments:
+            address:  (host, port) to receive on; port 0 picks a free
+                      port, see address().
+
+            leds:     LedManager to apply LED commands to, or None.
+
+            displays: Sequence of FrameBuffers, indexed by display
+                      number, to apply display commands to.
+
+            prefix:   Prefix of the OSC addresses."""
+
+        self.received = 0
+        self.errors   = 0
+        self._leds     = leds
+        self._displays = displays
+        self._socket   = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(address)
+        self._socket.setblocking(False)
+        self._commands = {prefix + '/led':       self._led,
+                          prefix + '/pad_rgb':   self._pad_rgb,
+                          prefix + '/group_rgb': self._group_rgb,
+                          prefix + '/display':   self._display,
+                          prefix + '/row':       self._row,
+                          prefix + '/fill':      self._fill}
+
+    def address(self):
+        """Return the (host, port) the receiver is bound to."""
+
+        return self._socket.getsockname()
+
+    def fileno(self):
+        """Return the file descriptor of the socket, to wait on with
+        select() or poll()."""
+
+        return self._socket.fileno()
+
+    def poll(self):
+        """Apply the commands of all the datagrams received so far.
+
+        Returns:
+            Number of commands applied."""
+
+        applied = 0
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            try:
+                messages = decode_packet(data)
+            except ValueError:
+                self.errors += 1
+                continue
+            for address, args in messages:
+                command = self._commands.get(address)
+                try:
+                    if command is None:
+                        raise ValueError('Unknown command.')
+                    command(*args)
+                except (TypeError, ValueError, KeyError, IndexError, AttributeError):
+                    self.errors += 1
+                else:
+                    applied += 1
+        self.received += applied
+        return applied
+
+    def close(self):
+        """Close the socket.
+
+        Returns:
+            None"""
+
+        self._socket.close()
+
+    def _led(self, name, value):
+        self._leds.set_led(name, value)
+
+    def _pad_rgb(self, pad, r, g, b):
+        self._leds.set_pad_rgb(pad, r, g, b)
+
+    def _group_rgb(self, group, r, g, b, half=None):
+        self._leds.set_group_rgb(group, r, g, b, half)
+
+    def _framebuffer(self, display_no):
+        if not 0 <= display_no < len(self._displays):
+            raise IndexError('No display %d.' % display_no)
+        return self._displays[display_no]
+
+    def _display(self, display_no, data):
+        self._framebuffer(display_no).load(data)
+
+    def _row(self, display_no, y, data, x_byte=0):
+        if not 0 <= y < HEIGHT or not 0 <= x_byte < ROW_BYTES:
+            raise IndexError('Row or column out of range.')
+        self._framebuffer(display_no).set_row(y, data, x_byte)
+
+    def _fill(self, display_no, on):
+        self._framebuffer(display_no).fill(bool(on))
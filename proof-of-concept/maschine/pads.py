@@ -0,0 +1,367 @@
+"""Decoding of the pad pressure reports.
+
+The Maschine MK2 sends the pressure of its 16 pads in input reports
+with report ID 0x20. After the report ID come 32 little-endian 16-bit
+words, two samples for each pad. The high nibble of each word is the
+pad index and the low 12 bits are the pressure, so an idle controller
+sends:
+
+    20 0000 0010 0020 ... 00f0 0000 0010 0020 ... 00f0
+
+The functions in this module decode whole reports, or batches of them,
+with NumPy array operations instead of per-byte Python code, and
+PadChangeDetector reduces the decoded pressures to per-pad events.
+OnsetDetector finds the strikes of the pads as they happen, with a
+velocity taken from how fast the pressure rises.
+
+This module requires NumPy.
+
+Public classes defined by this module:
+
+    OnsetDetector
+    PadChangeDetector
+    PadEvent
+
+Public functions defined by this module:
+
+    decode_pads(reports, out=None)
+    report_array(reports)
+"""
+
+from __future__ import absolute_import
+
+import collections
+
+import numpy
+
+PAD_REPORT_ID   = 0x20
+PAD_COUNT       = 16
+PAD_REPORT_SIZE = 65                    # report ID + 32 words
+
+
+def report_array(reports):
+    """Return reports as a 2-D uint8 array with one report per row.
+
+    Arguments:
+        reports: A single report (a bytearray or any other buffer), a
+                 sequence of reports of equal length, or a 2-D uint8
+                 array of reports.
+
+    Returns:
+        2-D uint8 NumPy array of shape (N, report length). It shares
+        memory with reports where possible."""
+
+    if isinstance(reports, numpy.ndarray):
+        if reports.ndim == 1:
+            return reports.reshape(1, -1)
+        return reports
+    if isinstance(reports, (list, tuple)):
+        if not reports:
+            return numpy.zeros((0, PAD_REPORT_SIZE), dtype=numpy.uint8)
+        length = len(reports[0])
+        data   = numpy.frombuffer(bytearray().join(reports),
+                                  dtype=numpy.uint8)
+        return data.reshape(-1, length)
+    return numpy.frombuffer(reports, dtype=numpy.uint8).reshape(1, -1)
+
+
+def decode_pads(reports, out=None):
+    """Decode the pad pressures from 0x20 reports.
+
+    Where a report holds two samples for a pad, the later one is used.
+
+    Arguments:
+        reports: A single report, a sequence of reports or a 2-D uint8
+                 array of reports, as accepted by report_array(). Every
+                 report must start with report ID 0x20.
+
+        out:     Optional uint16 array of shape (N, 16) to store the
+                 result in.
+
+    Returns:
+        uint16 NumPy array of shape (N, 16) holding the 12-bit pressure
+        of each pad, indexed by pad number.
+        Raises ValueError exception if a report is not a pad report."""
+
+    raw = report_array(reports)
+    if raw.shape[1] < PAD_REPORT_SIZE:
+        raise ValueError('Pad reports must be at least %d bytes long.'
+                         % PAD_REPORT_SIZE)
+    if (raw[:, 0] != PAD_REPORT_ID).any():
+        raise ValueError('Not a pad report.')
+
+    count = raw.shape[0]
+    if out is None:
+        out = numpy.zeros((count, PAD_COUNT), dtype=numpy.uint16)
+
+    lo    = raw[:, 1:PAD_REPORT_SIZE:2]
+    hi    = raw[:, 2:PAD_REPORT_SIZE:2]
+    pads  = hi >> 4
+    value = ((hi & 0x0f).astype(numpy.uint16) << 8) | lo
+    rows  = numpy.arange(count)[:, None]
+
+    # Scatter each half separately so the second sample of a pad wins.
+    out[rows, pads[:, :PAD_COUNT]] = value[:, :PAD_COUNT]
+    out[rows, pads[:, PAD_COUNT:]] = value[:, PAD_COUNT:]
+    return out
+
+
+class PadEvent(collections.namedtuple('PadEvent', 'kind pad value timestamp')):
+    """A pad event reported by PadChangeDetector.
+
+    Fields:
+        kind:      PAD_PRESS, PAD_RELEASE, PAD_PRESSURE or PAD_STRIKE.
+        pad:       Pad number, 0 to 15.
+        value:     Pressure of the pad, or for PAD_STRIKE the velocity,
+                   on the same 0 to 4095 scale.
+        timestamp: Timestamp of the report the event came from."""
+
+    __slots__ = ()
+
+
+PAD_PRESS    = 'press'
+PAD_RELEASE  = 'release'
+PAD_PRESSURE = 'pressure'
+PAD_STRIKE   = 'strike'
+
+
+class PadChangeDetector(object):
+    """Turns successive pad pressures into press, release and pressure
+    change events.
+
+    A pad is pressed when its pressure reaches press_threshold, and
+    released when it falls below release_threshold again. While it is
+    pressed, a pressure change is reported each time the pressure has
+    moved by at least change_threshold from the last reported value, so
+    ADC noise on a pad does not produce events. Each threshold may be a
+    single value or a sequence of 16, one per pad.
+
+    The comparison is done for all pads at once; Python code only runs
+    for the pads which produce an event."""
+
+    def __init__(self, press_threshold=256, release_threshold=128,
+                 change_threshold=64):
+        """Constructor for class PadChangeDetector.
+
+        Arguments:
+            press_threshold:   Pressure at which a pad counts as pressed.
+
+            release_threshold: Pressure below which a pressed pad counts
+                               as released.
+
+            change_threshold:  Smallest change in pressure of a pressed
+                               pad which is reported."""
+
+        self.press_threshold   = numpy.asarray(press_threshold, dtype=numpy.int32)
+        self.release_threshold = numpy.asarray(release_threshold, dtype=numpy.int32)
+        self.change_threshold  = numpy.asarray(change_threshold, dtype=numpy.int32)
+        self.reset()
+
+    def reset(self):
+        """Forget the state of all pads.
+
+        Returns:
+            None"""
+
+        self._last    = numpy.zeros(PAD_COUNT, dtype=numpy.int32)
+        self._pressed = numpy.zeros(PAD_COUNT, dtype=bool)
+
+    def update(self, pressures, timestamp=None):
+        """Compare one set of pad pressures with the previous state.
+
+        Arguments:
+            pressures: Sequence or array of the 16 pad pressures, such as
+                       a row returned by decode_pads().
+
+            timestamp: Timestamp to put in the events.
+
+        Returns:
+            List of PadEvent, in pad order. Empty if nothing changed."""
+
+        value   = numpy.asarray(pressures, dtype=numpy.int32)
+        pressed = self._pressed
+        now     = numpy.where(pressed, value >= self.release_threshold,
+                              value >= self.press_threshold)
+        moved   = numpy.abs(value - self._last) >= self.change_threshold
+        changed = (now != pressed) | (now & moved)
+
+        events = []
+        for pad in numpy.flatnonzero(changed):
+            if not pressed[pad]:
+                kind = PAD_PRESS
+            elif not now[pad]:
+                kind = PAD_RELEASE
+            else:
+                kind = PAD_PRESSURE
+            events.append(PadEvent(kind, int(pad), int(value[pad]), timestamp))
+
+        self._last[changed] = value[changed]
+        self._pressed = now
+        return events
+
+    def process(self, reports, timestamps=None):
+        """Decode a batch of 0x20 reports and return their events.
+
+        Arguments:
+            reports:    Reports as accepted by decode_pads().
+
+            timestamps: Optional sequence with one timestamp per report.
+
+        Returns:
+            List of PadEvent for all the reports, in order."""
+
+        pressures = decode_pads(reports)
+        events    = []
+        for n in range(pressures.shape[0]):
+            timestamp = timestamps[n] if timestamps is not None else None
+            events.extend(self.update(pressures[n], timestamp))
+        return events
+
+
+class OnsetDetector(object):
+    """Detects the strikes of the pads and their velocity.
+
+    The pads report pressure, not velocity. A strike is a fast rise of
+    the pressure of a pad: an onset is detected in the report where the
+    pad's pressure has reached threshold and risen by at least
+    slope_threshold over the last window reports. The velocity is the
+    steepest rise over window reports seen from the onset on, for
+    lookahead more reports or until the pressure stops rising,
+    whichever comes first; a rise of max_slope or more gives the full
+    velocity of 4095. So a strike is reported in the onset report
+    itself with a lookahead of 0, or up to lookahead reports later with
+    a better view of the peak. A pad which struck is released, and can
+    strike again, once its pressure fell below release_threshold; the
+    release is reported too, so that the detector alone can start and
+    stop notes.
+
+    The last window + 1 pressures of every pad are kept in a fixed-size
+    ring, and every array the detector uses is allocated once, so
+    update() allocates nothing unless it returns events."""
+
+    def __init__(self, threshold=64, release_threshold=32, slope_threshold=48,
+                 lookahead=1, window=1, max_slope=1024):
+        """Constructor for class OnsetDetector.
+
+        Arguments:
+            threshold:         Pressure a pad must reach to strike.
+
+            release_threshold: Pressure below which a pad can strike again.
+
+            slope_threshold:   Smallest rise over window reports which
+                               makes an onset.
+
+            lookahead:         Greatest number of reports after the onset
+                               to wait for the steepest rise.
+
+            window:            Number of report intervals the rise is
+                               measured over; raise it if the reports come
+                               faster than the pressure changes.
+
+            max_slope:         Rise over window reports which gives the
+                               full velocity.
+
+        Each threshold may be a single value or a sequence of 16, one per
+        pad."""
+
+        self.threshold         = numpy.asarray(threshold, dtype=numpy.int32)
+        self.release_threshold = numpy.asarray(release_threshold, dtype=numpy.int32)
+        self.slope_threshold   = numpy.asarray(slope_threshold, dtype=numpy.int32)
+        self.lookahead = lookahead
+        self.window    = window
+        self.max_slope = max_slope
+
+        self._history   = numpy.zeros((window + 1, PAD_COUNT), dtype=numpy.int32)
+        self._slope     = numpy.zeros(PAD_COUNT, dtype=numpy.int32)
+        self._peak      = numpy.zeros(PAD_COUNT, dtype=numpy.int32)
+        self._countdown = numpy.zeros(PAD_COUNT, dtype=numpy.int32)
+        self._armed     = numpy.zeros(PAD_COUNT, dtype=bool)
+        self._down      = numpy.zeros(PAD_COUNT, dtype=bool)
+        self._pending   = numpy.zeros(PAD_COUNT, dtype=bool)
+        self._onset     = numpy.zeros(PAD_COUNT, dtype=bool)
+        self._emit      = numpy.zeros(PAD_COUNT, dtype=bool)
+        self._test      = numpy.zeros(PAD_COUNT, dtype=bool)
+        self.reset()
+
+    def reset(self):
+        """Forget the state of all pads.
+
+        Returns:
+            None"""
+
+        self._history.fill(0)
+        self._peak.fill(0)
+        self._countdown.fill(-1)            # -1: no strike pending
+        self._armed.fill(True)
+        self._down.fill(False)
+        self._index = 0
+
+    def update(self, pressures, timestamp=None):
+        """Take the next set of pad pressures.
+
+        Arguments:
+            pressures: Sequence or array of the 16 pad pressures, such as
+                       a row returned by decode_pads().
+
+            timestamp: Timestamp to put in the events.
+
+        Returns:
+            List of PadEvent: the PAD_STRIKE events in pad order, then the
+            PAD_RELEASE events in pad order, with the pressure as value.
+            Empty if no pad struck or was released."""
+
+        history = self._history
+        slope   = self._slope
+        peak    = self._peak
+        count   = self._countdown
+        armed   = self._armed
+        down    = self._down
+        pending = self._pending
+        onset   = self._onset
+        emit    = self._emit
+        test    = self._test
+
+        # The newest pressures replace the oldest in the ring; the row
+        # after them holds the pressures window reports ago.
+        self._index = index = (self._index + 1) % len(history)
+        value = history[index]
+        numpy.copyto(value, pressures, casting='unsafe')
+        numpy.subtract(value, history[(index + 1) % len(history)], out=slope)
+
+        # A new onset starts the lookahead of the pad.
+        numpy.greater_equal(value, self.threshold, out=onset)
+        numpy.logical_and(onset, armed, out=onset)
+        numpy.greater_equal(slope, self.slope_threshold, out=test)
+        numpy.logical_and(onset, test, out=onset)
+        if onset.any():
+            armed[onset] = False
+            count[onset] = self.lookahead
+            peak[onset]  = 0
+
+        # Pending strikes are reported when the lookahead is over or the
+        # pressure stopped rising.
+        numpy.greater_equal(count, 0, out=pending)
+        numpy.maximum(peak, slope, out=peak)
+        numpy.equal(count, 0, out=emit)
+        numpy.less_equal(slope, 0, out=test)
+        numpy.logical_or(emit, test, out=emit)
+        numpy.logical_and(emit, pending, out=emit)
+        numpy.subtract(count, pending, out=count, casting='unsafe')
+
+        events = []
+        if emit.any():
+            count[emit] = -1
+            down[emit]  = True
+            for pad in numpy.flatnonzero(emit):
+                velocity = min(max(int(peak[pad]) * 4095 // self.max_slope, 1), 4095)
+                events.append(PadEvent(PAD_STRIKE, int(pad), velocity, timestamp))
+
+        # A pad is released, and strikes again, once it has been let go.
+        numpy.less(value, self.release_threshold, out=test)
+        numpy.logical_or(armed, test, out=armed)
+        numpy.logical_and(down, test, out=emit)
+        if emit.any():
+            down[emit] = False
+            for pad in numpy.flatnonzero(emit):
+                events.append(PadEvent(PAD_RELEASE, int(pad), int(value[pad]), timestamp))
+        return events
@@ -0,0 +1,250 @@
+"""Background report reader with a fixed-size ring buffer.
+
+The Maschine sends its input reports continuously, so a program which
+reads them on the same thread that does its other work lets them pile
+up in the kernel whenever it is busy. A ReportReader reads the device on
+a dedicated thread and stores every report, with the time it arrived,
+in a ReportRing. The consumer then drains the ring in batches whenever
+it gets around to it.
+
+The blocking hid_read_timeout_into() call is made through ctypes, which
+releases the GIL for the duration of the call, so the reader thread does
+not hold up the rest of the program while it waits for the device.
+
+Public classes defined by this module:
+
+    ReportRing
+    ReportReader
+"""
+
+from __future__ import absolute_import
+
+import array
+import threading
+import time
+
+import hidapi
+
+# Monotonic clock used to timestamp reports, where available.
+_now = getattr(time, 'monotonic', time.time)
+
+
+class ReportRing(object):
+    """Fixed-size ring buffer of timestamped reports.
+
+    All storage is allocated up front: report data lives in one bytearray
+    with a slot of report_size bytes per entry, and report lengths and
+    timestamps in arrays beside it. When the ring is full, a new report
+    overwrites the oldest unread one and the overflows counter goes up.
+
+    Attributes:
+        capacity:    Number of reports the ring can hold.
+        report_size: Maximum size of a single report in bytes.
+        received:    Total number of reports pushed into the ring.
+        overflows:   Number of unread reports which were overwritten
+                     because the consumer fell behind.
+        high_water:  Largest number of unread reports seen at once."""
+
+    def __init__(self, capacity=1024, report_size=256):
+        """Constructor for class ReportRing.
+
+        Arguments:
+            capacity:    Number of reports the ring can hold.
+
+            report_size: Maximum size of a single report in bytes. Longer
+                         reports are truncated."""
+
+        if capacity < 1 or report_size < 1:
+            raise ValueError('capacity and report_size must be positive.')
+
+        self.capacity    = capacity
+        self.report_size = report_size
+        self.received    = 0
+        self.overflows   = 0
+        self.high_water  = 0
+
+        self._data    = bytearray(capacity * report_size)
+        self._view    = memoryview(self._data)
+        self._lengths = array.array('H', [0]) * capacity
+        self._times   = array.array('d', [0.0]) * capacity
+        self._head    = 0               # index of the next slot to write
+        self._count   = 0               # number of unread reports
+        self._cond    = threading.Condition(threading.Lock())
+
+    def __len__(self):
+        """Return the number of unread reports."""
+
+        return self._count
+
+    def push(self, data, length=None, timestamp=None):
+        """Store a report in the ring.
+
+        Arguments:
+            data:      A buffer containing the report.
+
+            length:    Number of bytes of data to store. Defaults to
+                       the whole of data.
+
+            timestamp: Arrival time of the report. Defaults to the
+                       current monotonic time.
+
+        Returns:
+            None"""
+
+        if length is None:
+            length = len(data)
+        if length > self.report_size:
+            length = self.report_size
+        if timestamp is None:
+            timestamp = _now()
+
+        with self._cond:
+            slot   = self._head
+            offset = slot * self.report_size
+            self._view[offset:offset + length] = memoryview(data)[:length]
+            self._lengths[slot] = length
+            self._times[slot]   = timestamp
+            self._head = (slot + 1) % self.capacity
+            self.received += 1
+            if self._count == self.capacity:
+                self.overflows += 1
+            else:
+                self._count += 1
+                if self._count > self.high_water:
+                    self.high_water = self._count
+            self._cond.notify()
+
+    def drain(self, max_reports=None, timeout=0):
+        """Remove unread reports from the ring, oldest first.
+
+        Arguments:
+            max_reports: Maximum number of reports to return, or None
+                         to return all of the unread reports.
+
+            timeout:     Seconds to wait for a report if the ring is
+                         empty, 0 to return immediately, or None to
+                         wait indefinitely.
+
+        Returns:
+            List of (timestamp, bytearray) tuples, which is empty if no
+            report arrived within the timeout."""
+
+        with self._cond:
+            if self._count == 0 and timeout != 0:
+                self._cond.wait(timeout)
+
+            count = self._count
+            if max_reports is not None and max_reports < count:
+                count = max_reports
+
+            size  = self.report_size
+            slot  = (self._head - self._count) % self.capacity
+            batch = []
+            for _ in range(count):
+                offset = slot * size
+                batch.append((self._times[slot],
+                              bytearray(self._view[offset:offset + self._lengths[slot]])))
+                slot = (slot + 1) % self.capacity
+            self._count -= count
+            return batch
+
+    def stats(self):
+        """Return a dict with the ring's counters.
+
+        Returns:
+            Dict with the keys 'capacity', 'pending', 'received',
+            'overflows' and 'high_water'."""
+
+        with self._cond:
+            return {'capacity':   self.capacity,
+                    'pending':    self._count,
+                    'received':   self.received,
+                    'overflows':  self.overflows,
+                    'high_water': self.high_water}
+
+
+class ReportReader(object):
+    """Reads reports from a HID device on a background thread.
+
+    Attributes:
+        ring:  The ReportRing the reports are stored in.
+        error: The exception which stopped the reader thread, or None."""
+
+    def __init__(self, device, ring=None, report_size=256, timeout_ms=100,
+                 hid=hidapi):
+        """Constructor for class ReportReader.
+
+        Arguments:
+            device:      A device handle returned by hid_open().
+
+            ring:        ReportRing to store reports in. By default a
+                         new ring holding 1024 reports is created.
+
+            report_size: Size of the read buffer in bytes.
+
+            timeout_ms:  Timeout of each read in milliseconds. This bounds
+                         how long stop() waits for the thread to notice.
+
+            hid:         Module providing hid_read_timeout_into(). Defaults
+                         to the hidapi module."""
+
+        if ring is None:
+            ring = ReportRing(report_size=report_size)
+
+        self.ring        = ring
+        self.error       = None
+        self._device     = device
+        self._hid        = hid
+        self._buffer     = bytearray(report_size)
+        self._c_buffer   = hidapi.hid_wrap_buffer(self._buffer)
+        self._timeout_ms = timeout_ms
+        self._running    = False
+        self._thread     = None
+
+    def start(self):
+        """Start the reader thread.
+
+        Returns:
+            None"""
+
+        if self._thread is not None:
+            raise RuntimeError('Reader already started.')
+        self._running = True
+        self._thread  = threading.Thread(target=self._run,
+                                         name='maschine-reader')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the reader thread and wait for it to finish.
+
+        Returns:
+            None"""
+
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_alive(self):
+        """Return True if the reader thread is running."""
+
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        """Body of the reader thread. For internal use only."""
+
+        read    = self._hid.hid_read_timeout_into
+        push    = self.ring.push
+        device  = self._device
+        buf     = self._buffer
+        c_buf   = self._c_buffer
+        timeout = self._timeout_ms
+        try:
+            while self._running:
+                num = read(device, c_buf, timeout)
+                if num > 0:
+                    push(buf, num, _now())
+        except Exception as e:
+            self.error    = e
+            self._running = False
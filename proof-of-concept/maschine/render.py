@@ -0,0 +1,365 @@
+"""Drawing text and widgets on the displays.
+
+Text is drawn with an embedded 8x8 bitmap font covering printable ASCII,
+in cells one byte wide, so a character always starts at a byte column
+(0 to 31) of the 256 pixel wide display, at any pixel row. Each row of
+a glyph is a single byte in the displays' bit order, and the first time
+text is drawn the font is packed into 8 translation tables of 256
+bytes, one per glyph row (and 8 more for inverted text), which are kept
+for the life of the process. A row of text is then made for the whole
+string with one bytes.translate() call and copied into the framebuffer
+with one slice assignment, so drawing a string costs 8 row copies,
+however long it is, with no Python code per character or pixel.
+
+The widgets work the same way, on rows of whole bytes:
+
+    bar     a horizontal meter with a frame
+    knob    a 16x16 pixel knob with a pointer, from 33 positions drawn
+            once and cached
+    invert  inverts a rectangle, eg: to show a selection
+    clear   clears or sets a rectangle
+
+Everything is drawn into a display.FrameBuffer, which marks the stripes
+which changed, to be sent by its flush() or an OutputScheduler.
+
+Public functions defined by this module:
+
+    bar(framebuffer, column, y, columns, value, maximum=1.0, height=8)
+    clear(framebuffer, column, y, columns, height, on=False)
+    invert(framebuffer, column, y, columns, height)
+    knob(framebuffer, column, y, value, maximum=1.0)
+    text(framebuffer, column, y, string, invert=False)
+"""
+
+from __future__ import absolute_import, division
+
+import binascii
+import math
+
+from .display import HEIGHT, ROW_BYTES
+
+FONT_WIDTH  = 8                         # pixels, one byte
+FONT_HEIGHT = 8
+KNOB_SIZE   = 16                        # pixels, two bytes
+KNOB_STEPS  = 32
+
+_FIRST_CHAR = 0x20
+_UNKNOWN    = ord('?')
+
+# The glyphs of characters 0x20 to 0x7e, as 8 rows of one byte in
+# display bit order (leftmost pixel in the most significant bit).
+_FONT = (
+    '0000000000000000',  # space
+    '1010101010001000',  # !
+    '2828280000000000',  # "
+    '28287c287c282800',  # #
+    '103c503814781000',  # $
+    '60640810204c0c00',  # %
+    '3048502054483400',  # &
+    '1010200000000000',  # '
+    '0810202020100800',  # (
+    '2010080808102000',  # )
+    '0010543854100000',  # *
+    '0010107c10100000',  # +
+    '0000000030102000',  # ,
+    '0000007c00000000',  # -
+    '0000000000303000',  # .
+    '0004081020400000',  # /
+    '38444c5464443800',  # 0
+    '1030101010103800',  # 1
+    '3844040810207c00',  # 2
+    '7c08100804443800',  # 3
+    '081828487c080800',  # 4
+    '7c40780404443800',  # 5
+    '1820407844443800',  # 6
+    '7c04081020202000',  # 7
+    '3844443844443800',  # 8
+    '3844443c04083000',  # 9
+    '0030300030300000',  # :
+    '0030300030102000',  # ;
+    '0810204020100800',  # <
+    '00007c007c000000',  # =
+    '2010080408102000',  # >
+    '3844040810001000',  # ?
+    '3844043454543800',  # @
+    '3844447c44444400',  # A
+    '7844447844447800',  # B
+    '3844404040443800',  # C
+    '7048444444487000',  # D
+    '7c40407840407c00',  # E
+    '7c40407840404000',  # F
+    '3844405c44443c00',  # G
+    '4444447c44444400',  # H
+    '3810101010103800',  # I
+    '1c08080808483000',  # J
+    '4448506050484400',  # K
+    '4040404040407c00',  # L
+    '446c545444444400',  # M
+    '444464544c444400',  # N
+    '3844444444443800',  # O
+    '7844447840404000',  # P
+    '3844444454483400',  # Q
+    '7844447850484400',  # R
+    '3c40403804047800',  # S
+    '7c10101010101000',  # T
+    '4444444444443800',  # U
+    '4444444444281000',  # V
+    '4444445454542800',  # W
+    '4444281028444400',  # X
+    '4444442810101000',  # Y
+    '7c04081020407c00',  # Z
+    '3820202020203800',  # [
+    '0040201008040000',  # \
+    '3808080808083800',  # ]
+    '1028440000000000',  # ^
+    '0000000000007c00',  # _
+    '2010080000000000',  # `
+    '000038043c443c00',  # a
+    '4040586444447800',  # b
+    '0000384040443800',  # c
+    '0404344c44443c00',  # d
+    '000038447c403800',  # e
+    '1824207020202000',  # f
+    '00003c44443c0438',  # g
+    '4040586444444400',  # h
+    '1000301010103800',  # i
+    '0800180808084830',  # j
+    '4040485060504800',  # k
+    '3010101010103800',  # l
+    '0000685454444400',  # m
+    '0000586444444400',  # n
+    '0000384444443800',  # o
+    '0000784444784040',  # p
+    '00003c44443c0404',  # q
+    '0000586440404000',  # r
+    '00003c4038047800',  # s
+    '2020702020241800',  # t
+    '00004444444c3400',  # u
+    '0000444444281000',  # v
+    '0000444454542800',  # w
+    '0000442810284400',  # x
+    '00004444443c0438',  # y
+    '00007c0810207c00',  # z
+    '0810102010100800',  # {
+    '1010101010101000',  # |
+    '2010100810102000',  # }
+    '0000205408000000',  # ~
+)
+
+_INVERT = bytes(bytearray(0xff ^ n for n in range(256)))
+
+_rows  = {}                             # invert: translation table per glyph row
+_knobs = []                             # knob rows per position
+
+
+def _glyph_rows(invert):
+    """Return the 8 translation tables of the font, packing them the
+    first time. For internal use only."""
+
+    tables = _rows.get(invert)
+    if tables is None:
+        glyphs = [bytearray(binascii.unhexlify(glyph)) for glyph in _FONT]
+        tables = []
+        for row in range(FONT_HEIGHT):
+            table = bytearray(256)
+            for code in range(256):
+                index = code - _FIRST_CHAR
+                if not 0 <= index < len(glyphs):
+                    index = _UNKNOWN - _FIRST_CHAR
+                table[code] = glyphs[index][row] ^ (0xff if invert else 0)
+            tables.append(bytes(table))
+        _rows[invert] = tables
+    return tables
+
+
+def _check(framebuffer, column):
+    """Raise IndexError unless column is a byte column. For internal use only."""
+
+    if not 0 <= column < ROW_BYTES:
+        raise IndexError('Column %d out of range.' % column)
+
+
+def _rows_of(y, height):
+    """Return the rows from y to y + height - 1 which are on the display,
+    as offsets from y. For internal use only."""
+
+    return range(max(-y, 0), min(height, HEIGHT - y))
+
+
+def text(framebuffer, column, y, string, invert=False):
+    """Draw text.
+
+    Characters outside printable ASCII are drawn as '?'. Text running
+    past the right edge of the display, or above or below it, is cut.
+
+    Arguments:
+        framebuffer: The display.FrameBuffer to draw into.
+
+        column:      Byte column of the first character, 0 to 31.
+
+        y:           Pixel row of the top of the text.
+
+        string:      Text to draw.
+
+        invert:      True to draw light text on a dark background.
+
+    Returns:
+        Number of columns drawn.
+        Raises IndexError exception if column is out of range."""
+
+    _check(framebuffer, column)
+    if not isinstance(string, bytes):
+        string = string.encode('ascii', 'replace')
+    string = string[:ROW_BYTES - column]
+    tables = _glyph_rows(invert)
+    for row in _rows_of(y, FONT_HEIGHT):
+        framebuffer.set_row(y + row, string.translate(tables[row]), column)
+    return len(string)
+
+
+def clear(framebuffer, column, y, columns, height, on=False):
+    """Clear, or set, a rectangle.
+
+    Arguments:
+        framebuffer: The display.FrameBuffer to draw into.
+
+        column:      First byte column, 0 to 31.
+
+        y:           First pixel row.
+
+        columns:     Width in byte columns.
+
+        height:      Height in pixel rows.
+
+        on:          True to set the pixels instead.
+
+    Returns:
+        None"""
+
+    _check(framebuffer, column)
+    data = (b'\xff' if on else b'\x00') * columns
+    for row in _rows_of(y, height):
+        framebuffer.set_row(y + row, data, column)
+
+
+def invert(framebuffer, column, y, columns, height):
+    """Invert a rectangle, eg: to highlight the selected item.
+
+    Arguments:
+        framebuffer: The display.FrameBuffer to draw into.
+
+        column:      First byte column, 0 to 31.
+
+        y:           First pixel row.
+
+        columns:     Width in byte columns.
+
+        height:      Height in pixel rows.
+
+    Returns:
+        None"""
+
+    _check(framebuffer, column)
+    for row in _rows_of(y, height):
+        data = bytes(framebuffer.get_row(y + row, column, columns))
+        framebuffer.set_row(y + row, data.translate(_INVERT), column)
+
+
+def _packed(bits, columns):
+    """Return an int of columns * 8 bits as bytes. For internal use only."""
+
+    return binascii.unhexlify('%0*x' % (columns * 2, bits))
+
+
+def bar(framebuffer, column, y, columns, value, maximum=1.0, height=8):
+    """Draw a horizontal meter: a frame, filled from the left in
+    proportion to value.
+
+    Arguments:
+        framebuffer: The display.FrameBuffer to draw into.
+
+        column:      First byte column, 0 to 31.
+
+        y:           First pixel row.
+
+        columns:     Width in byte columns.
+
+        value:       Value shown, from 0 to maximum.
+
+        maximum:     Value of a full bar.
+
+        height:      Height in pixel rows, at least 5.
+
+    Returns:
+        None"""
+
+    _check(framebuffer, column)
+    columns = min(columns, ROW_BYTES - column)
+    width   = columns * 8
+    inner   = width - 4                 # inside the frame and a gap
+    filled  = int(round(inner * min(max(value / maximum, 0.0), 1.0)))
+    edges   = (1 << (width - 1)) | 1
+    frame   = _packed((1 << width) - 1, columns)
+    gap     = _packed(edges, columns)
+    fill    = _packed(edges | (((1 << filled) - 1) << (width - 2 - filled)), columns)
+    for row in _rows_of(y, height):
+        if row == 0 or row == height - 1:
+            data = frame
+        elif row == 1 or row == height - 2:
+            data = gap
+        else:
+            data = fill
+        framebuffer.set_row(y + row, data, column)
+
+
+def _knob_rows(step):
+    """Return the rows of the knob at a position, drawing all of them
+    the first time. For internal use only."""
+
+    if not _knobs:
+        centre = (KNOB_SIZE - 1) / 2
+        for n in range(KNOB_STEPS + 1):
+            # From 7:30 clockwise to 4:30, as on the hardware.
+            angle = math.radians(225 - 270 * n / KNOB_STEPS)
+            rows  = []
+            for py in range(KNOB_SIZE):
+                bits = 0
+                for px in range(KNOB_SIZE):
+                    dx = px - centre
+                    dy = centre - py
+                    distance = math.hypot(dx, dy)
+                    ring     = centre - 1.0 <= distance <= centre + 0.2
+                    # Pointer: close to the line from the centre at angle.
+                    along    = dx * math.cos(angle) + dy * math.sin(angle)
+                    across   = abs(dx * math.sin(angle) - dy * math.cos(angle))
+                    pointer  = 1.0 <= along <= centre - 1.5 and across <= 0.7
+                    if ring or pointer:
+                        bits |= 1 << (KNOB_SIZE - 1 - px)
+                rows.append(_packed(bits, KNOB_SIZE // 8))
+            _knobs.append(tuple(rows))
+    return _knobs[step]
+
+
+def knob(framebuffer, column, y, value, maximum=1.0):
+    """Draw a 16x16 pixel knob, with its pointer turned in proportion to
+    value.
+
+    Arguments:
+        framebuffer: The display.FrameBuffer to draw into.
+
+        column:      First byte column, 0 to 30.
+
+        y:           First pixel row.
+
+        value:       Value shown, from 0 to maximum.
+
+        maximum:     Value of the knob turned fully clockwise.
+
+    Returns:
+        None"""
+
+    _check(framebuffer, column)
+    step = int(round(KNOB_STEPS * min(max(value / maximum, 0.0), 1.0)))
+    rows = _knob_rows(step)
+    for row in _rows_of(y, KNOB_SIZE):
+        framebuffer.set_row(y + row, rows[row], column)
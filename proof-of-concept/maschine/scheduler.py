@@ -0,0 +1,385 @@
+"""Prioritized output scheduling.
+
+Redrawing both displays takes 16 stripe reports of 265 bytes, and an LED
+report queued behind them has to wait for all of them to be written. An
+OutputScheduler keeps a queue per priority class and always writes the
+waiting reports of a higher class before the next report of a lower
+one. With LED reports in PRIORITY_LED and display stripes in
+PRIORITY_DISPLAY, an LED report waits for at most the one stripe that
+is already being written.
+
+Reports can be queued with a key. A report queued with the same key as
+one still waiting replaces it in place, so a stripe redrawn twice before
+it was sent, or an LED report changed again, is only sent once, with
+its latest contents.
+
+Display stripes are copied into buffers of the scheduler when they are
+queued, two per stripe so that one can be refilled while the other is
+being written, so the program can go on drawing into a framebuffer
+while the writer thread sends its previous contents. A stripe whose
+write failed is queued again by the next submit_display() of its
+display, as FrameBuffer.flush() keeps failed stripes dirty. Likewise an
+LED report whose write failed is marked dirty again in its LedManager,
+so the next submit_leds() sends it again, with its latest contents.
+
+The scheduler can be run from a program's main loop with pump(), or on
+a background thread with start(). Should the thread die, alive turns
+False and submitting raises RuntimeError, instead of reports being
+queued for nobody.
+
+Public classes defined by this module:
+
+    OutputScheduler
+"""
+
+from __future__ import absolute_import, division
+
+import collections
+import threading
+import time
+
+import hidapi
+
+from .display import STRIPES
+
+# Monotonic clock used to measure queueing delays, where available.
+_now = getattr(time, 'monotonic', time.time)
+
+PRIORITY_LED     = 0
+PRIORITY_DISPLAY = 1
+
+
+class OutputScheduler(object):
+    """Priority queues for output reports.
+
+    Attributes:
+        error: The last exception raised by a write, or None. Writes
+               raising other exceptions than RuntimeError are counted as
+               failed too, and do not stop the writer thread."""
+
+    def __init__(self, device, priorities=2, hid=hidapi):
+        """Constructor for class OutputScheduler.
+
+        Arguments:
+            device:     A device handle returned by hid_open().
+
+            priorities: Number of priority classes, 0 being the highest.
+
+            hid:        Module used to write the reports. Defaults to the
+                        hidapi module."""
+
+        self.error    = None
+        self._device  = device
+        self._hid     = hid
+        self._queues  = [collections.deque() for _ in range(priorities)]
+        self._pending = {}
+        self._cond    = threading.Condition(threading.Lock())
+        self._thread  = None
+        self._running = False
+        self._buffers = {}
+        self._writing = None
+        self._retry   = set()
+        self._leds    = {}
+        self._died    = False
+
+        self._sent     = [0] * priorities
+        self._failed   = [0] * priorities
+        self._replaced = [0] * priorities
+        self._wait_sum = [0.0] * priorities
+        self._wait_max = [0.0] * priorities
+
+    def submit(self, report, priority=PRIORITY_LED, key=None):
+        """Queue a report for writing.
+
+        Arguments:
+            report:   A bytearray (or any other buffer) holding the report.
+
+            priority: Priority class, 0 being the highest.
+
+            key:      Optional hashable key. If a report with the same key
+                      is still waiting, it is replaced by this one.
+
+        Returns:
+            None
+            Raises RuntimeError exception if the writer thread started
+            with start() has died."""
+
+        with self._cond:
+            self._check_thread()
+            self._queue(report, priority, key)
+
+    def _check_thread(self):
+        """Raise RuntimeError if the writer thread died. For internal use only."""
+
+        if self._died:
+            raise RuntimeError('Output scheduler thread died: %r' % (self.error,))
+
+    def _queue(self, report, priority, key, copy=False):
+        """Queue a report, or replace the waiting one with the same key.
+
+        With copy, the report is copied into a buffer kept for the key
+        which is not being written. For internal use only; the caller
+        holds the lock."""
+
+        entry = self._pending.get(key) if key is not None else None
+        if copy:
+            if entry is not None:
+                buf = entry[1]
+            else:
+                buffers = self._buffers.get(key)
+                if buffers is None:
+                    buffers = self._buffers[key] = [bytearray(len(report)),
+                                                    bytearray(len(report))]
+                writing = self._writing[1] if self._writing is not None else None
+                buf = buffers[1] if buffers[0] is writing else buffers[0]
+            buf[:] = report
+            report = buf
+        if entry is not None:
+            entry[1] = report
+            self._replaced[entry[3]] += 1
+            return
+        entry = [key, report, _now(), priority]
+        if key is not None:
+            self._pending[key] = entry
+        self._queues[priority].append(entry)
+        self._cond.notify_all()
+
+    def submit_display(self, framebuffer, priority=PRIORITY_DISPLAY):
+        """Queue the dirty stripes of a display framebuffer.
+
+        The stripes are copied, keyed by display and stripe, and marked
+        clean in the framebuffer. Stripes of the display whose last write
+        failed are queued again too.
+
+        Arguments:
+            framebuffer: A display.FrameBuffer.
+
+            priority:    Priority class of the stripes.
+
+        Returns:
+            Number of stripes queued.
+            Raises RuntimeError exception if the writer thread started
+            with start() has died."""
+
+        dirty = framebuffer.dirty
+        count = 0
+        with self._cond:
+            self._check_thread()
+            for stripe in range(STRIPES):
+                key = ('display', framebuffer.display_no, stripe)
+                if dirty & (1 << stripe) or key in self._retry:
+                    self._retry.discard(key)
+                    self._queue(framebuffer.stripe_report(stripe), priority, key, True)
+                    count += 1
+        framebuffer.dirty &= ~dirty
+        return count
+
+    def submit_leds(self, leds, priority=PRIORITY_LED):
+        """Queue the changed reports of an LED manager.
+
+        The reports are marked clean in the LED manager, and marked dirty
+        again should their write fail.
+
+        Arguments:
+            leds:     A leds.LedManager.
+
+            priority: Priority class of the reports.
+
+        Returns:
+            Number of reports queued.
+            Raises RuntimeError exception if the writer thread started
+            with start() has died."""
+
+        reports = leds.dirty_reports()
+        with self._cond:
+            self._check_thread()
+            for report in reports:
+                key = ('leds', report[0])
+                self._leds[key] = leds
+                self._queue(report, priority, key)
+        return len(reports)
+
+    def _next(self):
+        """Remove and return the next entry to write, or None.
+
+        For internal use only; the caller holds the lock."""
+
+        for queue in self._queues:
+            if queue:
+                entry = queue.popleft()
+                if entry[0] is not None:
+                    del self._pending[entry[0]]
+                self._writing = entry
+                return entry
+        return None
+
+    def _write(self, entry):
+        """Write one queued report and account for it. For internal use only."""
+
+        key, report, queued, priority = entry
+        wait = _now() - queued
+        try:
+            self._hid.hid_write(self._device, report)
+        except Exception as e:
+            self.error = e
+            failed = True
+        else:
+            failed = False
+        if failed and key in self._leds:
+            self._leds[key].mark_dirty(key[1])
+        with self._cond:
+            self._writing = None
+            if failed:
+                self._failed[priority] += 1
+                if key in self._buffers:
+                    self._retry.add(key)
+            else:
+                self._sent[priority] += 1
+            self._wait_sum[priority] += wait
+            if wait > self._wait_max[priority]:
+                self._wait_max[priority] = wait
+            self._cond.notify_all()
+
+    def pump(self, max_reports=None):
+        """Write queued reports, highest priority first.
+
+        Arguments:
+            max_reports: Maximum number of reports to write, or None to
+                         write until the queues are empty.
+
+        Returns:
+            Number of reports written."""
+
+        count = 0
+        while max_reports is None or count < max_reports:
+            with self._cond:
+                entry = self._next()
+            if entry is None:
+                break
+            self._write(entry)
+            count += 1
+        return count
+
+    def pending(self):
+        """Return the number of reports waiting in each priority class.
+
+        Returns:
+            List of queue lengths, highest priority first."""
+
+        with self._cond:
+            return [len(queue) for queue in self._queues]
+
+    def wait(self, priority, timeout=None):
+        """Wait until no report of a priority class is waiting or being
+        written.
+
+        Arguments:
+            priority: Priority class.
+
+            timeout:  Longest time to wait in seconds, or None to wait
+                      for as long as it takes.
+
+        Returns:
+            True if the class is idle, False if the timeout expired."""
+
+        deadline = None if timeout is None else _now() + timeout
+        with self._cond:
+            while (self._queues[priority] or
+                   (self._writing is not None and self._writing[3] == priority)):
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    left = deadline - _now()
+                    if left <= 0:
+                        return False
+                    self._cond.wait(left)
+            return True
+
+    def stats(self):
+        """Return the queue depths and wait times of each priority class.
+
+        Returns:
+            List with one dict per priority class, highest priority
+            first, with the keys 'pending', 'sent', 'failed', 'replaced',
+            'wait_avg' and 'wait_max' (in seconds)."""
+
+        with self._cond:
+            result = []
+            for n, queue in enumerate(self._queues):
+                done = self._sent[n] + self._failed[n]
+                result.append({'pending':  len(queue),
+                               'sent':     self._sent[n],
+                               'failed':   self._failed[n],
+                               'replaced': self._replaced[n],
+                               'wait_avg': self._wait_sum[n] / done if done else 0.0,
+                               'wait_max': self._wait_max[n]})
+            return result
+
+    @property
+    def alive(self):
+        """False if the writer thread started with start() died."""
+
+        return not self._died
+
+    def start(self):
+        """Start writing queued reports on a background thread.
+
+        Returns:
+            None"""
+
+        if self._thread is not None:
+            raise RuntimeError('Scheduler already started.')
+        self._running = True
+        self._thread  = threading.Thread(target=self._run,
+                                         name='maschine-output')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, drain=True):
+        """Stop the background thread and wait for it to finish.
+
+        Arguments:
+            drain: Write the reports still queued before stopping.
+
+        Returns:
+            None"""
+
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if drain:
+            self.pump()
+
+    def _run(self):
+        """Body of the writer thread. For internal use only."""
+
+        try:
+            while True:
+                with self._cond:
+                    entry = self._next()
+                    while entry is None and self._running:
+                        self._cond.wait()
+                        entry = self._next()
+                    if not self._running:
+                        if entry is not None:
+                            self._requeue(entry)
+                        return
+                self._write(entry)
+        except Exception as e:
+            # submit() raises from now on, instead of queueing for nobody
+            self.error = e
+            self._died = True
+            raise
+
+    def _requeue(self, entry):
+        """Put an entry back at the head of its queue.
+
+        For internal use only; the caller holds the lock."""
+
+        self._writing = None
+        if entry[0] is not None:
+            self._pending[entry[0]] = entry
+        self._queues[entry[3]].appendleft(entry)
@@ -0,0 +1,465 @@
+"""Simulated Maschine MK2 standing in for the hidapi library.
+
+A VirtualLibrary provides the functions of the hidapi C API in pure
+Python, backed by one or more simulated controllers. Installed with
+hidapi.hid_use_library(), it is called by the very same hidapi module
+functions as the real shared library, so everything above them runs
+the code path it runs in production, with no hardware attached:
+
+    import hidapi
+    from maschine.virtual import VirtualLibrary, VirtualMaschine
+
+    hidapi.hid_use_library(VirtualLibrary([VirtualMaschine(pad_pattern='sweep')]),
+                           '<virtual>')
+    hidapi.hid_init()
+    device = hidapi.hid_open(0x17cc, 0x1140)
+
+A VirtualMaschine generates 0x20 pad reports and 0x10 button reports at
+configurable rates, following a named pattern or a function, either in
+real time or as fast as they are read. Output reports are checked
+against the report formats the controller accepts: malformed reports
+fail like a failed write, with the reason given by hid_error(). The
+state set by valid reports is kept for inspection.
+
+Public classes defined by this module:
+
+    VirtualLibrary
+    VirtualMaschine
+"""
+
+from __future__ import absolute_import, division
+
+import ctypes
+import random
+import struct
+import threading
+import time
+
+from .buttons import BUTTON_NAMES, BUTTON_OFFSET, BUTTON_REPORT_ID, ENCODERS
+from .display import HEIGHT, STRIPE_REPORT, STRIPE_ROWS, STRIPES
+from .leds import BUTTON_REPORT_ID as LED_BUTTON_REPORT_ID
+from .leds import GROUP_REPORT_ID, PAD_REPORT_ID as LED_PAD_REPORT_ID, _REPORTS
+from .pads import PAD_COUNT, PAD_REPORT_ID
+
+# Monotonic clock used to pace the reports, where available.
+_now = getattr(time, 'monotonic', time.time)
+
+VENDOR_ID  = 0x17cc
+PRODUCT_ID = 0x1140
+
+_PAD_WORDS     = struct.Struct('<B%dH' % (2 * PAD_COUNT))
+_BUTTON_LENGTH = max([BUTTON_OFFSET + (len(BUTTON_NAMES) + 7) // 8]
+                     + [offset + size for name, offset, size, modulus in ENCODERS])
+_LED_LENGTHS   = dict((report_id, 1 + size) for report_id, size in _REPORTS)
+
+
+def _pads_idle(n, pressures, rng):
+    """Pad pattern: no pad is touched."""
+
+    for pad in range(PAD_COUNT):
+        pressures[pad] = 0
+
+
+def _pads_sweep(n, pressures, rng):
+    """Pad pattern: each pad in turn is pressed and released."""
+
+    _pads_idle(n, pressures, rng)
+    step, phase = divmod(n, 64)
+    pressures[step % PAD_COUNT] = 4095 - abs(phase - 32) * 4095 // 32
+
+
+def _pads_random(n, pressures, rng):
+    """Pad pattern: every pad gets a random pressure."""
+
+    for pad in range(PAD_COUNT):
+        pressures[pad] = rng.randint(0, 4095)
+
+
+def _buttons_idle(n, buttons, encoders, rng):
+    """Button pattern: nothing is touched."""
+
+
+def _buttons_cycle(n, buttons, encoders, rng):
+    """Button pattern: each button in turn goes down and up, and the
+    encoders turn one step per report."""
+
+    button, release = divmod(n, 2)
+    button %= len(buttons)
+    buttons[button] = 0 if release else 1
+    for encoder in range(len(encoders)):
+        encoders[encoder] += 1 if encoder % 2 else -1
+
+
+PAD_PATTERNS    = {'idle': _pads_idle, 'sweep': _pads_sweep, 'random': _pads_random}
+BUTTON_PATTERNS = {'idle': _buttons_idle, 'cycle': _buttons_cycle}
+
+
+class VirtualMaschine(object):
+    """A simulated Maschine MK2.
+
+    Attributes:
+        serial_number: Serial number string of the controller.
+        leds:          Dict mapping each LED report ID to the last valid
+                       report of that ID written, or None.
+        displays:      List of two lists holding the last valid stripe
+                       report written to each stripe of each display.
+        written:       Number of valid output reports written.
+        rejected:      Number of malformed output reports rejected.
+        generated:     Number of input reports generated."""
+
+    def __init__(self, serial_number=u'00000001', pad_rate=500.0,
+                 button_rate=0.0, pad_pattern='idle', button_pattern='idle',
+                 realtime=True, seed=None):
+        """Constructor for class VirtualMaschine.
+
+        Arguments:
+            serial_number:  Serial number string of the controller.
+
+            pad_rate:       0x20 reports per second, or 0 for none.
+
+            button_rate:    0x10 reports per second, or 0 for none.
+
+            pad_pattern:    Name from PAD_PATTERNS, or a function
+                            f(n, pressures, rng) which fills the list of
+                            16 pressures for the n-th pad report.
+
+            button_pattern: Name from BUTTON_PATTERNS, or a function
+                            f(n, buttons, encoders, rng) which updates the
+                            list of button states (0 or 1, in BUTTON_NAMES
+                            order) and encoder positions for the n-th
+                            button report.
+
+            realtime:       True to generate reports at their rates in real
+                            time, False to generate them as fast as they
+                            are read, in the order the rates give.
+
+            seed:           Seed for the random number generator used by
+                            the patterns."""
+
+        self.serial_number = serial_number
+        self.leds          = dict((report_id, None) for report_id in _LED_LENGTHS)
+        self.displays      = [[None] * STRIPES, [None] * STRIPES]
+        self.written       = 0
+        self.rejected      = 0
+        self.generated     = 0
+
+        self._pad_period    = 1.0 / pad_rate if pad_rate else None
+        self._button_period = 1.0 / button_rate if button_rate else None
+        self._pad_pattern    = PAD_PATTERNS.get(pad_pattern, pad_pattern)
+        self._button_pattern = BUTTON_PATTERNS.get(button_pattern, button_pattern)
+        self._realtime  = realtime
+        self._rng       = random.Random(seed)
+        self._pressures = [0] * PAD_COUNT
+        self._buttons   = [0] * len(BUTTON_NAMES)
+        self._encoders  = [0] * len(ENCODERS)
+        self._pad_count    = 0
+        self._button_count = 0
+        self._pad_due      = None
+        self._button_due   = None
+        self._clock        = 0.0
+
+    def _start(self):
+        """Start the report schedule. For internal use only."""
+
+        self._clock = _now() if self._realtime else 0.0
+        self._pad_due    = self._clock if self._pad_period else None
+        self._button_due = self._clock if self._button_period else None
+
+    def _pad_report(self):
+        """Build the next 0x20 report. For internal use only."""
+
+        self._pad_pattern(self._pad_count, self._pressures, self._rng)
+        self._pad_count += 1
+        words = [(pad << 12) | (self._pressures[pad] & 0x0fff)
+                 for pad in range(PAD_COUNT)]
+        return _PAD_WORDS.pack(PAD_REPORT_ID, *(words + words))
+
+    def _button_report(self):
+        """Build the next 0x10 report. For internal use only."""
+
+        self._button_pattern(self._button_count, self._buttons, self._encoders, self._rng)
+        self._button_count += 1
+        report    = bytearray(_BUTTON_LENGTH)
+        report[0] = BUTTON_REPORT_ID
+        for n, down in enumerate(self._buttons):
+            if down:
+                report[BUTTON_OFFSET + n // 8] |= 1 << (n % 8)
+        for (name, offset, size, modulus), position in zip(ENCODERS, self._encoders):
+            value = position % modulus
+            if size == 1:
+                report[offset] = value
+            else:
+                report[offset]     = value & 0xff
+                report[offset + 1] = value >> 8
+        return bytes(report)
+
+    def next_report(self, timeout):
+        """Return the next input report, waiting for it to become due.
+
+        Arguments:
+            timeout: Longest time to wait in seconds, or None to wait
+                     until the next report is due.
+
+        Returns:
+            The report as bytes, or None if no report was due within
+            the timeout."""
+
+        if self._pad_due is None and self._button_due is None:
+            if not self._pad_period and not self._button_period:
+                if timeout:
+                    time.sleep(timeout)
+                return None
+            self._start()
+
+        dues = [due for due in (self._pad_due, self._button_due) if due is not None]
+        due  = min(dues)
+        if self._realtime:
+            wait = due - _now()
+            if wait > 0:
+                if timeout is not None and wait > timeout:
+                    time.sleep(timeout)
+                    return None
+                time.sleep(wait)
+
+        self.generated += 1
+        if self._button_due is not None and self._button_due <= due:
+            self._button_due += self._button_period
+            return self._button_report()
+        self._pad_due += self._pad_period
+        return self._pad_report()
+
+    def write(self, data):
+        """Accept an output report.
+
+        Arguments:
+            data: The report as bytes, starting with the report ID.
+
+        Returns:
+            None if the report is valid, or a string describing what is
+            wrong with it."""
+
+        report_id = ord(data[0:1])
+        if report_id in _LED_LENGTHS:
+            if len(data) != _LED_LENGTHS[report_id]:
+                return 'LED report 0x%02x must be %d bytes, not %d.' % (
+                    report_id, _LED_LENGTHS[report_id], len(data))
+            self.leds[report_id] = bytearray(data)
+        elif report_id in (0xe0, 0xe1):
+            if len(data) != STRIPE_REPORT:
+                return 'Display report must be %d bytes, not %d.' % (STRIPE_REPORT, len(data))
+            header = bytearray(data[:9])
+            row    = header[3]
+            if (header[1:3] != bytearray(2) or row % STRIPE_ROWS or row >= HEIGHT
+                    or header[4:9] != bytearray([0x00, 0x20, 0x00, STRIPE_ROWS, 0x00])):
+                return 'Malformed display report header.'
+            self.displays[report_id & 0x0f][row // STRIPE_ROWS] = bytearray(data)
+        else:
+            return 'Unknown output report 0x%02x.' % report_id
+        self.written += 1
+        return None
+
+
+class _DeviceInfo(object):
+    """Stand-in for struct hid_device_info. For internal use only."""
+
+    def __init__(self, number, device, next_info):
+        self.path                = ('virtual:%d' % number).encode('ascii')
+        self.vendor_id           = VENDOR_ID
+        self.product_id          = PRODUCT_ID
+        self.serial_number       = device.serial_number
+        self.release_number      = 0x0100
+        self.manufacturer_string = u'Native Instruments'
+        self.product_string      = u'Maschine Controller MK2'
+        self.usage_page          = 0xff01
+        self.usage               = 0x0001
+        self.interface_number    = 0
+        # A list stands in for a pointer: empty for NULL, else [target].
+        self.next                = [next_info] if next_info is not None else []
+
+
+class VirtualLibrary(object):
+    """The hidapi C API, implemented over simulated controllers.
+
+    Controllers can be plugged in and unplugged while the library is in
+    use; the handles of an unplugged controller fail every call.
+
+    Attributes:
+        devices: List of the VirtualMaschine instances plugged in."""
+
+    def __init__(self, devices=None):
+        """Constructor for class VirtualLibrary.
+
+        Arguments:
+            devices: List of VirtualMaschine instances to present. By
+                     default a single idle controller is presented."""
+
+        if devices is None:
+            devices = [VirtualMaschine()]
+        self.devices  = []
+        self._numbers = {}
+        self._plugged = 0
+        self._handles = {}
+        self._next    = 1
+        self._errors  = {}
+        self._lock    = threading.Lock()
+        for device in devices:
+            self.plug(device)
+
+    def plug(self, device):
+        """Plug in a controller. It is enumerated with a new path.
+
+        Arguments:
+            device: A VirtualMaschine.
+
+        Returns:
+            None"""
+
+        with self._lock:
+            self._numbers[id(device)] = self._plugged
+            self._plugged += 1
+            self.devices.append(device)
+
+    def unplug(self, device):
+        """Unplug a controller.
+
+        Arguments:
+            device: A VirtualMaschine which is plugged in.
+
+        Returns:
+            None"""
+
+        with self._lock:
+            self.devices.remove(device)
+            del self._numbers[id(device)]
+            for handle, state in self._handles.items():
+                if state[0] is device:
+                    state[0] = None
+                    self._errors[handle] = u'Device disconnected.'
+
+    def _open(self, device):
+        """Return a new handle for a device. For internal use only."""
+
+        with self._lock:
+            handle = self._next
+            self._next += 1
+            self._handles[handle] = [device, False]
+        return handle
+
+    def _device(self, handle):
+        """Return the VirtualMaschine of a handle, or None if the handle
+        is closed or its controller unplugged. For internal use only."""
+
+        state = self._handles.get(handle)
+        return state[0] if state is not None else None
+
+    def hid_init(self):
+        return 0
+
+    def hid_exit(self):
+        return 0
+
+    def hid_enumerate(self, vendor_id, product_id):
+        if vendor_id not in (0, VENDOR_ID) or product_id not in (0, PRODUCT_ID):
+            return []
+        info = None
+        for device in reversed(self.devices):
+            info = _DeviceInfo(self._numbers[id(device)], device, info)
+        return [info] if info is not None else []
+
+    def hid_free_enumeration(self, devs):
+        pass
+
+    def hid_open(self, vendor_id, product_id, serial_number):
+        if vendor_id != VENDOR_ID or product_id != PRODUCT_ID:
+            return None
+        for device in self.devices:
+            if serial_number is None or device.serial_number == serial_number:
+                return self._open(device)
+        return None
+
+    def hid_open_path(self, path):
+        if isinstance(path, bytes):
+            path = path.decode('ascii')
+        if not path.startswith('virtual:'):
+            return None
+        number = int(path[len('virtual:'):])
+        for device in self.devices:
+            if self._numbers[id(device)] == number:
+                return self._open(device)
+        return None
+
+    def hid_close(self, device):
+        with self._lock:
+            self._handles.pop(device, None)
+            self._errors.pop(device, None)
+
+    def hid_error(self, device):
+        return self._errors.get(device)
+
+    def hid_set_nonblocking(self, device, nonblock):
+        if self._device(device) is None:
+            return -1
+        self._handles[device][1] = bool(nonblock)
+        return 0
+
+    def hid_read_timeout(self, device, data, length, milliseconds):
+        virtual = self._device(device)
+        if virtual is None:
+            return -1
+        timeout = None if milliseconds < 0 else milliseconds / 1000
+        report  = virtual.next_report(timeout)
+        if report is None:
+            return 0
+        num = min(len(report), length)
+        ctypes.memmove(data, report, num)
+        return num
+
+    def hid_read(self, device, data, length):
+        if self._device(device) is None:
+            return -1
+        nonblocking = self._handles[device][1]
+        return self.hid_read_timeout(device, data, length, 0 if nonblocking else -1)
+
+    def hid_write(self, device, data, length):
+        virtual = self._device(device)
+        if virtual is None:
+            return -1
+        if not isinstance(data, bytes):
+            data = ctypes.string_at(data, length)
+        error = virtual.write(data[:length])
+        if error is not None:
+            virtual.rejected += 1
+            self._errors[device] = error
+            return -1
+        return length
+
+    def hid_get_feature_report(self, device, data, length):
+        self._errors[device] = u'Feature reports are not supported.'
+        return -1
+
+    def hid_send_feature_report(self, device, data, length):
+        self._errors[device] = u'Feature reports are not supported.'
+        return -1
+
+    def _string(self, device, value, data, maxlen):
+        """Copy a string into a wide character buffer. For internal use only."""
+
+        if self._device(device) is None:
+            return -1
+        data.value = value[:maxlen - 1]
+        return 0
+
+    def hid_get_manufacturer_string(self, device, data, maxlen):
+        return self._string(device, u'Native Instruments', data, maxlen)
+
+    def hid_get_product_string(self, device, data, maxlen):
+        return self._string(device, u'Maschine Controller MK2', data, maxlen)
+
+    def hid_get_serial_number_string(self, device, data, maxlen):
+        virtual = self._device(device)
+        if virtual is None:
+            return -1
+        return self._string(device, virtual.serial_number, data, maxlen)
+
+    def hid_get_indexed_string(self, device, string_index, data, maxlen):
+        return self._string(device, u'', data, maxlen)
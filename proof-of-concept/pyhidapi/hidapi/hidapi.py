@@ -36,6 +36,17 @@ On the Mac, if the hidapi library is installed under /usr/local/lib,
 it may be necessary to set the DYLD_LIBRARY_PATH environment variable
 to '/usr/local/lib' so that find_library() will search there.
 
+Searching with find_library() is slow (on Linux it runs ldconfig, and
+possibly the C compiler), so the path it finds is kept in a cache file,
+$XDG_CACHE_HOME/pyhidapi/library-path (~/.cache by default), and reused
+while it can be loaded. The library can also be pinned, skipping the
+search altogether, with the HIDAPI_LIBRARY environment variable or the
+path argument of hid_init().
+
+Instead of the hidapi shared library, an object providing the same C
+functions (eg: a simulated device for testing) can be installed with
+hid_use_library() before calling hid_init().
+
 Public classes defined by this module:
 
     hid_device_info
@@ -51,55 +62,64 @@ Public functions defined by this module:
     hid_get_manufacturer_string(device)
     hid_get_product_string(device)
     hid_get_serial_number_string(device)
-    hid_init()
+    hid_init(path=None)
     hid_lib_path()
     hid_open(vendor_id, product_id, serial_number=None)
     hid_open_path(path)
     hid_read(device, length)
+    hid_read_into(device, buffer)
     hid_read_timeout(device, length, milliseconds)
+    hid_read_timeout_into(device, buffer, milliseconds)
     hid_send_feature_report(device, data)
     hid_set_nonblocking(device, nonblock)
+    hid_use_library(library, path='')
+    hid_wrap_buffer(buffer)
     hid_write(device, data)
+    hid_write_many(device, reports)
 """
 
 
+import os
+
 from ctypes import *
-from ctypes.util import find_library
-import exceptions
 
 # Define public classes:
 
 class hid_device_info(object):
     """Describes an HID device found by hid_enumerate()."""
 
-    path                = ''
-    vendor_id           = 0
-    product_id          = 0
-    serial_number       = unicode('')
-    release_number      = 0
-    manufacturer_string = unicode('')
-    product_string      = unicode('')
-    usage_page          = 0
-    usage               = 0
-    interface_number    = 0
+    # No per-instance __dict__: enumerating can create many of these.
+    __slots__ = ('path', 'vendor_id', 'product_id', 'serial_number',
+                 'release_number', 'manufacturer_string', 'product_string',
+                 'usage_page', 'usage', 'interface_number')
 
     def __init__(self, __hid_device = None):
         """Constructor for class hid_device_info.
 
         __hid_device argument is for internal use by this module."""
         
-        if __hid_device is not None:
-            if bool(__hid_device):
-                self.path                = __hid_device.path
-                self.vendor_id           = __hid_device.vendor_id
-                self.product_id          = __hid_device.product_id
-                self.serial_number       = __hid_device.serial_number
-                self.release_number      = __hid_device.release_number
-                self.manufacturer_string = __hid_device.manufacturer_string
-                self.product_string      = __hid_device.product_string
-                self.usage_page          = __hid_device.usage_page
-                self.usage               = __hid_device.usage
-                self.interface_number    = __hid_device.interface_number
+        if __hid_device is not None and bool(__hid_device):
+            self.path                = __hid_device.path
+            self.vendor_id           = __hid_device.vendor_id
+            self.product_id          = __hid_device.product_id
+            self.serial_number       = __hid_device.serial_number
+            self.release_number      = __hid_device.release_number
+            self.manufacturer_string = __hid_device.manufacturer_string
+            self.product_string      = __hid_device.product_string
+            self.usage_page          = __hid_device.usage_page
+            self.usage               = __hid_device.usage
+            self.interface_number    = __hid_device.interface_number
+        else:
+            self.path                = ''
+            self.vendor_id           = 0
+            self.product_id          = 0
+            self.serial_number       = u''
+            self.release_number      = 0
+            self.manufacturer_string = u''
+            self.product_string      = u''
+            self.usage_page          = 0
+            self.usage               = 0
+            self.interface_number    = 0
 
     def description(self):
         """Return a printable string describing the device."""
@@ -144,23 +164,107 @@ __c_hid_device_info._fields_ = [('path',                c_char_p),
 __hidapi  = None                          # libhidapi
 __libpath = ''                            # library path
 __BUFSIZE = 256                           # string buffer size
+__LIBNAME = 'hidapi-hidraw'               # library name searched for
+
+
+# For internal use only: Wrap a writable Python buffer without copying.
+def __c_buffer(buffer):
+    """Return a ctypes char array sharing memory with buffer, and its size
+    in bytes. A ctypes array (eg: from hid_wrap_buffer()) is returned as
+    it is. For internal use only."""
+
+    if isinstance(buffer, Array):
+        return buffer, sizeof(buffer)
+    if isinstance(buffer, bytearray):
+        length = len(buffer)
+    elif hasattr(buffer, 'nbytes'):
+        length = buffer.nbytes
+    else:
+        length = len(buffer) * getattr(buffer, 'itemsize', 1)
+    return (c_char * length).from_buffer(buffer), length
+
+
+# For internal use only: Pass a Python buffer to the library.
+def __c_data(data):
+    """Return an object that can be passed to the library as a pointer to
+    the contents of data, and the size of data in bytes.
+
+    Byte strings are passed directly and writable buffers are shared
+    without copying. Other buffer-protocol objects are copied in a single
+    block, and anything else (eg: a list of ints) is converted with
+    bytearray(). For internal use only."""
+
+    if isinstance(data, bytes):
+        return data, len(data)
+    try:
+        return __c_buffer(data)
+    except TypeError:
+        pass
+    try:
+        data = memoryview(data).tobytes()
+    except TypeError:
+        data = bytes(bytearray(data))
+    return data, len(data)
+
+
+# For internal use only: Path name of the library path cache file.
+def __cache_path():
+    """Return the path name of the file caching the library path.
+    For internal use only."""
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'pyhidapi', 'library-path')
+
+
+# For internal use only: Find and open the hidapi library.
+def __open_hidapi(path=None):
+    """Open the hidapi library, and return it and its path.
+
+    The library is taken from path, the HIDAPI_LIBRARY environment
+    variable, the cache file, or else searched for with find_library()
+    and the result written to the cache file. For internal use only."""
+
+    if path is None:
+        path = os.environ.get('HIDAPI_LIBRARY') or None
+    if path is not None:
+        return CDLL(path), path
+
+    cache = __cache_path()
+    try:
+        with open(cache) as f:
+            path = f.read().strip()
+        return CDLL(path), path
+    except (IOError, OSError):
+        pass
+
+    # Only imported when needed: importing ctypes.util is slow too.
+    from ctypes.util import find_library
+    path = find_library(__LIBNAME)
+    if path is None:
+        raise RuntimeError('Could not find the hidapi shared library.')
+    library = CDLL(path)
+    try:
+        if not os.path.isdir(os.path.dirname(cache)):
+            os.makedirs(os.path.dirname(cache))
+        tmp_path = '%s.%d.tmp' % (cache, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(path + '\n')
+        os.rename(tmp_path, cache)
+    except (IOError, OSError):
+        pass                            # a read-only home only costs speed
+    return library, path
 
 
 # For internal use only: Load the hidapi library.
-def __load_hidapi():
+def __load_hidapi(path=None):
     """Load the hidapi library. For internal use only."""
 
     global __hidapi
     global __libpath
 
     if __hidapi is None:
-        # Search for the hidapi library.
-        __libpath = find_library('hidapi-hidraw')
-        if __libpath is None:
-            raise RuntimeError('Could not find the hidapi shared library.')
-
-        # Load the hidapi library.
-        __hidapi = CDLL(__libpath)
+        # Find and load the hidapi library.
+        __hidapi, __libpath = __open_hidapi(path)
         assert __hidapi is not None
 
         # Define argument and return types for the hidapi library functions.
@@ -288,9 +392,10 @@ def hid_get_feature_report(device, data):
     Arguments:
         device: A device handle returned by hid_open().
 
-        data: A bytearray to be sent to the device as the feature report
-              request. Set the first byte to the desired report ID, or
-              0x00 if the device does not use numbered reports.
+        data: A bytearray (or any other buffer) to be sent to the device
+              as the feature report request. Set the first byte to the
+              desired report ID, or 0x00 if the device does not use
+              numbered reports.
 
     Returns:
         Bytearray containing report from device. The first byte
@@ -300,16 +405,13 @@ def hid_get_feature_report(device, data):
     global __hidapi
     assert __hidapi is not None
 
-    buf = create_string_buffer(len(data))
-    for n in range(len(data)):
-        buf[n] = chr(data[n])
-    num = __hidapi.hid_get_feature_report(device, buf, len(data))
+    data, length = __c_data(data)
+    buf = create_string_buffer(length)
+    memmove(buf, data, length)
+    num = __hidapi.hid_get_feature_report(device, buf, length)
     if num < 0:
         raise RuntimeError('hid_get_feature_report() failed.')
-    ba = bytearray(num)
-    for n in range(num):
-        ba[n] = buf[n]
-    return ba
+    return bytearray(buf.raw[:num])
 
 
 def hid_get_indexed_string(device, string_index):
@@ -401,15 +503,25 @@ def hid_get_serial_number_string(device):
 
 
 
-def hid_init():
+def hid_init(path=None):
     """Initialize the hidapi library.
 
     User code must call this function before calling any other functions
-    defined by this module."""
+    defined by this module.
+
+    Arguments:
+        path: Path name of the hidapi shared library to load. Defaults
+              to the HIDAPI_LIBRARY environment variable, or else the
+              library is searched for, and the result cached.
+
+    Returns:
+        None
+        Raises RuntimeError exception if the library cannot be found or
+        initialized, or OSError exception if it cannot be loaded."""
 
     global __hidapi
     if __hidapi is None:
-        __load_hidapi()
+        __load_hidapi(path)
     assert __hidapi is not None
     if __hidapi.hid_init() != 0:
         raise RuntimeError('hid_init() failed.')
@@ -489,11 +601,41 @@ def hid_read(device, length):
     buf = create_string_buffer(length)
     num = __hidapi.hid_read(device, buf, length)
     if num < 0:
-        raise RuntimeError('hid_write() failed.')
-    ba = bytearray(num)
-    for n in range(num):
-        ba[n] = buf[n]
-    return ba
+        raise RuntimeError('hid_read() failed.')
+    return bytearray(buf.raw[:num])
+
+
+def hid_read_into(device, buffer):
+    """Read an Input report from a HID device into a preallocated buffer.
+
+    Like hid_read(), but the report is written in place into buffer
+    instead of being returned in a newly allocated bytearray, so a polling
+    loop can reuse the same buffer for every report. At most as many bytes
+    as buffer holds are read.
+
+    Wrapping a bytearray for ctypes costs about as much as the read
+    itself, so a polling loop should wrap its buffer once with
+    hid_wrap_buffer() and pass the wrapper instead.
+
+    Arguments:
+        device: A device handle returned by hid_open().
+
+        buffer: A writable buffer, such as a bytearray or an array.array
+                (or a writable memoryview on Python 3), or a ctypes array
+                such as one returned by hid_wrap_buffer().
+
+    Returns:
+        Actual number of bytes read into buffer.
+        Raises RuntimeError exception if an error occurs."""
+
+    global __hidapi
+    assert __hidapi is not None
+
+    buf, length = __c_buffer(buffer)
+    num = __hidapi.hid_read(device, buf, length)
+    if num < 0:
+        raise RuntimeError('hid_read() failed.')
+    return num
 
 
 def hid_read_timeout(device, length, milliseconds):
@@ -523,11 +665,41 @@ def hid_read_timeout(device, length, milliseconds):
     buf = create_string_buffer(length)
     num = __hidapi.hid_read_timeout(device, buf, length, milliseconds)
     if num < 0:
-        raise RuntimeError('hid_write() failed.')
-    ba = bytearray(num)
-    for n in range(num):
-        ba[n] = buf[n]
-    return ba
+        raise RuntimeError('hid_read_timeout() failed.')
+    return bytearray(buf.raw[:num])
+
+
+def hid_read_timeout_into(device, buffer, milliseconds):
+    """Read an Input report from a HID device into a preallocated buffer,
+    with timeout.
+
+    Like hid_read_timeout(), but the report is written in place into
+    buffer instead of being returned in a newly allocated bytearray. At
+    most as many bytes as buffer holds are read.
+
+    Arguments:
+        device: A device handle returned by hid_open().
+
+        buffer: A writable buffer, such as a bytearray or an array.array
+                (or a writable memoryview on Python 3), or a ctypes array
+                such as one returned by hid_wrap_buffer().
+
+        milliseconds: Timeout in milliseconds, or -1 for blocking read.
+
+    Returns:
+        Actual number of bytes read into buffer.
+        If no packet was available to be read within the timeout,
+        returns 0.
+        Raises RuntimeError exception if an error occurs."""
+
+    global __hidapi
+    assert __hidapi is not None
+
+    buf, length = __c_buffer(buffer)
+    num = __hidapi.hid_read_timeout(device, buf, length, milliseconds)
+    if num < 0:
+        raise RuntimeError('hid_read_timeout() failed.')
+    return num
 
 
 def hid_send_feature_report(device, data):
@@ -551,7 +723,8 @@ def hid_send_feature_report(device, data):
     Arguments:
         device: A device handle returned by hid_open().
 
-        data: A bytearray containing the data to be written.
+        data: A bytearray (or any other buffer) containing the data to be
+              written.
 
     Returns:
         Actual number of bytes written.
@@ -560,10 +733,8 @@ def hid_send_feature_report(device, data):
     global __hidapi
     assert __hidapi is not None
 
-    buf = create_string_buffer(len(data))
-    for n in range(len(data)):
-        buf[n] = chr(data[n])
-    num = __hidapi.hid_send_feature_report(device, buf, len(data))
+    buf, length = __c_data(data)
+    num = __hidapi.hid_send_feature_report(device, buf, length)
     if num == -1:
         raise RuntimeError('hid_send_feature_report() failed.')
     return num
@@ -619,7 +790,9 @@ def hid_write(device, data):
     Arguments:
         device: A device handle returned by hid_open().
 
-        data: A bytearray containing the data to be written.
+        data: A bytearray (or any other buffer) containing the data to be
+              written. Bytes and writable buffers are passed to the
+              library without being copied.
 
     Returns:
         Actual number of bytes written.
@@ -628,15 +801,46 @@ def hid_write(device, data):
     global __hidapi
     assert __hidapi is not None
 
-    buf = create_string_buffer(len(data))
-    for n in range(len(data)):
-        buf[n] = chr(data[n])
-    num = __hidapi.hid_write(device, buf, len(data))
+    buf, length = __c_data(data)
+    num = __hidapi.hid_write(device, buf, length)
     if num == -1:
         raise RuntimeError('hid_write() failed.')
     return num
 
 
+def hid_write_many(device, reports):
+    """Write a sequence of Output reports to a HID device.
+
+    Each report is written as by hid_write(), but the per-call setup is
+    done once for the whole sequence, which makes this the cheaper way to
+    send eg: all the stripes of a display frame.
+
+    A failed write does not stop the remaining reports from being sent,
+    and does not raise an exception. Check the returned list instead,
+    and call hid_error() for details.
+
+    Arguments:
+        device: A device handle returned by hid_open().
+
+        reports: An iterable of bytearrays (or any other buffers), each
+                 containing one report to be written.
+
+    Returns:
+        List holding, for each report in order, the actual number of
+        bytes written, or -1 if writing that report failed."""
+
+    global __hidapi
+    assert __hidapi is not None
+
+    write   = __hidapi.hid_write
+    c_data  = __c_data
+    results = []
+    for data in reports:
+        buf, length = c_data(data)
+        results.append(write(device, buf, length))
+    return results
+
+
 # Define additional convenience functions:
 
 def hid_lib_path():
@@ -653,3 +857,48 @@ def hid_lib_path():
     assert __hidapi is not None
 
     return __libpath
+
+
+def hid_use_library(library, path=''):
+    """Use an object in place of the hidapi shared library.
+
+    The object must provide the functions of the hidapi C API (hid_init(),
+    hid_enumerate(), hid_open(), hid_read(), hid_write(), ...), which are
+    called exactly as the functions of the shared library would be. Call
+    this before hid_init(), which will then initialize the given object
+    instead of loading the shared library.
+
+    Arguments:
+        library: Object providing the hidapi C functions.
+
+        path:    String to be returned by hid_lib_path().
+
+    Returns:
+        None"""
+
+    global __hidapi
+    global __libpath
+
+    __hidapi  = library
+    __libpath = path
+
+
+def hid_wrap_buffer(buffer):
+    """Wrap a writable buffer for repeated reads with hid_read_into().
+
+    Passing a bytearray to hid_read_into() or hid_read_timeout_into()
+    wraps it in a ctypes array on every call. The wrapper returned here
+    shares memory with buffer and can be passed in its place, so reports
+    read into it appear in buffer without that per-call cost.
+
+    While the wrapper exists, a bytearray buffer cannot be resized.
+
+    Arguments:
+        buffer: A writable buffer, such as a bytearray or an array.array
+                (or a writable memoryview on Python 3).
+
+    Returns:
+        ctypes char array sharing memory with buffer.
+        Raises TypeError exception if buffer is not writable."""
+
+    return __c_buffer(buffer)[0]
@@ -3,47 +3,83 @@
 import hidapi
 import binascii
 import time
+import os
+
+# set MASCHINE_VIRTUAL to run against a simulated controller
+if os.environ.get("MASCHINE_VIRTUAL"):
+    from maschine.virtual import VirtualLibrary, VirtualMaschine
+    hidapi.hid_use_library(VirtualLibrary([VirtualMaschine(pad_pattern="sweep",
+                                                           button_rate=50,
+                                                           button_pattern="cycle")]),
+                           "<virtual>")
 
 hidapi.hid_init()
     
 print 'Loaded hidapi library from: {:s}\n'.format(hidapi.hid_lib_path())
 
-devices = hidapi.hid_enumerate(0x17cc, 0x1140)
-if len(devices) == 0:
+# set MASCHINE_METRICS to measure reads, decoding and writes;
+# kill -USR1 the process to print a snapshot as JSON
+hid = hidapi
+metrics = None
+if os.environ.get("MASCHINE_METRICS"):
+    from maschine.metrics import Metrics
+    metrics = Metrics()
+    metrics.dump_on_signal()
+    hid = metrics.instrument()
+
+# every attached maschine is opened, and all of them are read from
+# one poll loop; the first one also shows the display and LED demo
+from maschine.devices import DeviceManager
+manager = DeviceManager(hid=hid)
+manager.open_all()
+if len(manager.devices) == 0:
     print "No maschine attached"
     exit(1)
 
-device = hidapi.hid_open(0x17cc, 0x1140)
-
-quiet_state = "20000000100020003000400050006000700080009000a000b000c000d000e000f0000000100020003000400050006000700080009000a000b000c000d000e000f0"
+device = manager.devices[0].handle
 
 to_bytearray = lambda display: [bytearray(line.replace(" ", "").decode("hex")) for line in display]
-write_display = lambda display: [hidapi.hid_write(device, line) for line in to_bytearray(display)]
+
+# all output goes through a scheduler which sends LED reports
+# ahead of display stripes, on a background thread
+from maschine.scheduler import OutputScheduler
+scheduler = OutputScheduler(device, hid=hid)
+scheduler.start()
+
+# framebuffers only send the stripes which changed; with
+# MASCHINE_FRAMES set (see below) the first display shows streamed
+# frames instead, and is left out here
+from maschine.display import FrameBuffer, STRIPE_HEADER
+displays = [FrameBuffer(0), FrameBuffer(1)]
+streamed = 0 if os.environ.get("MASCHINE_FRAMES") else None
+
+def show(framebuffer):
+    if framebuffer.display_no != streamed:
+        scheduler.submit_display(framebuffer)
+
+def write_display(packets):
+    framebuffer = displays[packets[0][0] & 0x0f]
+    framebuffer.load(bytearray().join(packet[STRIPE_HEADER:] for packet in packets))
+    show(framebuffer)
 
 def clear_display(no):
-    for i in range(0, 8):
-        hidapi.hid_write(device, (bytearray((("e00000%02x00200008" % (8 * i) + ((265 - 8) * "00")).replace("e0", "e%d" %no)).decode("hex"))))
-
-led_state = bytearray("820a0a0a 0a0a0a0a 0a0a0a0a 0a0a0a0a 0a0a0a0a 0a0a0a0a 0a3f3f3f 3f3f3f3f".replace(" ", "").decode("hex"))
-hidapi.hid_write(device, led_state)
-
-def import_image(display_no, fname):
-    import textwrap
-    result_str = open(fname, "r").read()
-    result_bytes = textwrap.wrap(result_str, 2)
-    # reverse bits of each byte
-    result_bytes = ''.join(['%02x' % int('{0:08b}'.format(int(n, 16))[::-1], 2) for n in result_bytes])
-    print result_bytes
-    result_lines = textwrap.wrap(result_bytes, 512)
-    result = []
-    for i in range(0,8):
-        result.append("e%01x0000%02x0020000800%s" % (display_no, i * 8, result_lines[i]))
-    return result
-
-tux = import_image(0, "tux.hex")
-test = import_image(1, "test.hex")
-
-machinelogo = [
+    displays[no].fill(False)
+    show(displays[no])
+
+# LED changes are collected and only the changed reports are sent
+from maschine.leds import BUTTON_LEDS, GROUP_COUNT, PAD_COUNT, TRANSPORT_LEDS, LedManager
+leds = LedManager()
+for i in range(len(BUTTON_LEDS)):
+    leds.set_led(i, 0x0a if i < 24 else 0x3f)
+scheduler.submit_leds(leds)
+
+# images are loaded straight from GIMP's XBM files; like the images
+# below, they are only decoded when they are shown, not at startup
+from maschine.images import load_packets
+tux = lambda: load_packets(0, "tux.xbm")
+test = lambda: load_packets(1, "test.xbm")
+
+machinelogo = lambda: to_bytearray([
     "e0000000002000080080000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000",
     "e0000008002000080080000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000",
     "e0000010002000080080000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000007e00000000000000000000000000000000000000000000000000000000000003ffc000000000000000000000000000000000000000000000000000000000000fe7f000000000000000000000000000000000000000000000000000000000001e0078003f800fe003f0003ff8001ff007e00fc3e0f801f0ffff00000000000038001c003f800fe007f800fffe003ffc07e00fc3e0fc01f0ffff000000000000707e0e003fc01fe007f801ffff00fffe07e00fc3e0fe01f0ffff000000",
@@ -52,9 +88,9 @@ machinelogo = [
     "e00000280020000800800000707e0e003e1fc3e3f003f1ffff80fffe07e00fc3e0f807f0ffff00000000000038001c003e0f83e3e001f07fff007ffc07e00fc3e0f807f0ffff0000000000001e0078003e0f83e7e001f81ffc001ff007e00fc3e0f803f0ffff0000000000000fe7f0000000000000000000000000000000000000000000000000000000000003ffc0000000000000000000000000000000000000000000000000000000000000ff00000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000",
     "e0000030002000080080000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000",
     "e0000038002000080080000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000",
-]
+])
 
-machineicon = [
+machineicon = lambda: to_bytearray([
     "e10000000020000800000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000003fffffffffffffc000000000000000000000000000000000000000000000000",
     "e1000008002000080003fffffffffffffc00000000000000000000000000000000000000000000000003fffffffffffffc00000000000000000000000000000000000000000000000003fffffffffffffc00000000000000000000000000000000000000000000000003c4718c6318c63c00000000000000000000000000000000000000000000000003c4718c6318c63c00000000000000000000000000000000000000000000000003fffffffffffffc00000000000000000000000000000000000000000000000003fffffffffffffc00000000000000000000000000000000000000000000000003c470000300003c000000000000000000000000000000000000000000000000",
     "e1000010002000080003c470000300003c00000000000000000000000000000000000000000000000003c470000300003c00000000000000000000000000000000000000000000000003fff0000300003c00000000000000000000000000000000000000000000000003c470000300003c00000000000000000000000000000000000000000000000003c470000300003c00000000000000000000000000000000000000000000000003c470000300003c000f3f3cf9f8633c78f336cdf078f3efdb679f3e0f3e000003fffffffffffffc00198c66cc607766cd9b36cd80cd9b031b6cd9b019b3000003fffffffffffffc00180c66cc607f66c18336ed80c19b031b6cd9b019b30000",
@@ -63,38 +99,305 @@ machineicon = [
     "e1000028002000080003c44478e082083c001f3e78f1e079fb7863f60cdf8c7ccd80f337c1adb3600003c4447ffffffffc00183c6018300d9b6060c60cdb8c78cd80c337818db3600003fffff8e082083c001836619b30cd9b6060c66cd98c6ccd80c336c18db3600003c44478e082083c0018337cf1e0799b606003c7998c6679f0c1e6618dbe600003c4447fe082083c00000000000000000000000000000000000000000000000003fffff8e082083c00000000000000000000000000000000000000000000000003fffff8e082083c00000000000000000000000000000000000000000000000003fffffffffffffc000000000000000000000000000000000000000000000000",
     "e1000030002000080003c44478e082083c00000000000000000000000000000000000000000000000003c44478e082083c00000000000000000000000000000000000000000000000003ffffffe082083c00000000000000000000000000000000000000000000000003c44478e082083c00000000000000000000000000000000000000000000000003c44478e082083c00000000000000000000000000000000000000000000000003fffffffffffffc00000000000000000000000000000000000000000000000003fffffffffffffc00000000000000000000000000000000000000000000000003fffffffffffffc000000000000000000000000000000000000000000000000",
     "e1000038002000080003fffffffffffffc0000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000",
-]
+])
 
 clear_display(0)
 time.sleep(1)
 clear_display(1)
 time.sleep(1)
-write_display(tux)
+write_display(tux())
 time.sleep(1)
-write_display(machineicon)
+write_display(machineicon())
 
 count = 0
 
+# pad reports are reduced to press/release/pressure events per pad,
+# and button reports to button down/up and encoder events; each
+# device has its own decoders, kept by device tag
+from maschine.pads import PAD_REPORT_ID, PadChangeDetector, decode_pads
+from maschine.buttons import BUTTON_REPORT_ID, ButtonDecoder
+pad_detectors = {}
+button_decoders = {}
+
+# with more than one maschine, output lines start with the device tag
+label = lambda d: "%d: " % d.tag if len(pad_detectors) > 1 else ""
+
+# set MASCHINE_MIDI to a file, pipe, raw MIDI device or alsa:<port>
+# (eg: alsa:virtual) to play notes with the pads; each maschine
+# plays on its own MIDI channel
+midi = None
+pad_midis = {}
+if os.environ.get("MASCHINE_MIDI"):
+    from maschine.midi import PadMidi, open_sink
+    midi = open_sink(os.environ["MASCHINE_MIDI"])
+
+# set MASCHINE_OSC to host:port to stream the events there as OSC,
+# and MASCHINE_OSC_LISTEN to a port to take LED and display commands on;
+# the events of a second maschine are sent as /maschine/1/..., etc.
+osc = None
+osc_commands = None
+if os.environ.get("MASCHINE_OSC"):
+    from maschine.osc import OscSender
+    host, port = os.environ["MASCHINE_OSC"].rsplit(":", 1)
+    osc = {}
+if os.environ.get("MASCHINE_OSC_LISTEN"):
+    from maschine.osc import OscReceiver
+    osc_commands = OscReceiver(("", int(os.environ["MASCHINE_OSC_LISTEN"])), leds, displays)
+
+# set MASCHINE_ONSETS to detect the strikes of the pads as they happen,
+# with a velocity from how fast the pressure rises; their strikes and
+# releases then play the MIDI notes instead of the presses and releases
+onset_detectors = None
+if os.environ.get("MASCHINE_ONSETS"):
+    from maschine.pads import PAD_PRESSURE, PAD_RELEASE, OnsetDetector
+    onset_detectors = {}
+
+# set MASCHINE_ENCODERS to a window in milliseconds to sum the steps of
+# each encoder over it into one event, faster turns counting for more
+encoder_window = None
+aggregators = {}
+if os.environ.get("MASCHINE_ENCODERS"):
+    from maschine.buttons import EncoderAggregator, linear_acceleration
+    encoder_window = float(os.environ["MASCHINE_ENCODERS"]) / 1000
+
+# a maschine with a calibration profile stored under its serial number
+# (see maschine/calibration.py) has its pad pressures calibrated; one
+# whose serial number or profile cannot be read keeps the raw pressures
+from maschine.calibration import load_profile
+calibrations = {}
+
+def setup(source):
+    try:
+        calibration = load_profile(hid.hid_get_serial_number_string(source.handle))
+    except (RuntimeError, ValueError) as e:
+        print "%sno calibration: %s" % (label(source), e)
+        calibration = None
+    if calibration is not None:
+        calibrations[source.tag] = calibration
+    else:
+        calibrations.pop(source.tag, None)
+    pad_detectors[source.tag] = PadChangeDetector()
+    if onset_detectors is not None:
+        onset_detectors[source.tag] = OnsetDetector()
+    button_decoders[source.tag] = ButtonDecoder()
+    if encoder_window is not None:
+        aggregators[source.tag] = EncoderAggregator(encoder_window,
+                                                    acceleration=linear_acceleration())
+    if midi is not None:
+        pad_midis[source.tag] = PadMidi(channel=source.tag % 16)
+    if osc is not None:
+        osc[source.tag] = OscSender((host, int(port)),
+                                    prefix="/maschine" if source.tag == 0 else "/maschine/%d" % source.tag)
+
+for source in manager.devices:
+    setup(source)
+
+# set MASCHINE_FRAMES to stream a live view of the pad pressures to the
+# first display at 30 frames per second, drawn as greyscale frames and
+# dithered; frames the maschine cannot take in time are dropped
+frames = None
+if os.environ.get("MASCHINE_FRAMES"):
+    import numpy
+    from maschine.frames import FrameStreamer
+    frames = FrameStreamer(scheduler)
+    frames.start()
+    frame = numpy.zeros((64, 256), dtype=numpy.uint8)
+    shade = numpy.linspace(64, 255, 64).astype(numpy.uint8)[::-1, None]
+    rows = numpy.arange(64)[::-1, None]
+    levels = numpy.zeros(16, dtype=numpy.int32)
+    next_frame = time.time()
+
+def draw_frame():
+    heights = numpy.repeat(levels * 64 // 4096, 16)
+    numpy.copyto(frame, numpy.where(rows < heights, shade, 0))
+    frames.submit(frame)
+
+# a maschine plugged in later is opened too, and one which is unplugged
+# is closed, without enumerating the devices over and over; if the one
+# showing the demo goes, the next one takes over
+from maschine.hotplug import DeviceWatcher
+
+output = manager.devices[0]
+
+def move_outputs():
+    global output, scheduler, frames
+    if output in manager.devices or len(manager.devices) == 0:
+        return
+    output = manager.devices[0]
+    if frames is not None:
+        frames.stop()
+    scheduler.stop(drain=False)
+    scheduler = OutputScheduler(output.handle, hid=hid)
+    scheduler.start()
+    leds.mark_dirty()
+    scheduler.submit_leds(leds)
+    for framebuffer in displays:
+        framebuffer.mark_dirty()
+        show(framebuffer)
+    if frames is not None:
+        frames = FrameStreamer(scheduler)
+        frames.start()
+
+def connected(info):
+    try:
+        source = manager.open(info.path, info.serial_number)
+    except RuntimeError:
+        # udev may not have given access yet, try again on the next change
+        watcher.forget(info.path)
+        return
+    setup(source)
+    print "%sconnected %s" % (label(source), info.path)
+    move_outputs()
+
+def disconnected(info):
+    # a maschine whose reads failed may have been closed by the manager already
+    source = manager.device(info.path)
+    if source is not None:
+        manager.close(source)
+    print "disconnected %s" % info.path
+    move_outputs()
+
+watcher = DeviceWatcher(on_connect=connected, on_disconnect=disconnected, hid=hid)
+if watcher.fileno() is not None:
+    manager.add_fd(watcher.fileno(), watcher.poll)
+
+# OSC commands wake up the loop as soon as they arrive
+def osc_received():
+    if osc_commands.poll():
+        scheduler.submit_leds(leds)
+        for framebuffer in displays:
+            show(framebuffer)
+
+if osc_commands is not None:
+    manager.add_fd(osc_commands.fileno(), osc_received)
+
+# set MASCHINE_CAPTURE to a file name to record all reports; the
+# buffered records are written out however the script exits
+capture = None
+if os.environ.get("MASCHINE_CAPTURE"):
+    import atexit
+    from maschine.capture import Recorder
+    capture = Recorder(os.environ["MASCHINE_CAPTURE"])
+    atexit.register(capture.close)
+
+# set MASCHINE_PARAMETERS to show the values of the 8 knobs on the
+# second display, drawn at runtime with maschine.render
+parameters = None
+if os.environ.get("MASCHINE_PARAMETERS"):
+    from maschine import render
+    from maschine.buttons import ENCODER
+    parameters = [64] * 8
+
+def show_parameters(selected=None):
+    framebuffer = displays[1]
+    for n, value in enumerate(parameters):
+        render.text(framebuffer, n * 4, 0, " K%d " % (n + 1), invert=n == selected)
+        render.knob(framebuffer, n * 4 + 1, 12, value, 127)
+        render.text(framebuffer, n * 4, 32, "%4d" % value)
+        render.bar(framebuffer, n * 4, 44, 4, value, 127)
+    show(framebuffer)
+
+if parameters is not None:
+    render.clear(displays[1], 0, 0, 32, 64)
+    show_parameters()
+
+def button_events(source, events, timestamp=None):
+    if osc is not None and events:
+        osc[source.tag].send(events, timestamp)
+    for event in events:
+        print "%s%-16s %-8s %d" % (label(source), event.name, event.kind, event.value)
+        if parameters is not None and event.kind == ENCODER and event.name.startswith("knob"):
+            n = int(event.name[4:]) - 1
+            parameters[n] = min(max(parameters[n] + event.value, 0), 127)
+            show_parameters(n)
+
+# runs until interrupted with ctrl-c, waiting for a maschine to be
+# plugged in again when all of them are gone
 import random
-while True:
-    count += 1
-    if count == 100:
-        led_state = bytearray(("82" + ''.join(format(random.randint(0,255), '02x') for _ in range(31))).decode("hex"))
-        hidapi.hid_write(device, led_state)
+try:
+    while True:
+        timeout = 0.1
+        if osc is not None:
+            timeout = min([timeout] + [sender.timeout() for sender in osc.values()
+                                       if sender.timeout() is not None])
+        timeout = min([timeout] + [aggregator.timeout() for aggregator in aggregators.values()
+                                   if aggregator.timeout() is not None])
+        if frames is not None:
+            timeout = min(timeout, max(next_frame - time.time(), 0))
+        for source, timestamp, report in manager.poll(timeout):
+            if capture is not None:
+                capture.record(report, timestamp_ns=int(timestamp * 1e9), device=source.tag)
+            count += 1
+            if count == 100:
+                for i in range(len(BUTTON_LEDS)):
+                    leds.set_led(i, random.randint(0,255))
+
+                # 16 rgb buttons
+                for i in range(PAD_COUNT):
+                    leds.set_pad_rgb(i, random.randint(0,255), random.randint(0,255), random.randint(0,255))
+
+                # 8 group rgb_1 + 8 group rgb_2 + 8 transport buttons
+                for i in range(GROUP_COUNT):
+                    for half in (0, 1):
+                        leds.set_group_rgb(i, random.randint(0,255), random.randint(0,255), random.randint(0,255), half)
+                for name in TRANSPORT_LEDS:
+                    leds.set_led(name, random.randint(0,255))
+                scheduler.submit_leds(leds)
 
-        # 16 rgb buttons
-        pad_state = bytearray(("80" + ''.join(format(random.randint(0,255), '02x') for _ in range(16 * 3))).decode("hex"))
-        hidapi.hid_write(device, pad_state)
+                count = 0
 
-        # 8 group rgb_1 + 8 group rgb_2 + 8 transport buttons
-        group_other_btn_state = bytearray(("81" + ''.join(format(random.randint(0,255), '02x') for _ in range(((8 + 8) * 3) + 8))).decode("hex"))
-        hidapi.hid_write(device, group_other_btn_state)
+            if report[0] == PAD_REPORT_ID:
+                pressures = decode_pads(report)[0]
+                if source.tag in calibrations:
+                    pressures = calibrations[source.tag].apply(pressures)
+                if frames is not None and source is output:
+                    levels[:] = pressures
+                events = pad_detectors[source.tag].update(pressures, timestamp)
+                if onset_detectors is not None:
+                    strikes = onset_detectors[source.tag].update(pressures, timestamp)
+                    notes = [event for event in events if event.kind == PAD_PRESSURE] + strikes
+                    events += [event for event in strikes if event.kind != PAD_RELEASE]
+                else:
+                    notes = events
+                if midi is not None and notes:
+                    midi.write(pad_midis[source.tag].translate(notes))
+                if osc is not None and events:
+                    osc[source.tag].send(events, timestamp)
+                for event in events:
+                    print "%spad %2d %-8s %4d" % (label(source), event.pad, event.kind, event.value)
+            elif report[0] == BUTTON_REPORT_ID:
+                events = button_decoders[source.tag].decode(report, timestamp)
+                if source.tag in aggregators:
+                    events = aggregators[source.tag].process(events, timestamp)
+                button_events(source, events, timestamp)
+            else:
+                print "%s#%d: %s"  % (label(source), len(report), binascii.hexlify(report))
+            if metrics is not None:
+                metrics.decoded(timestamp)
 
-        count = 0
+        if frames is not None and time.time() >= next_frame:
+            next_frame = max(next_frame + 1 / 30.0, time.time())
+            draw_frame()
+        for source in manager.devices:
+            if source.tag in aggregators:
+                button_events(source, aggregators[source.tag].poll())
+        if osc is not None:
+            for sender in osc.values():
+                sender.poll()
 
-    result = hidapi.hid_read(device, 256)
-    state = binascii.hexlify(result)
-    if state != quiet_state:
-        print "#%d: %s"  % (len(result), state)
+        if watcher.fileno() is None:
+            watcher.poll()
+except KeyboardInterrupt:
+    pass
 
-hidapi.hid_close(device)
+if midi is not None:
+    for pad_midi in pad_midis.values():
+        midi.write(pad_midi.all_notes_off())
+    midi.close()
+if frames is not None:
+    frames.stop()
+scheduler.stop()
+watcher.close()
+if osc_commands is not None:
+    osc_commands.close()
+manager.close_all()
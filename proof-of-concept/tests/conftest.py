@@ -0,0 +1,74 @@
+"""Fixtures shared by the tests.
+
+The tests run against the simulated controller of maschine.virtual, so
+they need neither a Maschine nor the hidapi shared library, only NumPy
+and pytest:
+
+    $ cd proof-of-concept
+    $ python -m pytest tests
+"""
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'pyhidapi')]
+
+import pytest
+
+import hidapi
+from maschine.virtual import PRODUCT_ID, VENDOR_ID, VirtualLibrary, VirtualMaschine
+
+
+@pytest.fixture
+def open_virtual():
+    """Return a function which plugs in VirtualMaschines through the
+    hidapi module and opens the first one; the handles are closed after
+    the test."""
+
+    handles = []
+
+    def open_virtual(*machines):
+        if not machines:
+            machines = (VirtualMaschine(realtime=False, seed=1),)
+        hidapi.hid_use_library(VirtualLibrary(list(machines)), '<virtual>')
+        hidapi.hid_init()
+        handle = hidapi.hid_open(VENDOR_ID, PRODUCT_ID)
+        handles.append(handle)
+        return handle
+
+    yield open_virtual
+    for handle in handles:
+        hidapi.hid_close(handle)
+
+
+class RecordingHid(object):
+    """Stand-in for the hidapi module which records the reports written
+    and can be told to fail writes."""
+
+    def __init__(self):
+        self.written = []
+        self.fail    = 0            # number of writes to fail from now on
+        self.error   = RuntimeError
+
+    def hid_write(self, device, data):
+        if self.fail:
+            self.fail -= 1
+            raise self.error('hid_write() failed.')
+        self.written.append(bytes(data))
+        return len(data)
+
+    def hid_write_many(self, device, reports):
+        results = []
+        for report in reports:
+            try:
+                results.append(self.hid_write(device, report))
+            except RuntimeError:
+                results.append(-1)
+        return results
+
+
+@pytest.fixture
+def recording_hid():
+    return RecordingHid()
@@ -0,0 +1,87 @@
+import asyncio
+import errno
+import os
+
+import pytest
+
+from maschine.aio import AsyncDevice
+from maschine.virtual import VirtualMaschine
+
+
+class PipeHid(object):
+    """Stand-in for the hidapi module whose device reads from a pipe,
+    so that AsyncDevice watches a file descriptor as with hidraw."""
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        self.nonblocking = None
+        self.reads       = 0
+
+    def hid_fileno(self, device):
+        return self.read_fd
+
+    def hid_set_nonblocking(self, device, nonblock):
+        self.nonblocking = nonblock
+
+    def hid_read_into(self, device, buffer):
+        self.reads += 1
+        try:
+            data = os.read(self.read_fd, len(buffer))
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return 0
+            raise
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+def test_read_and_write_the_virtual_device(open_virtual):
+    machine = VirtualMaschine(realtime=False, button_rate=0)
+    dev     = AsyncDevice(open_virtual(machine))
+    assert dev.fileno() is None
+    report  = bytearray([0x82]) + bytearray(31)
+
+    async def session():
+        reports = []
+        async for data in dev:
+            reports.append(data)
+            if len(reports) == 3:
+                break
+        written = await dev.write(report)
+        return reports, written
+
+    reports, written = asyncio.run(session())
+    assert [data[0] for data in reports] == [0x20] * 3
+    assert written == len(report) and machine.leds[0x82] == report
+    dev.close()
+
+
+def test_failed_write_raises(open_virtual):
+    dev = AsyncDevice(open_virtual())
+    with pytest.raises(RuntimeError):
+        asyncio.run(dev.write(bytearray(b'\x00')))
+
+
+def test_read_waits_on_the_file_descriptor():
+    hid = PipeHid()
+    dev = AsyncDevice(None, hid=hid)
+    assert dev.fileno() == hid.read_fd and hid.nonblocking
+
+    async def session():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.02, os.write, hid.write_fd, b'\x20\x01\x02')
+        return await dev.read_report()
+
+    try:
+        assert asyncio.run(session()) == bytearray(b'\x20\x01\x02')
+        # One read found nothing, the next one came after the wake-up.
+        assert hid.reads == 2
+        dev.close()
+        assert dev.fileno() is None and hid.nonblocking is False
+    finally:
+        hid.close()
@@ -0,0 +1,85 @@
+import hidapi
+from maschine.buttons import (BUTTON_DOWN, BUTTON_NAMES, BUTTON_REPORT_ID, BUTTON_UP,
+                              ENCODER, ButtonDecoder, ButtonEvent, EncoderAggregator,
+                              linear_acceleration)
+from maschine.virtual import VirtualMaschine
+
+PLAY  = BUTTON_NAMES.index('play')
+KNOB1 = 1                               # index of knob1 in ENCODERS
+
+
+def play_and_turn(n, buttons, encoders, rng):
+    buttons[PLAY] = 1 if n == 1 else 0
+    encoders[KNOB1] = (995 + 3 * n) % 1000  # wraps past 999
+
+
+def test_decode_virtual_reports(open_virtual):
+    handle  = open_virtual(VirtualMaschine(pad_rate=0, button_rate=100,
+                                           button_pattern=play_and_turn, realtime=False))
+    decoder = ButtonDecoder()
+    events  = []
+    for n in range(4):
+        report = hidapi.hid_read(handle, 256)
+        assert report[0] == BUTTON_REPORT_ID
+        events.append(decoder.decode(report, n))
+    assert events[0] == []
+    assert events[1] == [ButtonEvent(BUTTON_DOWN, 'play', 1, 1),
+                         ButtonEvent(ENCODER, 'knob1', 3, 1)]
+    assert events[2] == [ButtonEvent(BUTTON_UP, 'play', 0, 2),
+                         ButtonEvent(ENCODER, 'knob1', 3, 2)]
+    assert events[3] == [ButtonEvent(ENCODER, 'knob1', 3, 3)]
+
+
+def test_unchanged_report_has_no_events():
+    decoder = ButtonDecoder()
+    report  = bytearray(24)
+    report[0] = BUTTON_REPORT_ID
+    report[5] = 0x10                    # 'play' is bit 36
+    assert decoder.decode(report) == [ButtonEvent(BUTTON_DOWN, 'play', 1, None)]
+    assert decoder.decode(report) == []
+
+
+def turns(name, times, value=1):
+    return [ButtonEvent(ENCODER, name, value, t) for t in times]
+
+
+def test_aggregator_window():
+    aggregator = EncoderAggregator(window=0.02)
+    assert aggregator.process(turns('knob1', (0.0, 0.005, 0.01)), 0.01) == []
+    assert aggregator.timeout(0.01) == 0.01
+    assert aggregator.poll(0.02) == [ButtonEvent(ENCODER, 'knob1', 3, 0.01)]
+    assert aggregator.poll(1.0) == []
+
+
+def test_aggregator_passes_buttons_through():
+    aggregator = EncoderAggregator(window=0.02)
+    button = ButtonEvent(BUTTON_DOWN, 'play', 1, 0.0)
+    assert aggregator.process([button] + turns('knob2', (0.0,)), 0.0) == [button]
+    assert aggregator.flush() == [ButtonEvent(ENCODER, 'knob2', 1, 0.0)]
+
+
+def test_aggregator_count_only_reports_the_rest_when_idle():
+    aggregator = EncoderAggregator(window=None, count=4, idle=0.1)
+    times  = [n * 0.01 for n in range(6)]
+    events = aggregator.process(turns('knob1', times), times[-1])
+    assert events == [ButtonEvent(ENCODER, 'knob1', 4, times[3])]
+    assert aggregator.poll(0.1) == []
+    assert aggregator.timeout(0.1) > 0
+    assert aggregator.poll(0.16) == [ButtonEvent(ENCODER, 'knob1', 2, times[5])]
+
+
+def test_aggregator_carries_the_rounding_remainder():
+    aggregator = EncoderAggregator(window=0.02, acceleration=lambda speed: 1.5)
+    total = 0
+    for n in range(4):
+        start = n * 0.1
+        aggregator.process(turns('knob1', (start,)), start)
+        total += sum(event.value for event in aggregator.poll(start + 0.05))
+    assert total == 6
+
+
+def test_linear_acceleration():
+    curve = linear_acceleration(threshold=30.0, maximum=8.0)
+    assert curve(10.0) == 1.0
+    assert 1.0 < curve(100.0) <= 8.0
+    assert curve(1e6) == 8.0
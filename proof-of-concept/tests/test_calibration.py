@@ -0,0 +1,86 @@
+import numpy
+import pytest
+
+from maschine.calibration import (PadCalibration, learn_capture, load_profile,
+                                  save_profile)
+from maschine.capture import Recorder
+from maschine.pads import decode_pads
+from maschine.virtual import VirtualMaschine
+
+
+def test_default_calibration_is_the_identity():
+    calibration = PadCalibration()
+    pressures   = numpy.arange(0, 4096, 256, dtype=numpy.uint16)
+    assert (calibration.apply(pressures) == pressures).all()
+
+
+def test_floor_and_maximum_are_scaled_per_pad():
+    floor   = numpy.arange(16) * 10
+    maximum = 2000 + numpy.arange(16) * 100
+    calibration = PadCalibration(floor, maximum, scale=1000)
+    batch = numpy.array([floor, maximum, (floor + maximum) // 2, [4095] * 16],
+                        dtype=numpy.uint16)
+    out = numpy.empty_like(batch)
+    assert calibration.apply(batch, out=out) is out
+    assert (out[0] == 0).all()
+    assert (out[1] == 1000).all()
+    assert (abs(out[2].astype(int) - 500) <= 1).all()
+    assert (out[3] == 1000).all()
+
+
+def test_profile_round_trip(tmp_path):
+    calibration = PadCalibration(numpy.arange(16), 3000, curve='soft', scale=127)
+    path = save_profile(u'AB/12 34', calibration, str(tmp_path))
+    assert path.startswith(str(tmp_path)) and path.endswith('AB_12_34.json')
+    loaded = load_profile(u'AB/12 34', str(tmp_path))
+    assert (loaded.table == calibration.table).all()
+    assert loaded.curve == 'soft' and loaded.scale == 127
+    assert load_profile(u'other', str(tmp_path)) is None
+
+
+def test_function_curves_cannot_be_stored():
+    with pytest.raises(ValueError):
+        PadCalibration(curve=lambda x: x).profile()
+
+
+@pytest.mark.parametrize('text', [
+    '{"version": 1, "floor": [1, 2',
+    '{"version": 2, "floor": 0, "maximum": 4095, "curve": "linear", "scale": 4095}',
+    '{"version": 1, "maximum": 4095, "curve": "linear", "scale": 4095}',
+    '{"version": 1, "floor": [1, 2], "maximum": 4095, "curve": "linear", "scale": 4095}',
+    '[1, 2, 3]',
+])
+def test_invalid_profiles_raise(tmp_path, text):
+    (tmp_path / '0001.json').write_text(text)
+    with pytest.raises(ValueError):
+        load_profile(u'0001', str(tmp_path))
+
+
+def test_learn_from_a_capture(tmp_path):
+    def pattern(n, pressures, rng):
+        for pad in range(16):
+            if n < 100:
+                pressures[pad] = 5 + pad
+            else:
+                pressures[pad] = 3000 + pad if n % 10 == pad % 10 else 100
+
+    machine = VirtualMaschine(realtime=False, button_rate=0, pad_pattern=pattern)
+    path = str(tmp_path / 'session.cap')
+    with Recorder(path) as recorder:
+        for n in range(1000):
+            recorder.record(machine.next_report(None), timestamp_ns=n * 2000000)
+    calibrator  = learn_capture(path, idle=0.2, margin=10)
+    assert (calibrator.idle_samples, calibrator.hit_samples) == (100, 900)
+    calibration = calibrator.calibration()
+    assert list(calibration.floor) == [15 + pad for pad in range(16)]
+    assert list(calibration.maximum) == [3000 + pad for pad in range(16)]
+    report = machine.next_report(None)
+    assert (calibration.apply(decode_pads(report)[0]) <= 4095).all()
+
+
+def test_capture_without_pad_reports(tmp_path):
+    path = str(tmp_path / 'buttons.cap')
+    with Recorder(path) as recorder:
+        recorder.record(bytearray([0x10] * 25), timestamp_ns=0)
+    with pytest.raises(ValueError):
+        learn_capture(path)
@@ -0,0 +1,94 @@
+import pytest
+
+from maschine.capture import Recorder, Replayer
+
+
+def record(path, reports):
+    with Recorder(str(path)) as recorder:
+        for n, report in enumerate(reports):
+            recorder.record(report, timestamp_ns=n * 1000000, device=n % 2)
+
+
+REPORTS = [bytearray([0x20] + [n] * 64) for n in range(3)] + [bytearray([0x10] * 25)]
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'session.cap'
+    record(path, REPORTS)
+    replayer = Replayer(str(path), speed=None)
+    records  = [(timestamp, device, bytearray(report))
+                for timestamp, device, report in replayer.records()]
+    assert records == [(n * 1000000, n % 2, report) for n, report in enumerate(REPORTS)]
+    del records
+    assert [replayer.hid_read(None, 256) for report in REPORTS] == REPORTS
+    with pytest.raises(EOFError):
+        replayer.hid_read(None, 256)
+    replayer.rewind()
+    assert replayer.hid_read(None, 256) == REPORTS[0]
+    replayer.close()
+
+
+def test_device_filter(tmp_path):
+    path = tmp_path / 'session.cap'
+    record(path, REPORTS)
+    replayer = Replayer(str(path), speed=None, device=1)
+    assert [replayer.hid_read(None, 256) for n in range(2)] == [REPORTS[1], REPORTS[3]]
+    with pytest.raises(EOFError):
+        replayer.hid_read(None, 256)
+    replayer.close()
+
+
+def test_truncated_record_ends_the_capture(tmp_path):
+    path = tmp_path / 'crashed.cap'
+    record(path, REPORTS)
+    data = path.read_bytes()
+    path.write_bytes(data[:-5])
+
+    replayer = Replayer(str(path), speed=None)
+    assert len(list(replayer.records())) == 3
+    buf = bytearray(256)
+    for report in REPORTS[:3]:
+        assert replayer.hid_read_into(None, buf) == len(report)
+        assert len(buf) == 256
+    with pytest.raises(EOFError):
+        replayer.hid_read_into(None, buf)
+    assert len(buf) == 256
+    replayer.close()
+
+
+def test_truncated_record_header(tmp_path):
+    path = tmp_path / 'crashed.cap'
+    record(path, REPORTS[:1])
+    path.write_bytes(path.read_bytes() + b'\x01\x02\x03')
+    replayer = Replayer(str(path), speed=None)
+    assert replayer.hid_read(None, 256) == REPORTS[0]
+    with pytest.raises(EOFError):
+        replayer.hid_read(None, 256)
+    replayer.close()
+
+
+def test_empty_file_is_an_empty_capture(tmp_path):
+    path = tmp_path / 'empty.cap'
+    path.write_bytes(b'')
+    replayer = Replayer(str(path), speed=None)
+    assert list(replayer.records()) == []
+    with pytest.raises(EOFError):
+        replayer.hid_read(None, 256)
+    replayer.close()
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / 'other.cap'
+    for data in (b'abc', b'NOTACAPTUREFILE!' * 2):
+        path.write_bytes(data)
+        with pytest.raises(ValueError):
+            Replayer(str(path))
+
+
+def test_appending_keeps_one_header(tmp_path):
+    path = tmp_path / 'session.cap'
+    record(path, REPORTS[:2])
+    record(path, REPORTS[2:])
+    replayer = Replayer(str(path), speed=None)
+    assert [replayer.hid_read(None, 256) for report in REPORTS] == REPORTS
+    replayer.close()
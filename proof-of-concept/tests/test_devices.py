@@ -0,0 +1,113 @@
+import os
+import time
+
+import hidapi
+from maschine.devices import DeviceManager
+from maschine.virtual import VirtualLibrary, VirtualMaschine
+
+
+def plug(*machines):
+    library = VirtualLibrary(list(machines))
+    hidapi.hid_use_library(library, '<virtual>')
+    hidapi.hid_init()
+    return library
+
+
+class PipeHid(object):
+    """Stand-in for the hidapi module whose devices read from pipes, so
+    that the manager waits on file descriptors as with hidraw."""
+
+    def __init__(self):
+        self.pipes = {}
+
+    def __getattr__(self, name):
+        return getattr(hidapi, name)
+
+    def hid_open_path(self, path):
+        handle = hidapi.hid_open_path(path)
+        self.pipes[handle] = os.pipe()
+        return handle
+
+    def hid_fileno(self, device):
+        return self.pipes[device][0]
+
+    def hid_set_nonblocking(self, device, nonblock):
+        os.set_blocking(self.pipes[device][0], not nonblock)
+
+    def hid_read_into(self, device, buffer):
+        try:
+            data = os.read(self.pipes[device][0], len(buffer))
+        except BlockingIOError:
+            return 0
+        buffer[:len(data)] = data
+        return len(data)
+
+    def hid_close(self, device):
+        hidapi.hid_close(device)
+        for fd in self.pipes.pop(device):
+            os.close(fd)
+
+
+def test_reports_of_every_device_from_one_poll():
+    plug(VirtualMaschine(serial_number=u'A', button_rate=0),
+         VirtualMaschine(serial_number=u'B', pad_rate=0, button_rate=200))
+    manager = DeviceManager()
+    opened  = manager.open_all()
+    assert [(device.tag, device.serial_number) for device in opened] == [(0, u'A'), (1, u'B')]
+    assert manager.open_all() == []
+    assert manager.device(opened[1].path) is opened[1]
+    seen     = set()
+    deadline = time.time() + 2.0
+    while len(seen) < 2 and time.time() < deadline:
+        for device, timestamp, report in manager.poll(0.01):
+            seen.add((device.tag, report[0]))
+    assert seen == set([(0, 0x20), (1, 0x10)])
+    manager.close_all()
+    assert manager.devices == []
+
+
+def test_max_reports_is_kept():
+    plug(VirtualMaschine(realtime=False))
+    manager = DeviceManager()
+    manager.open_all()
+    assert len(manager.poll(0, max_reports=8)) == 8
+    manager.close_all()
+
+
+def test_unplugged_device_is_closed_with_its_error():
+    first  = VirtualMaschine(realtime=False, serial_number=u'A')
+    second = VirtualMaschine(realtime=False, serial_number=u'B')
+    library = plug(first, second)
+    manager = DeviceManager()
+    gone, kept = manager.open_all()
+    library.unplug(first)
+    reports = manager.poll(0)
+    assert manager.devices == [kept]
+    assert isinstance(gone.error, RuntimeError)
+    assert reports and all(device is kept for device, _, _ in reports)
+    manager.close_all()
+
+
+def test_poll_waits_on_file_descriptors():
+    plug(VirtualMaschine(realtime=False, serial_number=u'A'),
+         VirtualMaschine(realtime=False, serial_number=u'B'))
+    hid     = PipeHid()
+    manager = DeviceManager(hid=hid)
+    first, second = manager.open_all()
+    assert first.fd is not None and second.fd is not None
+    assert manager.poll(0.01) == []
+    os.write(hid.pipes[second.handle][1], b'\x20\x01')
+    reports = manager.poll(1.0)
+    assert [(device, bytes(report)) for device, _, report in reports] == [(second, b'\x20\x01')]
+    called = []
+    read_fd, write_fd = os.pipe()
+    try:
+        manager.add_fd(read_fd, lambda: called.append(os.read(read_fd, 16)))
+        os.write(write_fd, b'x')
+        assert manager.poll(1.0) == [] and called == [b'x']
+        manager.remove_fd(read_fd)
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+    manager.close_all()
+    assert hid.pipes == {}
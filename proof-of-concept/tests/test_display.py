@@ -0,0 +1,55 @@
+from maschine.display import (ALL_STRIPES, HEIGHT, ROW_BYTES, STRIPE_HEADER, STRIPES,
+                              FrameBuffer)
+from maschine.virtual import VirtualMaschine
+
+
+def test_new_framebuffer_is_all_dirty():
+    assert FrameBuffer(0).dirty == ALL_STRIPES
+
+
+def test_set_pixel_marks_its_stripe():
+    framebuffer = FrameBuffer(1)
+    framebuffer.dirty = 0
+    framebuffer.set_pixel(10, 17)
+    assert framebuffer.dirty == 1 << 2
+    assert framebuffer.get_pixel(10, 17)
+    assert not framebuffer.get_pixel(11, 17)
+
+
+def test_unchanged_load_keeps_stripes_clean():
+    framebuffer = FrameBuffer(0)
+    framebuffer.dirty = 0
+    framebuffer.load(bytearray(HEIGHT * ROW_BYTES))
+    assert framebuffer.dirty == 0
+
+
+def test_flush_writes_dirty_stripes_to_the_device(open_virtual):
+    machine     = VirtualMaschine(realtime=False)
+    handle      = open_virtual(machine)
+    framebuffer = FrameBuffer(1)
+    assert framebuffer.flush(handle) == STRIPES
+    assert framebuffer.dirty == 0
+
+    framebuffer.set_row(40, bytearray(b'\xff' * ROW_BYTES))
+    assert framebuffer.flush(handle) == 1
+    assert framebuffer.flush(handle) == 0
+    assert machine.rejected == 0
+    assert machine.written == STRIPES + 1
+    stripe = machine.displays[1][5]
+    assert stripe[STRIPE_HEADER:STRIPE_HEADER + ROW_BYTES] == bytearray(b'\xff' * ROW_BYTES)
+    assert framebuffer.flush(handle, force=True) == STRIPES
+
+
+def test_failed_stripes_stay_dirty(recording_hid):
+    framebuffer = FrameBuffer(0, recording_hid)
+    framebuffer.dirty = (1 << 2) | (1 << 6)
+    recording_hid.fail = 1
+    try:
+        framebuffer.flush(None)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError('RuntimeError not raised')
+    assert framebuffer.dirty == 1 << 2
+    assert framebuffer.flush(None) == 1
+    assert framebuffer.dirty == 0
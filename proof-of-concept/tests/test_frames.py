@@ -0,0 +1,67 @@
+import time
+
+import numpy
+import pytest
+
+from maschine.display import HEIGHT, ROW_BYTES, STRIPE_HEADER, WIDTH
+from maschine.frames import FrameSlot, FrameStreamer, pack_frame
+from maschine.scheduler import PRIORITY_DISPLAY, OutputScheduler
+from maschine.virtual import VirtualMaschine
+
+
+def test_threshold_packs_leftmost_pixel_first():
+    frame = numpy.zeros((HEIGHT, WIDTH), dtype=numpy.uint8)
+    frame[0, 0] = 255
+    frame[1, 9] = 200
+    packed = pack_frame(frame, 'threshold')
+    assert len(packed) == HEIGHT * ROW_BYTES
+    assert packed[0] == 0x80
+    assert packed[ROW_BYTES + 1] == 0x40
+    assert packed.sum() == 0x80 + 0x40
+
+
+def test_dither_lights_a_share_of_pixels_by_level():
+    for level, share in ((0, 0.0), (128, 0.5), (255, 1.0)):
+        frame = numpy.full((HEIGHT, WIDTH), level, dtype=numpy.uint8)
+        bits  = numpy.unpackbits(pack_frame(frame))
+        assert abs(bits.mean() - share) < 0.02
+
+
+def test_wrong_frames_are_rejected():
+    with pytest.raises(ValueError):
+        pack_frame(numpy.zeros((8, 8), dtype=numpy.uint8))
+    with pytest.raises(ValueError):
+        pack_frame(numpy.zeros((HEIGHT, WIDTH), dtype=numpy.uint8), 'blur')
+
+
+def test_slot_keeps_the_latest_frame():
+    slot = FrameSlot()
+    assert not slot.put('a', 0)
+    assert slot.put('b', 0)
+    assert slot.take(0) == ['b', None]
+    assert slot.take(0) is None
+    assert (slot.submitted, slot.dropped) == (2, 1)
+    slot.close()
+    assert slot.take() is None
+
+
+def test_streamer_writes_through_the_scheduler(open_virtual):
+    machine   = VirtualMaschine(realtime=False)
+    scheduler = OutputScheduler(open_virtual(machine))
+    scheduler.start()
+    streamer = FrameStreamer(scheduler, 'threshold')
+    streamer.start()
+    frame = numpy.zeros((HEIGHT, WIDTH), dtype=numpy.uint8)
+    frame[HEIGHT - 1, :] = 255
+    streamer.submit(frame)
+    deadline = time.time() + 1.0
+    while not streamer.written and time.time() < deadline:
+        time.sleep(0.001)
+    assert scheduler.wait(PRIORITY_DISPLAY, 1.0)
+    streamer.stop()
+    scheduler.stop()
+    assert streamer.error is None and machine.rejected == 0
+    assert (streamer.written, streamer.dropped) == (1, 0)
+    last = machine.displays[0][-1]
+    assert last[-ROW_BYTES:] == bytearray(b'\xff' * ROW_BYTES)
+    assert last[STRIPE_HEADER] == 0
@@ -0,0 +1,111 @@
+import array
+
+import pytest
+
+import hidapi
+from maschine import bench
+from maschine.virtual import PRODUCT_ID, VENDOR_ID, VirtualLibrary, VirtualMaschine
+
+
+class PassedLibrary(VirtualLibrary):
+    """Virtual library which remembers the objects passed to hid_read()
+    and hid_write()."""
+
+    def __init__(self, machines):
+        VirtualLibrary.__init__(self, machines)
+        self.passed = []
+
+    def hid_read(self, device, data, length):
+        self.passed.append(data)
+        return VirtualLibrary.hid_read(self, device, data, length)
+
+    def hid_write(self, device, data, length):
+        self.passed.append(data)
+        return VirtualLibrary.hid_write(self, device, data, length)
+
+
+def open_passed():
+    library = PassedLibrary([VirtualMaschine(realtime=False, seed=1)])
+    hidapi.hid_use_library(library, '<virtual>')
+    hidapi.hid_init()
+    return library, hidapi.hid_open(VENDOR_ID, PRODUCT_ID)
+
+
+def test_read_into_fills_the_buffer(open_virtual):
+    device = open_virtual(VirtualMaschine(realtime=False, button_rate=0,
+                                          pad_pattern='random', seed=3))
+    buf = bytearray(256)
+    num = hidapi.hid_read_into(device, buf)
+    assert buf[0] == 0x20 and num == 65
+    report = hidapi.hid_read(device, 256)
+    assert report[0] == 0x20 and report != buf[:num]
+    # Buffers shorter than the report get as much as fits.
+    small = array.array('B', bytes(8))
+    assert hidapi.hid_read_into(device, small) == 8
+    assert small[0] == 0x20
+
+
+def test_read_timeout_into_returns_zero_without_report(open_virtual):
+    device = open_virtual(VirtualMaschine(realtime=False, pad_rate=0, button_rate=0))
+    buf = bytearray(b'\xaa' * 16)
+    assert hidapi.hid_read_timeout_into(device, buf, 0) == 0
+    assert buf == bytearray(b'\xaa' * 16)
+
+
+def test_wrapped_buffer_is_passed_as_it_is():
+    library, device = open_passed()
+    buf     = bytearray(256)
+    wrapped = hidapi.hid_wrap_buffer(buf)
+    for _ in range(3):
+        num = hidapi.hid_read_into(device, wrapped)
+        assert num > 0 and buf[0] in (0x10, 0x20)
+    assert all(data is wrapped for data in library.passed)
+    hidapi.hid_close(device)
+
+
+def test_wrapped_read_is_faster_than_wrapping_every_call():
+    results = bench.run(['hid_read_into', 'hid_read_wrapped'],
+                        repeat=5, min_time=0.05)['benchmarks']
+    assert (results['hid_read_wrapped']['usec_per_item']
+            < results['hid_read_into']['usec_per_item'])
+
+
+def led_report(report_id=0x82, value=0):
+    size = {0x80: 48, 0x81: 56, 0x82: 31}[report_id]
+    return bytearray([report_id]) + bytearray([value]) * size
+
+
+def test_write_accepts_any_buffer(open_virtual):
+    machine = VirtualMaschine(realtime=False)
+    device  = open_virtual(machine)
+    report  = led_report()
+    for data in (report, bytes(report), array.array('B', report),
+                 memoryview(bytes(report)), list(report)):
+        assert hidapi.hid_write(device, data) == len(report)
+    assert machine.written == 5 and machine.rejected == 0
+    with pytest.raises(RuntimeError):
+        hidapi.hid_write(device, bytearray(b'\x82'))
+
+
+def test_write_passes_buffers_without_copying():
+    library, device = open_passed()
+    report = led_report()
+    raw    = bytes(report)
+    hidapi.hid_write(device, raw)
+    hidapi.hid_write(device, report)
+    assert library.passed[0] is raw
+    # The bytearray is shared with the library, not copied.
+    report[5] = 0x7f
+    assert library.passed[1][5] == b'\x7f'
+    hidapi.hid_close(device)
+
+
+def test_write_many_reports_each_result(open_virtual):
+    machine = VirtualMaschine(realtime=False)
+    device  = open_virtual(machine)
+    reports = [led_report(0x80, 1), bytearray(b'\x82'), led_report(0x82, 2)]
+    results = hidapi.hid_write_many(device, iter(reports))
+    assert results == [len(reports[0]), -1, len(reports[2])]
+    assert machine.leds[0x80][1] == 1 and machine.leds[0x82][1] == 2
+    assert machine.rejected == 1
+    assert hidapi.hid_write_many(device, []) == []
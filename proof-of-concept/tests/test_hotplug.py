@@ -0,0 +1,72 @@
+import pytest
+
+import hidapi
+from maschine.hotplug import DeviceWatcher
+from maschine.virtual import VirtualLibrary, VirtualMaschine
+
+
+@pytest.fixture
+def library():
+    library = VirtualLibrary([VirtualMaschine(realtime=False, serial_number=u'A')])
+    hidapi.hid_use_library(library, '<virtual>')
+    hidapi.hid_init()
+    return library
+
+
+def test_enumeration_is_cached(library):
+    watcher = DeviceWatcher(interval=0.5)
+    assert watcher.method == 'enumerate' and watcher.fileno() is None
+    assert [info.serial_number for info in watcher.devices()] == [u'A']
+    assert watcher.poll(now=0.0) == ([], [])
+    assert watcher.enumerations == 1
+    watcher.close()
+
+
+def test_callbacks_on_plug_and_unplug(library):
+    events  = []
+    watcher = DeviceWatcher(on_connect=lambda info: events.append(('+', info.serial_number)),
+                            on_disconnect=lambda info: events.append(('-', info.serial_number)),
+                            method='enumerate', interval=0.0)
+    first  = library.devices[0]
+    second = VirtualMaschine(realtime=False, serial_number=u'B')
+    library.plug(second)
+    connected, disconnected = watcher.poll()
+    assert [info.serial_number for info in connected] == [u'B'] and disconnected == []
+    library.unplug(first)
+    watcher.poll()
+    assert events == [('+', u'B'), ('-', u'A')]
+    assert watcher.find(connected[0].path) is not None
+    # Plugged in again, it has a new path and is a new device.
+    library.plug(first)
+    connected, disconnected = watcher.poll()
+    assert [info.serial_number for info in connected] == [u'A']
+    assert watcher.enumerations == 4
+
+
+def test_checks_are_paced_by_the_interval(library):
+    watcher = DeviceWatcher(method='enumerate', interval=1.0)
+    library.plug(VirtualMaschine(realtime=False, serial_number=u'B'))
+    start = watcher._checked
+    assert watcher.poll(now=start + 0.5) == ([], [])
+    assert watcher.enumerations == 1
+    assert len(watcher.poll(now=start + 1.0)[0]) == 1
+
+
+def test_forgotten_device_is_reported_again(library):
+    watcher = DeviceWatcher(method='enumerate')
+    path = watcher.devices()[0].path
+    watcher.forget(path)
+    assert watcher.find(path) is None
+    connected, disconnected = watcher.refresh()
+    assert [info.path for info in connected] == [path] and disconnected == []
+
+
+def test_stat_method_sees_no_change(library):
+    watcher = DeviceWatcher(method='stat', interval=0.0)
+    assert watcher.poll() == ([], [])
+    assert watcher.enumerations == 1
+
+
+def test_unknown_method(library):
+    with pytest.raises(ValueError):
+        DeviceWatcher(method='guess')
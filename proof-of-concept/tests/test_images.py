@@ -0,0 +1,84 @@
+import os
+import shutil
+
+import pytest
+
+import hidapi
+from maschine.display import STRIPE_REPORT, STRIPES
+from maschine.images import (encode_packets, load_hex, load_packets, load_raw,
+                             load_xbm, reverse_bits)
+from maschine.virtual import VirtualMaschine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_reverse_bits():
+    assert reverse_bits(b'\x01\x80\xf0\x00') == bytearray(b'\x80\x01\x0f\x00')
+
+
+def test_xbm_and_hex_files_agree():
+    width, height, data = load_xbm(os.path.join(ROOT, 'tux.xbm'))
+    assert (width, height) == (256, 64)
+    assert data == load_hex(os.path.join(ROOT, 'tux.hex'))
+
+
+def test_small_xbm(tmp_path):
+    path = tmp_path / 'small.xbm'
+    path.write_bytes(b'#define s_width 10\n#define s_height 2\n'
+                     b'static unsigned char s_bits[] = { 0x01, 0x02, 0x80, 0x00 };\n')
+    assert load_xbm(str(path)) == (10, 2, bytearray(b'\x80\x40\x01\x00'))
+    path.write_bytes(b'#define s_width 10\n#define s_height 2\n{ 0x01 }')
+    with pytest.raises(ValueError):
+        load_xbm(str(path))
+
+
+def test_raw_bitmaps(tmp_path):
+    path = tmp_path / 'image.bin'
+    path.write_bytes(b'\x01' * 2048)
+    assert load_raw(str(path)) == bytearray(b'\x01' * 2048)
+    assert load_raw(str(path), msb_first=False) == bytearray(b'\x80' * 2048)
+    with pytest.raises(ValueError):
+        load_raw(str(path), width=128)
+
+
+def test_packets_are_written_by_the_virtual_device(open_virtual):
+    machine = VirtualMaschine(realtime=False)
+    device  = open_virtual(machine)
+    packets = load_packets(1, os.path.join(ROOT, 'test.xbm'), cache_dir=False)
+    assert len(packets) == STRIPES and all(len(p) == STRIPE_REPORT for p in packets)
+    assert hidapi.hid_write_many(device, packets) == [STRIPE_REPORT] * STRIPES
+    assert machine.rejected == 0 and None not in machine.displays[1]
+    with pytest.raises(ValueError):
+        encode_packets(0, bytearray(100))
+
+
+def test_packets_are_cached_by_content(tmp_path):
+    source = tmp_path / 'image.hex'
+    shutil.copy(os.path.join(ROOT, 'tux.hex'), str(source))
+    cache   = tmp_path / 'cache'
+    packets = load_packets(0, str(source), cache_dir=str(cache))
+    entries = os.listdir(str(cache))
+    assert len(entries) == 1 and entries[0].endswith('-0-v1.bin')
+    assert packets == load_packets(0, str(source), cache_dir=False)
+
+    # A later load is served from the cache entry.
+    entry = cache / entries[0]
+    entry.write_bytes(b'\xee' * (STRIPES * STRIPE_REPORT))
+    assert load_packets(0, str(source), cache_dir=str(cache))[0][:2] == bytearray(b'\xee\xee')
+    # An entry of the wrong size is ignored and rewritten.
+    entry.write_bytes(b'\xee')
+    assert load_packets(0, str(source), cache_dir=str(cache)) == packets
+    assert entry.read_bytes() == bytearray().join(packets)
+    # The other display, or changed contents, have entries of their own.
+    load_packets(1, str(source), cache_dir=str(cache))
+    source.write_bytes(b'00' * 2048)
+    load_packets(0, str(source), cache_dir=str(cache))
+    assert len(os.listdir(str(cache))) == 3
+
+
+def test_unwritable_cache_is_skipped(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_bytes(b'')
+    packets = load_packets(0, os.path.join(ROOT, 'tux.xbm'),
+                           cache_dir=str(blocker / 'cache'))
+    assert len(packets) == STRIPES
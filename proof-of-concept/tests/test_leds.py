@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from maschine.leds import (BUTTON_REPORT_ID, GROUP_REPORT_ID, PAD_REPORT_ID,
+                           LedManager)
+from maschine.virtual import VirtualMaschine
+
+
+def clean(leds):
+    leds.dirty_reports()
+    return leds
+
+
+def test_only_changed_reports_are_dirty():
+    leds = LedManager()
+    assert [report[0] for report in leds.dirty_reports()] == [
+        PAD_REPORT_ID, GROUP_REPORT_ID, BUTTON_REPORT_ID]
+    assert leds.dirty_reports() == []
+    leds.set_led('play', 0)             # unchanged: not dirty
+    assert leds.dirty_reports() == []
+    leds.set_pad_rgb(15, 1, 2, 3)
+    leds.set_pad_rgb(0, 4, 5, 6)
+    reports = leds.dirty_reports()
+    assert len(reports) == 1
+    assert reports[0][:4] == bytearray([PAD_REPORT_ID, 4, 5, 6])
+    assert reports[0][-3:] == bytearray([1, 2, 3])
+
+
+def test_led_names_and_indices():
+    leds = clean(LedManager())
+    leds.set_led('display1', 0x11)
+    leds.set_led(30, 0x22)
+    leds.set_led('shift', 0x33)
+    group, button = leds.dirty_reports()
+    assert button[1] == 0x11 and button[31] == 0x22
+    assert group[-1] == 0x33
+    with pytest.raises(KeyError):
+        leds.set_led('nothing', 1)
+    with pytest.raises(IndexError):
+        leds.set_led(31, 1)
+    with pytest.raises(IndexError):
+        leds.set_pad_rgb(16, 1, 2, 3)
+
+
+def test_group_halves():
+    leds = clean(LedManager())
+    leds.set_group_rgb(2, 1, 2, 3, half=0)
+    leds.set_group_rgb(2, 4, 5, 6, half=1)
+    leds.set_group_rgb(7, 7, 8, 9)
+    report = leds.dirty_reports()[0]
+    assert report[1 + 2 * 3:1 + 3 * 3] == bytearray([1, 2, 3])
+    assert report[1 + 10 * 3:1 + 11 * 3] == bytearray([4, 5, 6])
+    assert report[1 + 7 * 3:1 + 8 * 3] == bytearray([7, 8, 9])
+    assert report[1 + 15 * 3:1 + 16 * 3] == bytearray([7, 8, 9])
+
+
+@pytest.mark.parametrize('half', [-1, 2, 8])
+def test_bad_group_half_is_rejected(half):
+    leds = clean(LedManager())
+    with pytest.raises(IndexError):
+        leds.set_group_rgb(0, 1, 2, 3, half)
+    assert leds.dirty_reports() == []
+
+
+def test_flush_to_the_virtual_device(open_virtual):
+    machine = VirtualMaschine(realtime=False)
+    device  = open_virtual(machine)
+    leds    = LedManager()
+    leds.set_led('rec', 0x7f)
+    assert leds.flush(device) == 3
+    assert machine.rejected == 0
+    assert machine.leds[GROUP_REPORT_ID][-3] == 0x7f
+    assert leds.flush(device) == 0
+    assert leds.flush(device, force=True) == 3
+    assert leds.flushes == 6
+
+
+def test_failed_flush_keeps_reports_dirty(recording_hid):
+    leds = clean(LedManager(hid=recording_hid))
+    leds.set_led('play', 1)
+    leds.set_pad_rgb(0, 1, 1, 1)
+    recording_hid.fail = 1
+    with pytest.raises(RuntimeError):
+        leds.flush(None)
+    assert [report[0] for report in leds.dirty_reports()] == [PAD_REPORT_ID]
+
+
+def test_poll_keeps_to_the_rate(recording_hid):
+    leds = LedManager(rate=10.0, hid=recording_hid)
+    assert leds.poll(None) == 3
+    leds.set_led('play', 1)
+    assert leds.poll(None) == 0
+    time.sleep(0.11)
+    assert leds.poll(None) == 1
+
+
+def test_background_flusher(recording_hid):
+    leds = LedManager(rate=200.0, hid=recording_hid)
+    leds.start(None)
+    with pytest.raises(RuntimeError):
+        leds.start(None)
+    deadline = time.time() + 1.0
+    while len(recording_hid.written) < 3 and time.time() < deadline:
+        time.sleep(0.001)
+    leds.stop()
+    assert len(recording_hid.written) == 3
+    assert leds.error is None
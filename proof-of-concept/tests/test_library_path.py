@@ -0,0 +1,72 @@
+import ctypes.util
+import sys
+
+import pytest
+
+import hidapi.hidapi
+
+# The library is opened by a function private to the module: the tests
+# load libc in place of hidapi, which cannot be initialized as hidapi.
+open_hidapi = getattr(sys.modules['hidapi.hidapi'], '__open_hidapi')
+
+LIBC = ctypes.util.find_library('c')
+LIBM = ctypes.util.find_library('m')
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.delenv('HIDAPI_LIBRARY', raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    return tmp_path / 'pyhidapi' / 'library-path'
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    names = []
+
+    def find_library(name):
+        names.append(name)
+        return LIBC
+
+    monkeypatch.setattr(ctypes.util, 'find_library', find_library)
+    return names
+
+
+def test_search_result_is_cached(cache, searches):
+    assert open_hidapi()[1] == LIBC
+    assert searches == ['hidapi-hidraw']
+    assert cache.read_text() == LIBC + '\n'
+    assert open_hidapi()[1] == LIBC
+    assert len(searches) == 1
+
+
+def test_stale_cache_is_searched_again(cache, searches):
+    cache.parent.mkdir(parents=True)
+    cache.write_text('/nonexistent/libhidapi-hidraw.so.0\n')
+    assert open_hidapi()[1] == LIBC
+    assert len(searches) == 1 and cache.read_text() == LIBC + '\n'
+
+
+def test_pinned_paths_skip_the_cache(cache, searches, monkeypatch):
+    assert open_hidapi(LIBM)[1] == LIBM
+    monkeypatch.setenv('HIDAPI_LIBRARY', LIBM)
+    assert open_hidapi()[1] == LIBM
+    assert searches == [] and not cache.exists()
+
+
+def test_library_not_found(cache, monkeypatch):
+    monkeypatch.setattr(ctypes.util, 'find_library', lambda name: None)
+    with pytest.raises(RuntimeError):
+        open_hidapi()
+    assert not cache.exists()
+
+
+def test_read_only_cache_only_costs_speed(tmp_path, searches, monkeypatch):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    monkeypatch.delenv('HIDAPI_LIBRARY', raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(blocker))
+    assert open_hidapi()[1] == LIBC
+    assert open_hidapi()[1] == LIBC
+    assert len(searches) == 2
+
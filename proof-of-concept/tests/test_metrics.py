@@ -0,0 +1,89 @@
+import io
+import json
+import os
+import signal
+
+import pytest
+
+import hidapi
+from maschine.leds import LedManager
+from maschine.metrics import Histogram, Metrics
+from maschine.virtual import VirtualMaschine
+
+
+def test_histogram_buckets_and_percentiles():
+    histogram = Histogram()
+    assert histogram.percentile(0.5) is None
+    for seconds in [0.0000005] + [0.000003] * 8 + [0.001]:
+        histogram.add(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 10
+    assert snapshot['min'] == 0.0000005 and snapshot['max'] == 0.001
+    assert snapshot['buckets'] == [[1, 1], [4, 8], [1024, 1]]
+    assert snapshot['p50'] == 0.000004
+    assert snapshot['p99'] == 0.001
+    histogram.reset()
+    assert histogram.count == 0 and histogram.snapshot()['buckets'] == []
+
+
+def test_huge_latencies_go_in_the_last_bucket():
+    histogram = Histogram()
+    histogram.add(1e9)
+    assert histogram.counts[-1] == 1
+
+
+def test_reads_decodes_and_latencies():
+    metrics = Metrics()
+    metrics.read(0, now=1.0)
+    metrics.read(65, now=1.0)
+    metrics.read(65, now=1.002)
+    metrics.decoded(1.002, now=1.0025)
+    metrics.latency('midi', 0.001)
+    snapshot = metrics.snapshot()
+    assert snapshot['reports'] == 2 and snapshot['bytes'] == 130
+    assert snapshot['histograms']['interval']['count'] == 1
+    assert snapshot['histograms']['decode']['count'] == 1
+    assert snapshot['histograms']['midi']['count'] == 1
+    assert snapshot['last_decode'] == 1.0025
+    metrics.reset()
+    assert metrics.snapshot()['reports'] == 0
+    assert metrics.histograms['midi'].count == 0
+
+
+def test_instrumented_hid_measures_the_virtual_device(open_virtual):
+    device  = open_virtual(VirtualMaschine(realtime=False, seed=1))
+    metrics = Metrics()
+    hid     = metrics.instrument()
+    buf     = bytearray(256)
+    for _ in range(5):
+        hid.hid_read_into(device, buf)
+    assert hid.hid_read(device, 256)
+    reports = LedManager().dirty_reports()
+    hid.hid_write(device, reports[0])
+    assert hid.hid_write_many(device, reports[1:] + [bytearray(b'\x82')])[-1] == -1
+    with pytest.raises(RuntimeError):
+        hid.hid_write(device, bytearray(b'\x00'))
+    snapshot = metrics.snapshot()
+    assert snapshot['reports'] == 6
+    assert snapshot['writes'] == 3 and snapshot['write_failures'] == 2
+    assert snapshot['bytes_written'] == sum(len(report) for report in reports)
+    assert snapshot['histograms']['write']['count'] == 5
+    assert snapshot['histograms']['interval']['count'] == 5
+    # Everything else is passed through to the hidapi module.
+    assert hid.hid_lib_path() == hidapi.hid_lib_path()
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR1'), reason='needs SIGUSR1')
+def test_dump_on_signal_while_writing():
+    metrics = Metrics()
+    stream  = io.StringIO()
+    previous = metrics.dump_on_signal(stream=stream)
+    try:
+        # The handler runs on the main thread, which here holds the lock
+        # as it would in the middle of written().
+        with metrics._lock:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            metrics.written(10, 0.0, now=0.001)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+    assert json.loads(stream.getvalue())['reports'] == 0
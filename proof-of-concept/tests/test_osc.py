@@ -0,0 +1,134 @@
+import select
+import socket
+
+import pytest
+
+from maschine.buttons import BUTTON_DOWN, ENCODER, ButtonEvent
+from maschine.devices import DeviceManager
+from maschine.display import ROW_BYTES, FrameBuffer
+from maschine.leds import LedManager
+from maschine.osc import (OscReceiver, OscSender, decode_packet, encode_bundle,
+                          encode_message)
+from maschine.pads import PAD_PRESS, PadEvent
+
+
+def test_message_round_trip():
+    args = [7, -3, 0.5, u'play', bytearray(b'\x01\x02\x03'), True, False, None]
+    assert decode_packet(encode_message('/maschine/test', args)) == [('/maschine/test', args)]
+
+
+def test_message_is_padded():
+    message = encode_message('/a', [u'xyz', bytearray(b'\xff')])
+    assert len(message) % 4 == 0
+
+
+def test_bundle_round_trip():
+    inner  = encode_bundle([encode_message('/b', [2])])
+    bundle = encode_bundle([encode_message('/a', [1]), inner, encode_message('/c', [3])])
+    assert decode_packet(bundle) == [('/a', [1]), ('/b', [2]), ('/c', [3])]
+
+
+@pytest.mark.parametrize('data', [b'', b'nope', b'/a\0\0', b'/a\0\0,i\0\0\0',
+                                  b'#bundle\0' + b'\0' * 8 + b'\0\0\0\x10/a\0\0'])
+def test_malformed_packets_raise(data):
+    with pytest.raises(ValueError):
+        decode_packet(data)
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(1.0)
+    yield sock
+    sock.close()
+
+
+def test_sender_coalesces_events_over_loopback(listener):
+    sender = OscSender(listener.getsockname(), window=0.002)
+    events = [PadEvent(PAD_PRESS, 3, 812, 0.0),
+              ButtonEvent(BUTTON_DOWN, 'play', 1, 0.0),
+              ButtonEvent(ENCODER, 'knob3', -2, 0.0)]
+    assert sender.send(events, now=0.0) == 0
+    assert sender.timeout(0.0) == 0.002
+    assert sender.poll(0.001) == 0
+    assert sender.poll(0.002) == 1
+    sender.close()
+    assert decode_packet(listener.recv(65536)) == [
+        ('/maschine/pad', [3, u'press', 812]),
+        ('/maschine/button', [u'play', 1]),
+        ('/maschine/encoder', [u'knob3', -2])]
+    assert (sender.datagrams, sender.messages) == (1, 3)
+
+
+def test_receiver_applies_commands_over_loopback():
+    leds     = LedManager()
+    displays = [FrameBuffer(0), FrameBuffer(1)]
+    leds.dirty_reports()
+    receiver = OscReceiver(('127.0.0.1', 0), leds, displays)
+    sock     = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        displays[1].dirty = 0
+        sock.sendto(encode_bundle([encode_message('/maschine/led', [u'play', 127]),
+                                   encode_message('/maschine/row',
+                                                  [1, 9, bytearray(b'\xff' * ROW_BYTES)])]),
+                    receiver.address())
+        sock.sendto(encode_message('/maschine/nothing', [1]), receiver.address())
+        sock.sendto(b'garbage', receiver.address())
+
+        # The socket becomes readable, so a poll loop waiting on
+        # fileno() wakes up for the commands.
+        applied = 0
+        while receiver.errors < 2:
+            assert select.select([receiver.fileno()], [], [], 1.0)[0]
+            applied += receiver.poll()
+        assert applied == 2 and receiver.received == 2
+        assert receiver.errors == 2
+        assert displays[1].dirty == 1 << 1
+        assert displays[1].get_pixel(0, 9)
+        assert len(leds.dirty_reports()) == 1
+    finally:
+        sock.close()
+        receiver.close()
+
+
+@pytest.mark.parametrize('half', [-1, 2, 100])
+def test_receiver_drops_a_bad_group_half(half):
+    leds     = LedManager()
+    leds.dirty_reports()
+    receiver = OscReceiver(('127.0.0.1', 0), leds)
+    sock     = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(encode_bundle([encode_message('/maschine/group_rgb', [0, 1, 2, 3, half]),
+                                   encode_message('/maschine/group_rgb', [1, 4, 5, 6, 1])]),
+                    receiver.address())
+        assert select.select([receiver.fileno()], [], [], 1.0)[0]
+        assert receiver.poll() == 1
+        assert receiver.errors == 1
+        report = leds.dirty_reports()[0]
+        # Only the second command's LED changed.
+        assert [n for n, value in enumerate(report[1:]) if value] == [27, 28, 29]
+    finally:
+        sock.close()
+        receiver.close()
+
+
+def test_receiver_wakes_a_device_manager():
+    leds     = LedManager()
+    receiver = OscReceiver(('127.0.0.1', 0), leds)
+    manager  = DeviceManager()
+    sock     = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        applied = []
+        manager.add_fd(receiver.fileno(), lambda: applied.append(receiver.poll()))
+        sock.sendto(encode_message('/maschine/pad_rgb', [2, 10, 20, 30]), receiver.address())
+        for attempt in range(10):
+            manager.poll(1.0)
+            if applied:
+                break
+        assert applied == [1]
+        manager.remove_fd(receiver.fileno())
+    finally:
+        sock.close()
+        receiver.close()
+        manager.close_all()
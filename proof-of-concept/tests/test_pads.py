@@ -0,0 +1,98 @@
+import numpy
+
+import hidapi
+from maschine.midi import PadMidi
+from maschine.pads import (PAD_COUNT, PAD_PRESS, PAD_PRESSURE, PAD_RELEASE,
+                           PAD_REPORT_ID, PAD_REPORT_SIZE, PAD_STRIKE,
+                           OnsetDetector, PadChangeDetector, decode_pads)
+from maschine.virtual import VirtualMaschine
+
+
+def pads_counting(n, pressures, rng):
+    for pad in range(PAD_COUNT):
+        pressures[pad] = (pad * 256 + n) % 4096
+
+
+def test_decode_virtual_reports(open_virtual):
+    handle  = open_virtual(VirtualMaschine(pad_pattern=pads_counting, realtime=False))
+    reports = [hidapi.hid_read(handle, 256) for n in range(4)]
+    assert all(report[0] == PAD_REPORT_ID for report in reports)
+    assert all(len(report) == PAD_REPORT_SIZE for report in reports)
+
+    pressures = decode_pads(reports)
+    assert pressures.shape == (4, PAD_COUNT)
+    first = int(pressures[0, 0])
+    for n in range(4):
+        expected = [(pad * 256 + first + n) % 4096 for pad in range(PAD_COUNT)]
+        assert pressures[n].tolist() == expected
+
+
+def test_decode_into_preallocated_array(open_virtual):
+    handle = open_virtual(VirtualMaschine(pad_pattern='random', realtime=False, seed=3))
+    report = hidapi.hid_read(handle, 256)
+    out    = numpy.zeros((1, PAD_COUNT), dtype=numpy.uint16)
+    assert decode_pads(report, out) is out
+    assert (out == decode_pads(report)).all()
+
+
+def test_decode_rejects_other_reports():
+    report = bytearray(PAD_REPORT_SIZE)
+    report[0] = 0x10
+    try:
+        decode_pads(report)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('ValueError not raised')
+
+
+def pressures_of(pad, value):
+    pressures = [0] * PAD_COUNT
+    pressures[pad] = value
+    return pressures
+
+
+def test_change_detector_press_pressure_release():
+    detector = PadChangeDetector()
+    kinds = []
+    for value in (0, 300, 310, 500, 200, 100, 0):
+        kinds.append([(event.kind, event.value)
+                      for event in detector.update(pressures_of(5, value))])
+    assert kinds == [[], [(PAD_PRESS, 300)], [], [(PAD_PRESSURE, 500)], [(PAD_PRESSURE, 200)],
+                     [(PAD_RELEASE, 100)], []]
+
+
+def strike_events(detector, values, pad=3):
+    events = []
+    for value in values:
+        events.extend(detector.update(pressures_of(pad, value)))
+    return [(event.kind, event.pad) for event in events], events
+
+
+def test_onset_strike_and_release():
+    kinds, events = strike_events(OnsetDetector(), (0, 900, 2000, 1500, 300, 20, 0))
+    assert kinds == [(PAD_STRIKE, 3), (PAD_RELEASE, 3)]
+    assert events[0].value == 4095
+
+
+def test_onset_velocity_follows_the_slope():
+    soft = strike_events(OnsetDetector(), (0, 100, 180, 150, 10))[1][0].value
+    hard = strike_events(OnsetDetector(), (0, 600, 1200, 1000, 10))[1][0].value
+    assert 0 < soft < hard
+
+
+def test_onset_soft_hit_note_is_released():
+    # Peaks below the press threshold of PadChangeDetector: the note-off
+    # has to come from the onset detector itself.
+    midi = PadMidi()
+    kinds, events = strike_events(OnsetDetector(), (0, 100, 180, 150, 100, 40, 10, 0))
+    assert kinds == [(PAD_STRIKE, 3), (PAD_RELEASE, 3)]
+    midi.translate(events[:1])
+    assert midi.sounding == [39]
+    midi.translate(events[1:])
+    assert midi.sounding == []
+
+
+def test_onset_slow_press_does_not_strike():
+    kinds, events = strike_events(OnsetDetector(), range(0, 1000, 20))
+    assert kinds == []
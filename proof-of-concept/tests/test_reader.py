@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+import hidapi
+from maschine.reader import ReportReader, ReportRing
+from maschine.virtual import PRODUCT_ID, VENDOR_ID, VirtualLibrary, VirtualMaschine
+
+
+def test_ring_returns_reports_oldest_first():
+    ring = ReportRing(capacity=4, report_size=8)
+    for n in range(3):
+        ring.push(bytearray([n]) * 3, timestamp=float(n))
+    assert len(ring) == 3
+    assert ring.drain(2) == [(0.0, bytearray([0, 0, 0])), (1.0, bytearray([1, 1, 1]))]
+    assert ring.drain() == [(2.0, bytearray([2, 2, 2]))]
+    assert ring.drain() == []
+
+
+def test_ring_overflow_overwrites_the_oldest():
+    ring = ReportRing(capacity=4, report_size=8)
+    for n in range(10):
+        ring.push(bytearray([n]), timestamp=float(n))
+    assert [report[0] for _, report in ring.drain()] == [6, 7, 8, 9]
+    assert ring.stats() == {'capacity': 4, 'pending': 0, 'received': 10,
+                            'overflows': 6, 'high_water': 4}
+
+
+def test_ring_truncates_long_reports():
+    ring = ReportRing(capacity=2, report_size=4)
+    ring.push(bytearray(range(10)), length=6)
+    assert ring.drain()[0][1] == bytearray([0, 1, 2, 3])
+
+
+def test_ring_sizes_must_be_positive():
+    with pytest.raises(ValueError):
+        ReportRing(capacity=0)
+
+
+def test_drain_waits_for_a_report():
+    ring = ReportRing(capacity=2)
+    timer = threading.Timer(0.05, lambda: ring.push(b'\x20'))
+    timer.start()
+    try:
+        assert ring.drain(timeout=0) == []
+        assert [report for _, report in ring.drain(timeout=1.0)] == [bytearray(b'\x20')]
+    finally:
+        timer.join()
+
+
+def test_reader_fills_the_ring_from_the_virtual_device(open_virtual):
+    device = open_virtual(VirtualMaschine(pad_rate=1000, button_rate=0))
+    reader = ReportReader(device, ReportRing(capacity=16), timeout_ms=10)
+    reader.start()
+    with pytest.raises(RuntimeError):
+        reader.start()
+    reports = []
+    deadline = time.time() + 2.0
+    while len(reports) < 20 and time.time() < deadline:
+        reports += reader.ring.drain(timeout=0.1)
+    reader.stop()
+    assert not reader.is_alive() and reader.error is None
+    assert len(reports) >= 20
+    assert all(report[0] == 0x20 and len(report) == 65 for _, report in reports)
+    timestamps = [timestamp for timestamp, _ in reports]
+    assert timestamps == sorted(timestamps)
+
+
+def test_reader_overflows_a_small_ring(open_virtual):
+    device = open_virtual(VirtualMaschine(realtime=False))
+    reader = ReportReader(device, ReportRing(capacity=4), timeout_ms=10)
+    reader.start()
+    deadline = time.time() + 2.0
+    while reader.ring.overflows == 0 and time.time() < deadline:
+        time.sleep(0.001)
+    reader.stop()
+    assert reader.ring.overflows > 0
+    assert len(reader.ring.drain()) == 4
+
+
+def test_reader_stops_when_the_device_goes():
+    machine = VirtualMaschine(realtime=False)
+    library = VirtualLibrary([machine])
+    hidapi.hid_use_library(library, '<virtual>')
+    hidapi.hid_init()
+    device = hidapi.hid_open(VENDOR_ID, PRODUCT_ID)
+    reader = ReportReader(device, timeout_ms=10)
+    reader.start()
+    library.unplug(machine)
+    reader._thread.join(1.0)
+    assert isinstance(reader.error, RuntimeError)
+    assert not reader.is_alive()
+    reader.stop()
+    hidapi.hid_close(device)
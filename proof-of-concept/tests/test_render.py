@@ -0,0 +1,97 @@
+import pytest
+
+from maschine import render
+from maschine.display import FrameBuffer, ROW_BYTES
+from maschine.virtual import VirtualMaschine
+
+
+def blank():
+    framebuffer = FrameBuffer(0)
+    framebuffer.dirty = 0
+    return framebuffer
+
+
+def rows(framebuffer, column, y, columns, height):
+    return [bytes(framebuffer.get_row(y + row, column, columns)) for row in range(height)]
+
+
+def test_text_draws_the_glyphs():
+    framebuffer = blank()
+    assert render.text(framebuffer, 2, 3, u'H-') == 2
+    assert rows(framebuffer, 2, 3, 2, 8) == [
+        b'\x44\x00', b'\x44\x00', b'\x44\x00', b'\x7c\x7c',
+        b'\x44\x00', b'\x44\x00', b'\x44\x00', b'\x00\x00']
+    # Rows 3 to 10 span the first two stripes.
+    assert framebuffer.dirty == 0b11
+
+
+def test_text_is_cut_at_the_edges():
+    framebuffer = blank()
+    assert render.text(framebuffer, ROW_BYTES - 2, 60, 'abcdef') == 2
+    assert framebuffer.dirty == 1 << 7
+    render.text(framebuffer, 0, -6, 'H')
+    assert rows(framebuffer, 0, 0, 1, 3) == [b'\x44', b'\x00', b'\x00']
+    with pytest.raises(IndexError):
+        render.text(framebuffer, ROW_BYTES, 0, 'x')
+
+
+def test_unknown_characters_and_inverted_text():
+    framebuffer = blank()
+    render.text(framebuffer, 0, 0, u'\xe9?')
+    left, right = zip(*[(row[0:1], row[1:2]) for row in rows(framebuffer, 0, 0, 2, 8)])
+    assert left == right
+    render.text(framebuffer, 4, 0, ' ', invert=True)
+    assert rows(framebuffer, 4, 0, 1, 8) == [b'\xff'] * 8
+
+
+def test_clear_and_invert_rectangles():
+    framebuffer = blank()
+    render.clear(framebuffer, 1, 10, 3, 4, on=True)
+    assert rows(framebuffer, 0, 9, 5, 6) == [b'\x00' * 5] + [b'\x00\xff\xff\xff\x00'] * 4 + [b'\x00' * 5]
+    render.invert(framebuffer, 2, 8, 3, 8)
+    assert rows(framebuffer, 2, 10, 3, 1) == [b'\x00\x00\xff']
+    render.invert(framebuffer, 2, 8, 3, 8)
+    render.clear(framebuffer, 1, 10, 3, 4)
+    assert framebuffer.get_row(10) == bytearray(ROW_BYTES)
+
+
+def test_bar_is_filled_in_proportion():
+    framebuffer = blank()
+    render.bar(framebuffer, 0, 0, 2, 0)
+    render.bar(framebuffer, 4, 0, 2, 6, maximum=12)
+    render.bar(framebuffer, 8, 0, 2, 99, maximum=12)
+    empty, half, full = (rows(framebuffer, column, 0, 2, 8) for column in (0, 4, 8))
+    for drawn in (empty, half, full):
+        assert drawn[0] == drawn[7] == b'\xff\xff'
+        assert drawn[1] == drawn[6] == b'\x80\x01'
+    assert empty[3] == b'\x80\x01'
+    assert half[3] == b'\xbf\x01'
+    assert full[3] == b'\xbf\xfd'
+
+
+def test_knob_pointer_turns():
+    framebuffer = blank()
+    render.knob(framebuffer, 0, 0, 0)
+    render.knob(framebuffer, 2, 0, 0.5)
+    render.knob(framebuffer, 4, 0, 2.0)
+    low, mid, high = (rows(framebuffer, column, 0, 2, 16) for column in (0, 2, 4))
+    assert low != mid != high
+    # Turned fully one way or the other, the pointers mirror each other.
+    mirror = lambda row: int('{0:016b}'.format(int.from_bytes(row, 'big'))[::-1], 2).to_bytes(2, 'big')
+    assert [mirror(row) for row in low] == high
+    # Halfway, the pointer stands straight up, on the middle columns.
+    assert mid[3][0] & 0x01 or mid[3][1] & 0x80
+    assert not mid[12][0] & 0x01 and not mid[12][1] & 0x80
+
+
+def test_page_is_accepted_by_the_virtual_device(open_virtual):
+    machine     = VirtualMaschine(realtime=False)
+    device      = open_virtual(machine)
+    framebuffer = FrameBuffer(1)
+    for n in range(8):
+        render.text(framebuffer, n * 4, 0, ' K%d ' % (n + 1), invert=n == 2)
+        render.knob(framebuffer, n * 4 + 1, 12, n, 7)
+        render.bar(framebuffer, n * 4, 44, 4, n, 7)
+    assert framebuffer.flush(device) == 8
+    assert machine.rejected == 0
+    assert machine.displays[1][0][9:] == framebuffer.stripe_data(0)
@@ -0,0 +1,157 @@
+import threading
+
+import pytest
+
+from maschine.display import STRIPE_HEADER, STRIPES, FrameBuffer
+from maschine.leds import LedManager
+from maschine.scheduler import PRIORITY_DISPLAY, PRIORITY_LED, OutputScheduler
+from maschine.virtual import VirtualMaschine
+
+
+def test_leds_go_ahead_of_display_stripes(recording_hid):
+    scheduler = OutputScheduler(None, hid=recording_hid)
+    assert scheduler.submit_display(FrameBuffer(0)) == STRIPES
+    scheduler.submit(bytearray(b'\x82led'), PRIORITY_LED)
+    assert scheduler.pending() == [1, STRIPES]
+    assert scheduler.pump(1) == 1
+    assert recording_hid.written == [b'\x82led']
+    assert scheduler.pump() == STRIPES
+    assert scheduler.pending() == [0, 0]
+
+
+def test_same_key_is_replaced_in_place(recording_hid):
+    scheduler = OutputScheduler(None, hid=recording_hid)
+    scheduler.submit(bytearray(b'\x82old'), key='leds')
+    scheduler.submit(bytearray(b'\x80pad'), key='pads')
+    scheduler.submit(bytearray(b'\x82new'), key='leds')
+    scheduler.pump()
+    assert recording_hid.written == [b'\x82new', b'\x80pad']
+    assert scheduler.stats()[PRIORITY_LED]['replaced'] == 1
+
+
+def test_redrawn_stripe_is_sent_once(recording_hid):
+    scheduler   = OutputScheduler(None, hid=recording_hid)
+    framebuffer = FrameBuffer(0)
+    framebuffer.dirty = 0
+    framebuffer.set_pixel(0, 0)
+    scheduler.submit_display(framebuffer)
+    framebuffer.set_pixel(1, 0)
+    scheduler.submit_display(framebuffer)
+    scheduler.pump()
+    assert len(recording_hid.written) == 1
+    assert bytearray(recording_hid.written[0])[STRIPE_HEADER] == 0xc0
+
+
+def test_queued_stripes_are_snapshots(recording_hid):
+    scheduler   = OutputScheduler(None, hid=recording_hid)
+    framebuffer = FrameBuffer(0)
+    scheduler.submit_display(framebuffer)
+    assert framebuffer.dirty == 0
+    # Drawing after submitting changes neither what is sent, nor is it
+    # lost: the stripe is dirty again for the next submit.
+    framebuffer.set_pixel(0, 0)
+    scheduler.pump()
+    assert bytearray(recording_hid.written[0])[STRIPE_HEADER] == 0
+    assert framebuffer.dirty == 1
+    assert scheduler.submit_display(framebuffer) == 1
+    scheduler.pump()
+    assert bytearray(recording_hid.written[-1])[STRIPE_HEADER] == 0x80
+
+
+def test_failed_stripe_is_sent_again(recording_hid):
+    scheduler   = OutputScheduler(None, hid=recording_hid)
+    framebuffer = FrameBuffer(0)
+    framebuffer.dirty = 1 << 3
+    scheduler.submit_display(framebuffer)
+    recording_hid.fail = 1
+    scheduler.pump()
+    assert recording_hid.written == []
+    assert scheduler.stats()[PRIORITY_DISPLAY]['failed'] == 1
+    assert framebuffer.dirty == 0
+    assert scheduler.submit_display(framebuffer) == 1
+    scheduler.pump()
+    assert [bytearray(report)[3] for report in recording_hid.written] == [24]
+
+
+def test_failed_led_report_is_marked_dirty_again(recording_hid):
+    scheduler = OutputScheduler(None, hid=recording_hid)
+    leds = LedManager(hid=recording_hid)
+    leds.dirty_reports()
+    leds.set_led('play', 0x7f)
+    assert scheduler.submit_leds(leds) == 1
+    recording_hid.fail = 1
+    scheduler.pump()
+    assert recording_hid.written == []
+    assert scheduler.stats()[PRIORITY_LED]['failed'] == 1
+    # Nothing changed since, but the report is sent again.
+    assert scheduler.submit_leds(leds) == 1
+    scheduler.pump()
+    assert [report[0:1] for report in recording_hid.written] == [b'\x81']
+    assert scheduler.submit_leds(leds) == 0
+
+
+def test_writer_survives_unexpected_errors(recording_hid):
+    recording_hid.error = ValueError
+    recording_hid.fail  = 1
+    scheduler = OutputScheduler(None, hid=recording_hid)
+    scheduler.start()
+    scheduler.submit(bytearray(b'\x82one'))
+    scheduler.submit(bytearray(b'\x82two'), key='two')
+    scheduler.stop()
+    assert scheduler.alive
+    assert isinstance(scheduler.error, ValueError)
+    assert recording_hid.written == [b'\x82two']
+
+
+def test_dead_writer_is_reported(recording_hid):
+    scheduler = OutputScheduler(None, hid=recording_hid)
+    died = threading.Event()
+
+    def broken():
+        died.set()
+        raise KeyError('broken')
+
+    scheduler._next = broken
+    hook = getattr(threading, 'excepthook', None)
+    if hook is not None:
+        threading.excepthook = lambda args: None
+    try:
+        scheduler.start()
+        died.wait(1.0)
+        scheduler._thread.join(1.0)
+    finally:
+        if hook is not None:
+            threading.excepthook = hook
+    assert not scheduler.alive
+    with pytest.raises(RuntimeError):
+        scheduler.submit(bytearray(b'\x82'))
+
+
+def test_wait_for_a_priority_class(recording_hid):
+    scheduler = OutputScheduler(None, hid=recording_hid)
+    assert scheduler.wait(PRIORITY_DISPLAY, 0)
+    scheduler.submit_display(FrameBuffer(1))
+    assert not scheduler.wait(PRIORITY_DISPLAY, 0.01)
+    assert scheduler.wait(PRIORITY_LED, 0)
+    scheduler.start()
+    assert scheduler.wait(PRIORITY_DISPLAY, 1.0)
+    scheduler.stop()
+
+
+def test_virtual_device_gets_every_report(open_virtual):
+    machine   = VirtualMaschine(realtime=False)
+    scheduler = OutputScheduler(open_virtual(machine))
+    scheduler.start()
+    leds = LedManager()
+    leds.set_led('play', 0x7f)
+    leds.set_pad_rgb(3, 0x10, 0x20, 0x30)
+    sent = scheduler.submit_leds(leds)
+    framebuffers = [FrameBuffer(0), FrameBuffer(1)]
+    for framebuffer in framebuffers:
+        sent += scheduler.submit_display(framebuffer)
+    scheduler.stop()
+    assert scheduler.alive and scheduler.error is None
+    assert machine.rejected == 0
+    assert machine.written == sent
+    assert all(report is not None for report in machine.leds.values())
+    assert all(stripe is not None for display in machine.displays for stripe in display)